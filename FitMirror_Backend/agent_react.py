@@ -4,10 +4,13 @@ FitMirror Agent - LangChain Core ReAct Implementation with Qwen
 
 import os
 import sys
+import numpy as np
 from typing import List, Dict, Any, Optional, Sequence, Union
 from dotenv import load_dotenv
 from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain.tools import Tool
+from langchain.globals import set_llm_cache
+from langchain_community.cache import SQLiteCache
 from langchain_community.chat_models import ChatTongyi
 from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, BaseMessage
 
@@ -18,9 +21,133 @@ from langchain.agents import create_openai_tools_agent, AgentExecutor
 from tools import analyze_exercise_video_tool, get_last_exercise_result_tool
 from rag_setup import query_fitness_knowledge_tool
 
+try:
+    from config import LLM_MAX_RETRIES
+except ImportError:
+    LLM_MAX_RETRIES = 4
+
 # Load environment variables
 load_dotenv()
 
+# 确定性 LLM 缓存的存储路径 (同一问题的完全相同调用直接命中 SQLite)
+LLM_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "llm_cache.sqlite")
+
+
+class SemanticQueryCache:
+    """基于嵌入相似度的语义查询缓存
+
+    健身问答的问题高度重复（如“深蹲的力学原理”），对语义相近的查询直接返回
+    历史回复，省掉整个 Agent 调用（含 DashScope 往返）。
+    """
+
+    def __init__(self, threshold: float = 0.92):
+        self.threshold = threshold
+        self._embeddings = None  # 延迟初始化，避免无 API Key 时报错
+        self._vectors: List[np.ndarray] = []
+        self._responses: List[str] = []
+
+    def _embed(self, text: str) -> Optional[np.ndarray]:
+        """将文本嵌入为归一化向量，失败时返回 None"""
+        try:
+            if self._embeddings is None:
+                from langchain_community.embeddings import DashScopeEmbeddings
+                api_key = os.environ.get("DASHSCOPE_API_KEY")
+                if not api_key:
+                    return None
+                self._embeddings = DashScopeEmbeddings(
+                    model="text-embedding-v2",
+                    dashscope_api_key=api_key
+                )
+            vector = np.array(self._embeddings.embed_query(text), dtype=np.float32)
+            norm = np.linalg.norm(vector)
+            return vector / norm if norm > 0 else None
+        except Exception as e:
+            print(f"语义缓存嵌入失败: {e}")
+            return None
+
+    def lookup(self, query: str) -> Optional[str]:
+        """查找语义相似的历史查询，命中时返回缓存的回复"""
+        if not self._vectors:
+            return None
+        query_vector = self._embed(query)
+        if query_vector is None:
+            return None
+        # 归一化向量的点积即余弦相似度
+        similarities = np.dot(np.stack(self._vectors), query_vector)
+        best_index = int(np.argmax(similarities))
+        if similarities[best_index] >= self.threshold:
+            return self._responses[best_index]
+        return None
+
+    def update(self, query: str, response: str) -> None:
+        """将一次成功的问答写入缓存"""
+        query_vector = self._embed(query)
+        if query_vector is not None:
+            self._vectors.append(query_vector)
+            self._responses.append(response)
+
+
+class ManagedHistory:
+    """滑动窗口 + 摘要的聊天历史
+
+    最近几条消息保留原文，更早的轮次由 LLM 压缩成一条滚动摘要。早期提到的
+    关键信息（用户的伤病、目标、练过的动作）不会像直接截断那样被丢掉，
+    同时每次调用发送的 token 量仍然有上界。
+    """
+
+    RECENT_TURNS = 6        # 保留原文的最近消息条数
+    SUMMARIZE_THRESHOLD = 10  # 消息数超过该值时触发一次摘要压缩
+
+    SUMMARIZE_PROMPT = (
+        "请将以下健身助手与用户的对话压缩为一段简短摘要，"
+        "务必保留用户提到的个人信息（如伤病、健身目标、做过的训练和分析结果）："
+    )
+
+    def __init__(self, llm=None):
+        self.llm = llm  # 用于生成摘要，可在 Agent 初始化后再注入
+        self.summary: str = ""
+        self.messages: List[BaseMessage] = []
+
+    def append(self, message: BaseMessage) -> None:
+        """追加一条消息，超过阈值时把旧消息压缩进摘要"""
+        self.messages.append(message)
+        if len(self.messages) > self.SUMMARIZE_THRESHOLD:
+            self._summarize_old_turns()
+
+    def _summarize_old_turns(self) -> None:
+        """把最近 RECENT_TURNS 条之前的消息折叠进滚动摘要"""
+        old_messages = self.messages[:-self.RECENT_TURNS]
+        self.messages = self.messages[-self.RECENT_TURNS:]
+
+        if not self.llm:
+            return  # 无 LLM 可用时退化为纯滑动窗口
+
+        try:
+            transcript = "\n".join(
+                f"{'用户' if isinstance(m, HumanMessage) else '助手'}: {m.content}"
+                for m in old_messages
+            )
+            if self.summary:
+                transcript = f"已有摘要: {self.summary}\n新增对话:\n{transcript}"
+            response = self.llm.invoke([HumanMessage(content=f"{self.SUMMARIZE_PROMPT}\n{transcript}")])
+            self.summary = response.content if hasattr(response, 'content') else str(response)
+        except Exception as e:
+            # 摘要失败时保留旧摘要，仅丢弃本批旧消息（与原先的截断行为一致）
+            print(f"聊天历史摘要生成失败: {e}")
+
+    def as_messages(self) -> List[BaseMessage]:
+        """返回注入到 prompt 的消息列表 (摘要在前，近期原文在后)"""
+        if self.summary:
+            return [SystemMessage(content=f"早前对话摘要: {self.summary}")] + list(self.messages)
+        return list(self.messages)
+
+    def __len__(self):
+        return len(self.messages)
+
+    def __repr__(self):
+        return f"ManagedHistory(summary={self.summary!r}, messages={self.messages!r})"
+
+
 class FitMirrorLangChainAgent:
     """FitMirror 健身助手 LangChain Agent 类 (使用 Qwen 模型)"""
 
@@ -37,10 +164,41 @@ class FitMirrorLangChainAgent:
         self.agent_executor = None
         self.tools = None
         self.llm = None
-        self.chat_history: List[BaseMessage] = []
+        self.llm_with_retry = None
+        # 按会话隔离的聊天历史: session_id -> ManagedHistory
+        self.histories: Dict[str, ManagedHistory] = {}
+
+        # LLM 缓存命中统计 (通过 /health 暴露)
+        self.stats = {"cache_hits": 0, "cache_misses": 0}
+        self.semantic_cache = SemanticQueryCache()
+
+        # LLM 连通性检查结果 (None 表示尚未检查，进程内只检查一次)
+        self._llm_ok: Optional[bool] = None
 
         self.setup_agent()
 
+    def check_llm(self) -> bool:
+        """惰性 LLM 连通性检查，每进程只实际调用一次，结果缓存在 self._llm_ok"""
+        if self._llm_ok is None:
+            if not self.llm:
+                self._llm_ok = False
+            else:
+                try:
+                    self.llm.invoke([HumanMessage(content="你好，这是一个预检查")])
+                    self._llm_ok = True
+                except Exception as e:
+                    print(f"LLM 连通性检查失败: {e}")
+                    self._llm_ok = False
+        return self._llm_ok
+
+    def _get_history(self, session_id: str) -> ManagedHistory:
+        """获取 (按需创建) 指定会话的聊天历史"""
+        history = self.histories.get(session_id)
+        if history is None:
+            history = ManagedHistory(llm=self.llm_with_retry)
+            self.histories[session_id] = history
+        return history
+
     def setup_agent(self) -> None:
         """设置 LangChain Agent (使用 Qwen)"""
         print("DEBUG: Entering setup_agent (LangChain Core with Qwen)")
@@ -49,7 +207,15 @@ class FitMirrorLangChainAgent:
             dashscope_api_key = os.environ.get("DASHSCOPE_API_KEY")
             if not dashscope_api_key:
                 print("\n!!! 警告: 环境变量 DASHSCOPE_API_KEY 未设置。Qwen Agent 可能无法正常工作。\n")
-            
+
+            # 确定性 LLM 缓存：完全相同的 LLM 调用直接命中 SQLite，不再发起网络请求
+            try:
+                set_llm_cache(SQLiteCache(database_path=LLM_CACHE_PATH))
+                print(f"DEBUG: setup_agent - LLM SQLite 缓存已启用: {LLM_CACHE_PATH}")
+            except Exception as cache_e:
+                print(f"警告: 无法启用 LLM 缓存: {cache_e}")
+
+
             print(f"DEBUG: setup_agent - Creating ChatTongyi LLM with model: {self.model_name}...")
             self.llm = ChatTongyi(
                 model_name=self.model_name,
@@ -58,6 +224,16 @@ class FitMirrorLangChainAgent:
             )
             print("DEBUG: setup_agent - ChatTongyi LLM created.")
 
+            # 指数退避重试：瞬时的 429/5xx 不再直接落入回退分支，
+            # 抖动避免多个并发请求同步重试造成"重试风暴"
+            self.llm_with_retry = self.llm.with_retry(
+                stop_after_attempt=LLM_MAX_RETRIES,
+                wait_exponential_jitter=True
+            )
+            # 已存在的会话历史也切换到带重试的 LLM 上做摘要
+            for history in self.histories.values():
+                history.llm = self.llm_with_retry
+
             print("DEBUG: setup_agent - Preparing tools...")
             self.tools = [
                 analyze_exercise_video_tool,
@@ -85,7 +261,7 @@ class FitMirrorLangChainAgent:
             ])
             print("DEBUG: setup_agent - Prompt template created.")
 
-            agent = create_openai_tools_agent(self.llm, self.tools, prompt)
+            agent = create_openai_tools_agent(self.llm_with_retry, self.tools, prompt)
             print("DEBUG: setup_agent - Qwen tools agent created.")
 
             self.agent_executor = AgentExecutor(
@@ -110,17 +286,17 @@ class FitMirrorLangChainAgent:
             self.agent_executor = None
         print("DEBUG: Exiting setup_agent")
 
-    def run(self, query: str) -> Dict[str, Any]:
+    def run(self, query: str, session_id: str = "default") -> Dict[str, Any]:
         """
         执行用户查询
 
         Args:
             query (str): 用户输入
+            session_id (str): 会话标识，不同用户/会话的历史相互隔离
 
         Returns:
             Dict: 包含回复内容的字典
         """
-        max_history_length = 10
 
         if not self.agent_executor:
             return {
@@ -128,39 +304,42 @@ class FitMirrorLangChainAgent:
                 "message": "Agent 未正确初始化，请检查初始化错误。"
             }
 
-        # === 新增调试代码 ===
-        try:
-            print("\nDEBUG: 尝试在 Agent 执行前直接调用 self.llm ...")
-            pre_check_messages = [HumanMessage(content="你好，这是一个预检查")]
-            if self.llm:
-                pre_check_response = self.llm.invoke(pre_check_messages)
-                print(f"DEBUG: 预检查 LLM 调用成功。响应: {pre_check_response.content}\n")
-            else:
-                print("!!! DEBUG: 在预检查前 self.llm 为 None。跳过。\n")
-        except Exception as pre_check_e:
-            print(f"!!! DEBUG: 预检查 LLM 调用失败: {pre_check_e}\n")
-            import traceback
-            traceback.print_exc()
-            # 继续执行，看 Agent 执行是否也失败
-        # === 调试代码结束 ===
+        history = self._get_history(session_id)
+
+        # 语义缓存查找：语义相近的历史问题直接返回缓存回复，跳过整个 Agent 调用
+        cached_message = self.semantic_cache.lookup(query)
+        if cached_message is not None:
+            self.stats["cache_hits"] += 1
+            print(f"DEBUG: run - 语义缓存命中 (hits={self.stats['cache_hits']})")
+            history.append(HumanMessage(content=query))
+            history.append(AIMessage(content=cached_message))
+            return {
+                "success": True,
+                "message": cached_message
+            }
+        self.stats["cache_misses"] += 1
 
         try:
-            print(f"DEBUG: run - 当前聊天历史: {self.chat_history}")
+            print(f"DEBUG: run - 当前聊天历史: {history}")
             response = self.agent_executor.invoke({
                 "input": query,
-                "chat_history": self.chat_history
+                "chat_history": history.as_messages()
             })
             
             output_message = response.get("output", "抱歉，未能从 Agent 获取明确回复。")
             print(f"DEBUG: run - Agent 响应: {response}")
 
-            self.chat_history.append(HumanMessage(content=query))
-            self.chat_history.append(AIMessage(content=output_message))
-            
-            if len(self.chat_history) > max_history_length:
-                self.chat_history = self.chat_history[-max_history_length:]
-            
-            print(f"DEBUG: run - 更新后的聊天历史: {self.chat_history}")
+            history.append(HumanMessage(content=query))
+            history.append(AIMessage(content=output_message))
+
+
+            # 将成功的问答写入语义缓存，供后续相似问题复用
+            try:
+                self.semantic_cache.update(query, output_message)
+            except Exception as cache_e:
+                print(f"语义缓存写入失败: {cache_e}")
+
+            print(f"DEBUG: run - 更新后的聊天历史: {history}")
 
             return {
                 "success": True,
@@ -169,38 +348,86 @@ class FitMirrorLangChainAgent:
 
         except Exception as e:
             print(f"执行查询时出错: {e}")
-            import traceback
-            traceback.print_exc()
-            
+            return self._run_fallback(query, e, history)
+
+    async def arun(self, query: str, session_id: str = "default") -> Dict[str, Any]:
+        """
+        异步执行用户查询 (基于 agent_executor.ainvoke)
+
+        等待 DashScope 响应期间不阻塞事件循环，多个并发请求可以复用同一个
+        工作线程，而不是各占一个线程等待网络 I/O。
+
+        Args:
+            query (str): 用户输入
+            session_id (str): 会话标识，不同用户/会话的历史相互隔离
+
+        Returns:
+            Dict: 包含回复内容的字典
+        """
+
+        if not self.agent_executor:
+            return {
+                "success": False,
+                "message": "Agent 未正确初始化，请检查初始化错误。"
+            }
+
+        history = self._get_history(session_id)
+
+        # 语义缓存查找 (与 run 相同)
+        cached_message = self.semantic_cache.lookup(query)
+        if cached_message is not None:
+            self.stats["cache_hits"] += 1
+            history.append(HumanMessage(content=query))
+            history.append(AIMessage(content=cached_message))
+            return {
+                "success": True,
+                "message": cached_message
+            }
+        self.stats["cache_misses"] += 1
+
+        try:
+            # 异步路径下 AgentExecutor 会用 asyncio.gather 并发执行同一轮的多个工具调用
+            # (例如 RAG 检索 + 历史结果读取互相独立，耗时取 max 而非 sum)；
+            # max_concurrency 限制并发上限，视频分析工具为 CPU 密集，不宜与自身并发
+            response = await self.agent_executor.ainvoke(
+                {
+                    "input": query,
+                    "chat_history": history.as_messages()
+                },
+                config={"max_concurrency": len(self.tools)}
+            )
+
+            output_message = response.get("output", "抱歉，未能从 Agent 获取明确回复。")
+
+            history.append(HumanMessage(content=query))
+            history.append(AIMessage(content=output_message))
+
+
             try:
-                if self.llm:
-                    print("\nDEBUG: run - Agent 失败，尝试直接 LLM 回退...")
-                    
-                    # === 在回退逻辑中新增调试代码 ===
-                    try:
-                        print("DEBUG: 尝试在回退逻辑前直接调用 self.llm ...")
-                        pre_check_messages_fallback = [HumanMessage(content="你好，这是一个预检查（回退时）")]
-                        pre_check_response_fallback = self.llm.invoke(pre_check_messages_fallback)
-                        print(f"DEBUG: 预检查 LLM 调用（回退时）成功。响应: {pre_check_response_fallback.content}\n")
-                    except Exception as pre_check_fallback_e:
-                        print(f"!!! DEBUG: 预检查 LLM 调用（回退时）失败: {pre_check_fallback_e}\n")
-                        # 如果 self.llm 存在持续性问题，这里也可能失败
-                        import traceback
-                        traceback.print_exc() # 打印回退预检查的错误堆栈
-                    # === 调试代码结束 ===
+                self.semantic_cache.update(query, output_message)
+            except Exception as cache_e:
+                print(f"语义缓存写入失败: {cache_e}")
 
+            return {
+                "success": True,
+                "message": output_message
+            }
+
+        except Exception as e:
+            print(f"异步执行查询时出错: {e}")
+            try:
+                if self.llm:
+                    print("\nDEBUG: arun - Agent 失败，尝试直接 LLM 回退...")
                     fallback_messages = [
                         SystemMessage(content="你是FitMirror智能健身助手。你的工具调用功能暂时出现问题。请根据用户的问题，尽力提供一个直接和友好的回答。问题如下："),
                         HumanMessage(content=query)
                     ]
 
-                    direct_response_obj = self.llm.invoke(fallback_messages)
+                    direct_response_obj = await self.llm_with_retry.ainvoke(fallback_messages)
                     direct_response = direct_response_obj.content if hasattr(direct_response_obj, 'content') else str(direct_response_obj)
-                    
-                    self.chat_history.append(HumanMessage(content=query))
-                    self.chat_history.append(AIMessage(content=f"(Agent 运行失败，直接回复): {direct_response}"))
-                    if len(self.chat_history) > max_history_length:
-                         self.chat_history = self.chat_history[-max_history_length:]
+
+                    history.append(HumanMessage(content=query))
+                    history.append(AIMessage(content=f"(Agent 运行失败，直接回复): {direct_response}"))
 
                     return {
                         "success": True,
@@ -208,17 +435,147 @@ class FitMirrorLangChainAgent:
                     }
             except Exception as llm_e:
                 print(f"LLM 后备调用也失败: {llm_e}")
-                self.chat_history.append(HumanMessage(content=query))
-                self.chat_history.append(AIMessage(content=f"处理请求时出错: {str(e)}"))
-                if len(self.chat_history) > max_history_length:
-                    self.chat_history = self.chat_history[-max_history_length:]
-                pass
+                history.append(HumanMessage(content=query))
+                history.append(AIMessage(content=f"处理请求时出错: {str(e)}"))
 
             return {
                 "success": False,
                 "message": f"处理请求时出错: {str(e)}"
             }
 
+    async def run_batch(self, queries: List[str], session_id: str = "default", max_concurrency: int = 8) -> List[Dict[str, Any]]:
+        """
+        并发执行一批用户查询 (基于 agent_executor.abatch)
+
+        网络等待是主要开销：N 个查询并发后总耗时约等于最慢一个的 RTT，
+        而不是 N 个 RTT 之和。并发度默认限制为 8，避免触发 DashScope QPS 限流。
+        每个查询使用聊天历史的独立副本，互不污染。
+
+        Args:
+            queries (List[str]): 用户输入列表
+            session_id (str): 会话标识，批量查询共享同一会话的历史快照
+            max_concurrency (int): 最大并发数
+
+        Returns:
+            List[Dict]: 与 queries 一一对应的回复字典列表
+        """
+        if not self.agent_executor:
+            return [{
+                "success": False,
+                "message": "Agent 未正确初始化，请检查初始化错误。"
+            } for _ in queries]
+
+        history = self._get_history(session_id)
+
+        try:
+            responses = await self.agent_executor.abatch(
+                [{"input": q, "chat_history": history.as_messages()} for q in queries],
+                config={"max_concurrency": max_concurrency},
+                return_exceptions=True
+            )
+        except Exception as e:
+            print(f"批量执行查询时出错: {e}")
+            return [{
+                "success": False,
+                "message": f"处理请求时出错: {str(e)}"
+            } for _ in queries]
+
+        results = []
+        for query, response in zip(queries, responses):
+            if isinstance(response, Exception):
+                print(f"批量查询失败 ('{query}'): {response}")
+                results.append({
+                    "success": False,
+                    "message": f"处理请求时出错: {str(response)}"
+                })
+            else:
+                results.append({
+                    "success": True,
+                    "message": response.get("output", "抱歉，未能从 Agent 获取明确回复。")
+                })
+        return results
+
+    async def astream(self, query: str, session_id: str = "default"):
+        """
+        流式执行用户查询，逐段产出模型输出的增量文本
+
+        首个 token 通常在几百毫秒内到达，用户不必等完整回复 (可能 2-10 秒，
+        含工具调用) 才看到内容。完整回复仍会在结束后写入聊天历史。
+
+        Args:
+            query (str): 用户输入
+            session_id (str): 会话标识
+
+        Yields:
+            str: 模型输出的增量文本片段
+        """
+        if not self.agent_executor:
+            yield "Agent 未正确初始化，请检查初始化错误。"
+            return
+
+        history = self._get_history(session_id)
+        output_parts: List[str] = []
+        try:
+            async for event in self.agent_executor.astream_events(
+                {
+                    "input": query,
+                    "chat_history": history.as_messages()
+                },
+                version="v2"
+            ):
+                if event.get("event") == "on_chat_model_stream":
+                    content = event["data"]["chunk"].content
+                    if content:
+                        output_parts.append(content)
+                        yield content
+        except Exception as e:
+            print(f"流式执行查询时出错: {e}")
+            yield f"处理请求时出错: {str(e)}"
+            return
+
+        output_message = "".join(output_parts)
+        if output_message:
+            history.append(HumanMessage(content=query))
+            history.append(AIMessage(content=output_message))
+            try:
+                self.semantic_cache.update(query, output_message)
+            except Exception as cache_e:
+                print(f"语义缓存写入失败: {cache_e}")
+
+    def _run_fallback(self, query: str, e: Exception, history: ManagedHistory) -> Dict[str, Any]:
+        """run() 的同步回退分支 (Agent 失败时直接调用 LLM)"""
+        import traceback
+        traceback.print_exc()
+
+        try:
+            if self.llm:
+                print("\nDEBUG: run - Agent 失败，尝试直接 LLM 回退...")
+
+                fallback_messages = [
+                    SystemMessage(content="你是FitMirror智能健身助手。你的工具调用功能暂时出现问题。请根据用户的问题，尽力提供一个直接和友好的回答。问题如下："),
+                    HumanMessage(content=query)
+                ]
+
+                direct_response_obj = self.llm_with_retry.invoke(fallback_messages)
+                direct_response = direct_response_obj.content if hasattr(direct_response_obj, 'content') else str(direct_response_obj)
+
+                history.append(HumanMessage(content=query))
+                history.append(AIMessage(content=f"(Agent 运行失败，直接回复): {direct_response}"))
+
+                return {
+                    "success": True,
+                    "message": f"(Agent 运行失败，直接回复): {direct_response}"
+                }
+        except Exception as llm_e:
+            print(f"LLM 后备调用也失败: {llm_e}")
+            history.append(HumanMessage(content=query))
+            history.append(AIMessage(content=f"处理请求时出错: {str(e)}"))
+
+        return {
+            "success": False,
+            "message": f"处理请求时出错: {str(e)}"
+        }
+
 # --- 测试代码 ---
 if __name__ == "__main__":
     print("初始化 FitMirror LangChain Qwen Agent...")
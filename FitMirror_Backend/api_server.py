@@ -8,13 +8,19 @@ FitMirror API Server - 提供与前端通信的API接口
 """
 
 import os
+import re
 import sys
+import shutil
+import functools
+import asyncio
 import time
 import json
 import logging
 import uuid
 import random
-from flask import Flask, request, jsonify, send_from_directory # Added send_from_directory
+import secrets
+import hashlib
+from flask import Flask, Response, request, jsonify, send_from_directory # Added send_from_directory
 from flask_cors import CORS
 from dotenv import load_dotenv
 from werkzeug.utils import secure_filename
@@ -41,6 +47,26 @@ except ImportError as e:
 app = Flask(__name__)
 CORS(app)  # 启用CORS支持跨域请求
 
+# JSON 序列化改用 orjson：比标准库快数倍且原生支持 numpy 标量/datetime，
+# /get-analysis-reports 这类大列表响应收益明显。未安装时退回 Flask 默认实现
+try:
+    import orjson
+    from flask.json.provider import JSONProvider
+
+    class OrjsonProvider(JSONProvider):
+        """基于 orjson 的 Flask JSON provider"""
+
+        def dumps(self, obj, **kwargs):
+            return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+
+    app.json = OrjsonProvider(app)
+    print("✓ 已启用 orjson JSON 序列化")
+except ImportError:
+    print("提示: 未安装 orjson，使用标准库 json 序列化")
+
 # 配置上传文件夹
 UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -52,29 +78,39 @@ app.config['REPORTS_FOLDER'] = REPORTS_FOLDER
 
 app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 限制上传文件大小为100MB
 
-# 初始化FitMirror Agent
-agent = None
-try:
+# Agent 工厂：进程内单例。任何复用本模块的 worker 都拿到同一个已初始化的实例，
+# 不会重复构建 ChatTongyi 客户端 / 重新加载 RAG 工具
+@functools.lru_cache(maxsize=1)
+def get_agent():
+    """创建 (或返回缓存的) FitMirror Agent 实例"""
     # 检查是否设置了DASHSCOPE_API_KEY环境变量
     if not os.environ.get("DASHSCOPE_API_KEY"):
         print("警告: DASHSCOPE_API_KEY 未设置。请在 .env 文件中设置。")
         print("聊天功能将不可用，但动作分析功能仍然可用。")
-    else:
-        agent = FitMirrorLangChainAgent(verbose=False, model_name="qwen-plus")
+        return None
+    return FitMirrorLangChainAgent(verbose=False, model_name="qwen-plus")
+
+# 初始化FitMirror Agent
+agent = None
+try:
+    agent = get_agent()
+    if agent:
         print("✓ 成功初始化 FitMirror Agent")
 except Exception as e:
     print(f"✗ 初始化 Agent 失败: {e}")
     print("API服务器将继续运行，但聊天功能可能不可用。")
 
-# 尝试导入动作分析工具
-try:
-    from tools import analyze_exercise_video_tool
-    print("✓ 成功导入动作分析工具")
-    MOTION_ANALYSIS_AVAILABLE = True
-except ImportError as e:
-    print(f"✗ 无法导入动作分析工具: {e}")
-    print("动作分析功能将不可用。")
-    MOTION_ANALYSIS_AVAILABLE = False
+# 动作分析工具延迟导入：纯 /chat 部署不必在启动时加载 MediaPipe（数百MB内存、数秒导入）
+_analyze_tool = None
+
+def _get_analyze_tool():
+    """按需导入动作分析工具，每进程只导入一次"""
+    global _analyze_tool
+    if _analyze_tool is None:
+        from tools import analyze_exercise_video_tool
+        print("✓ 成功导入动作分析工具")
+        _analyze_tool = analyze_exercise_video_tool
+    return _analyze_tool
 
 @app.route('/health', methods=['GET'])
 def health_check():
@@ -83,12 +119,14 @@ def health_check():
     return jsonify({
         "status": "ok",
         "agent_status": agent_status,
+        "llm_status": ("ok" if agent.check_llm() else "error") if agent else "unavailable",
+        "cache_stats": agent.stats if agent else None,
         "timestamp": time.time()
     })
 
 @app.route('/chat', methods=['POST'])
-def chat():
-    """处理聊天请求并返回AI回复"""
+async def chat():
+    """处理聊天请求并返回AI回复 (异步视图，等待 DashScope 期间不阻塞工作线程)"""
     if not agent or not agent.agent_executor:
         return jsonify({
             "success": False,
@@ -111,15 +149,14 @@ def chat():
                 "message": "消息内容不能为空"
             }), 400  # Bad Request
 
-        # 可选：获取聊天历史（如果前端提供）
-        # chat_history = data.get('history', [])
-        # 注意：目前我们使用agent内部的chat_history，而不是前端传来的
+        # 会话标识：不同用户/设备的历史相互隔离 (未提供时退化为共享默认会话)
+        session_id = data.get('session_id') or request.cookies.get('session_id') or 'default'
 
-        logger.info(f"收到用户消息: {user_message}")
+        logger.info(f"收到用户消息 (session={session_id}): {user_message}")
 
-        # 调用FitMirror Agent处理消息
+        # 调用FitMirror Agent处理消息 (异步，DashScope 等待期间让出事件循环)
         start_time = time.time()
-        response = agent.run(user_message)
+        response = await agent.arun(user_message, session_id=session_id)
         end_time = time.time()
 
         logger.info(f"Agent响应时间: {end_time - start_time:.2f}秒")
@@ -145,35 +182,107 @@ def chat():
             "message": f"服务器错误: {str(e)}"
         }), 500  # Internal Server Error
 
-@app.route('/analyze-exercise', methods=['POST'])
-def analyze_exercise():
-    """处理动作分析请求"""
-    if not MOTION_ANALYSIS_AVAILABLE:
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """以 Server-Sent Events 流式返回AI回复，首个 token 即时送达客户端"""
+    if not agent or not agent.agent_executor:
         return jsonify({
             "success": False,
-            "message": "动作分析功能不可用，请检查服务器日志。"
+            "message": "FitMirror Agent未正确初始化，请检查服务器日志。"
+        }), 503  # Service Unavailable
+
+    data = request.json
+    if not data or not data.get('message'):
+        return jsonify({
+            "success": False,
+            "message": "消息内容不能为空"
+        }), 400  # Bad Request
+
+    user_message = data['message']
+    session_id = data.get('session_id') or request.cookies.get('session_id') or 'default'
+    logger.info(f"收到流式消息 (session={session_id}): {user_message}")
+
+    def generate():
+        # Flask 的流式响应需要同步生成器，在私有事件循环上驱动异步流
+        loop = asyncio.new_event_loop()
+        try:
+            stream = agent.astream(user_message, session_id=session_id).__aiter__()
+            while True:
+                try:
+                    delta = loop.run_until_complete(stream.__anext__())
+                except StopAsyncIteration:
+                    break
+                yield f"data: {json.dumps({'delta': delta}, ensure_ascii=False)}\n\n"
+            yield "data: [DONE]\n\n"
+        finally:
+            loop.close()
+
+    return Response(generate(), mimetype='text/event-stream')
+
+@app.route('/chat/batch', methods=['POST'])
+async def chat_batch():
+    """批量处理多条聊天消息，并发调用 Agent (总耗时 ~ 最慢一条而非逐条相加)"""
+    if not agent or not agent.agent_executor:
+        return jsonify({
+            "success": False,
+            "message": "FitMirror Agent未正确初始化，请检查服务器日志。"
         }), 503  # Service Unavailable
 
     try:
-        # 获取运动类型
-        exercise_type = request.form.get('exercise_type', 'squat')
+        data = request.json
+        if not data:
+            return jsonify({
+                "success": False,
+                "message": "请求数据为空或格式不正确"
+            }), 400  # Bad Request
 
-        # 验证运动类型
-        valid_exercise_types = ["squat", "pushup", "situp", "crunch", "jumping_jack", "plank"]
-        if exercise_type not in valid_exercise_types:
+        messages = data.get('messages', [])
+        if not messages or not isinstance(messages, list):
             return jsonify({
                 "success": False,
-                "message": f"不支持的运动类型: {exercise_type}。支持的类型有: {', '.join(valid_exercise_types)}"
+                "message": "messages 必须是非空的消息列表"
             }), 400  # Bad Request
 
-        # 检查是否使用模拟数据
-        use_mock = request.form.get('use_mock', 'false').lower() == 'true'
+        session_id = data.get('session_id') or request.cookies.get('session_id') or 'default'
 
-        # 如果使用模拟数据，直接返回模拟结果
-        if use_mock:
-            logger.info(f"使用模拟数据进行{exercise_type}动作分析")
+        logger.info(f"收到批量消息 (session={session_id}): {len(messages)} 条")
+
+        start_time = time.time()
+        responses = await agent.run_batch(messages, session_id=session_id)
+        end_time = time.time()
 
-            # 创建模拟分析结果
+        logger.info(f"批量响应时间: {end_time - start_time:.2f}秒 ({len(messages)} 条)")
+
+        return jsonify({
+            "success": True,
+            "responses": responses,
+            "response_time": end_time - start_time
+        })
+
+    except Exception as e:
+        logger.error(f"处理批量聊天请求时出错: {str(e)}", exc_info=True)
+        return jsonify({
+            "success": False,
+            "message": f"服务器错误: {str(e)}"
+        }), 500  # Internal Server Error
+
+# 模拟分析结果：启动时为每种运动预生成一批序列化好的 JSON 响应，
+# use_mock 分支变成 O(1) 取用预置字节串，不再每次请求构造字典/随机数
+_MOCK_POSSIBLE_ERRORS = {
+    "squat": ["膝盖内扣", "重心过于靠前", "下蹲不够深"],
+    "pushup": ["肩部下沉", "臀部抬高", "手肘角度不正确"],
+    "situp": ["躯干扭转", "头部前屈", "动作不完整"],
+    "jumping_jack": ["动作不对称", "膝盖弯曲", "手臂抬起不够高"],
+    "plank": ["臀部抬高", "肩部下沉", "身体不平直"]
+}
+
+def _build_mock_results(variants_per_type=16):
+    """为每种运动类型预生成 (json_bytes, etag) 元组列表"""
+    valid_exercise_types = ["squat", "pushup", "situp", "crunch", "jumping_jack", "plank"]
+    payloads = {}
+    for exercise_type in valid_exercise_types:
+        variants = []
+        for _ in range(variants_per_type):
             mock_result = {
                 'success': True,
                 'message': "分析完成，这是模拟数据。",
@@ -182,19 +291,9 @@ def analyze_exercise():
                 'processed_frames': 300,
                 'errors_detected': []
             }
-
-            # 随机添加一些错误
-            possible_errors = {
-                "squat": ["膝盖内扣", "重心过于靠前", "下蹲不够深"],
-                "pushup": ["肩部下沉", "臀部抬高", "手肘角度不正确"],
-                "situp": ["躯干扭转", "头部前屈", "动作不完整"],
-                "jumping_jack": ["动作不对称", "膝盖弯曲", "手臂抬起不够高"],
-                "plank": ["臀部抬高", "肩部下沉", "身体不平直"]
-            }
-
             # 50%的概率添加错误
             if random.random() > 0.5:
-                errors = possible_errors.get(exercise_type, [])
+                errors = _MOCK_POSSIBLE_ERRORS.get(exercise_type, [])
                 if errors:
                     # 随机选择1-2个错误
                     num_errors = random.randint(1, min(2, len(errors)))
@@ -204,8 +303,47 @@ def analyze_exercise():
                             'count': random.randint(1, 5),  # 随机出现1-5次
                             'first_timestamp': random.random() * 10
                         })
+            body = json.dumps(mock_result, ensure_ascii=False).encode('utf-8')
+            variants.append((body, hashlib.md5(body).hexdigest()))
+        payloads[exercise_type] = tuple(variants)
+    return payloads
+
+_MOCK_RESULTS = _build_mock_results()
 
-            return jsonify(mock_result)
+@app.route('/analyze-exercise', methods=['POST'])
+async def analyze_exercise():
+    """处理动作分析请求 (异步视图，落盘和 MediaPipe 分析都在线程池中执行)"""
+    try:
+        analyze_tool = _get_analyze_tool()
+    except ImportError as e:
+        logger.error(f"无法导入动作分析工具: {e}")
+        return jsonify({
+            "success": False,
+            "message": "动作分析功能不可用，请检查服务器日志。"
+        }), 503  # Service Unavailable
+
+    try:
+        # 获取运动类型
+        exercise_type = request.form.get('exercise_type', 'squat')
+
+        # 验证运动类型
+        valid_exercise_types = ["squat", "pushup", "situp", "crunch", "jumping_jack", "plank"]
+        if exercise_type not in valid_exercise_types:
+            return jsonify({
+                "success": False,
+                "message": f"不支持的运动类型: {exercise_type}。支持的类型有: {', '.join(valid_exercise_types)}"
+            }), 400  # Bad Request
+
+        # 检查是否使用模拟数据
+        use_mock = request.form.get('use_mock', 'false').lower() == 'true'
+
+        # 如果使用模拟数据，直接返回预生成的模拟结果 (O(1)，无每请求构造开销)
+        if use_mock:
+            logger.info(f"使用模拟数据进行{exercise_type}动作分析")
+            body, etag = secrets.choice(_MOCK_RESULTS[exercise_type])
+            resp = Response(body, mimetype="application/json")
+            resp.set_etag(etag)  # 客户端可据此缓存
+            return resp
 
         # 检查是否有文件上传
         if 'video' not in request.files:
@@ -221,18 +359,35 @@ def analyze_exercise():
                 "message": "没有选择视频文件"
             }), 400  # Bad Request
 
-        # 保存上传的视频文件
+        # 保存上传的视频文件：直接从 werkzeug 的上传流以 1MB 块顺序拷贝，
+        # 避免 FileStorage.save 默认小缓冲带来的多次小块写
         filename = f"{uuid.uuid4()}{os.path.splitext(secure_filename(video_file.filename))[1]}"
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        video_file.save(filepath)
+
+        def _save_upload():
+            with open(filepath, 'wb') as f:
+                shutil.copyfileobj(video_file.stream, f, length=1 << 20)
+
+        # 100MB 级的磁盘写放到线程池，写盘期间事件循环可继续处理聊天请求
+        await asyncio.to_thread(_save_upload)
 
         logger.info(f"视频已保存到: {filepath}")
 
         # 调用动作分析工具
         try:
             # 直接调用工具函数而不是通过Agent
-            # result = analyze_exercise_video_tool(video_path=filepath, exercise_type=exercise_type)
-            result = analyze_exercise_video_tool.invoke({"video_path": filepath, "exercise_type": exercise_type})
+            # result = analyze_tool(video_path=filepath, exercise_type=exercise_type)
+            try:
+                # MediaPipe 的 CPU 密集分析同样移出事件循环
+                result = await asyncio.to_thread(
+                    analyze_tool.invoke, {"video_path": filepath, "exercise_type": exercise_type}
+                )
+            finally:
+                # 分析完成后立即删除上传的原始视频，uploads 目录此前只增不减
+                try:
+                    os.remove(filepath)
+                except OSError as e_rm:
+                    logger.warning(f"删除上传视频失败: {filepath}: {e_rm}")
 
             # 添加视频文件路径到结果中
             # result["video_path"] = filepath # analyze_exercise_video_tool 的结果可能已经包含了更合适的路径或处理后的视频路径
@@ -243,11 +398,9 @@ def analyze_exercise():
 
             final_response = result.copy() # 从工具的返回结果开始
 
-            # 如果工具没有返回 video_path (例如，它返回的是处理后的视频路径，或者没有视频输出)
-            # 我们可以选择添加原始上传视频的路径，或者让工具的返回结果决定视频路径
-            if "video_path" not in final_response and filepath: # "video_path" might be the processed one
-                 final_response["uploaded_video_path"] = filepath # 原始上传的视频路径
-            
+            # 原始上传视频在分析结束后已删除，不再向响应附加 uploaded_video_path；
+            # 如果工具返回了 video_path (处理后的视频)，它仍在 final_response 中
+
             # 如果工具返回了 report_path, 它已经在 final_response 中了
             # 现在我们基于 report_path 构建 report_url
             if final_response.get("success") and final_response.get("report_path"):
@@ -286,80 +439,96 @@ def serve_report(filename):
         logger.error(f"报告文件未找到: {filename}")
         return jsonify({"success": False, "message": "Report not found"}), 404
 
+# 报告列表缓存：目录 mtime 未变化时直接返回上次扫描结果，移动端轮询不再每次 O(N) 扫盘
+# 文件名形如 "深蹲_训练报告_20250529_232324.html"，预编译正则代替逐文件 split
+_REPORT_NAME_RE = re.compile(r"^(.+?)_.*?(\d{8})_(\d{6})\.html$")
+_reports_cache = {"dir_mtime": None, "reports": None}
+
+def _parse_report_filename(filename):
+    """从报告文件名解析运动类型和日期字符串"""
+    match = _REPORT_NAME_RE.match(filename)
+    if match:
+        exercise_type, date_part, time_part = match.groups()
+        date_str = (
+            f"{date_part[:4]}-{date_part[4:6]}-{date_part[6:8]} "
+            f"{time_part[:2]}:{time_part[2:4]}:{time_part[4:6]}"
+        )
+        return exercise_type, date_str
+    # 退化情况：至少取下划线前缀作为运动类型
+    prefix = filename[:-5].split('_')[0] if '_' in filename else "Unknown"
+    return prefix or "Unknown", "Unknown Date"
+
+def _scan_reports(reports_dir):
+    """扫描报告目录，返回 (不含 report_url 的) 元数据列表，按修改时间降序"""
+    report_files_data = []
+    # os.scandir 一次系统调用同时拿到文件名和 stat 信息，避免逐文件 getmtime
+    with os.scandir(reports_dir) as entries:
+        for entry in entries:
+            if not entry.name.endswith(".html") or not entry.is_file():
+                continue
+            try:
+                exercise_type, date_str = _parse_report_filename(entry.name)
+                report_files_data.append({
+                    "filename": entry.name,
+                    "exercise_type": exercise_type,
+                    "date_str": date_str,
+                    "timestamp": entry.stat().st_mtime
+                })
+            except Exception as e_parse:
+                logger.error(f"Error parsing metadata for report file {entry.name}: {e_parse}")
+                report_files_data.append({
+                    "filename": entry.name,
+                    "exercise_type": "Parse Error",
+                    "date_str": "Parse Error",
+                    "timestamp": entry.stat().st_mtime
+                })
+
+    # Sort reports by modification time (newest first)
+    report_files_data.sort(key=lambda x: x["timestamp"], reverse=True)
+    return report_files_data
+
 @app.route('/get-analysis-reports', methods=['GET'])
 def get_analysis_reports():
-    """获取分析报告列表"""
+    """获取分析报告列表 (目录未变化时命中缓存)"""
     logger.info(f"Request for /get-analysis-reports received from {request.remote_addr}")
     reports_dir = app.config['REPORTS_FOLDER']
-    report_files_data = []
     try:
-        filenames = os.listdir(reports_dir)
-        for filename in filenames:
-            if filename.endswith(".html"):
-                filepath = os.path.join(reports_dir, filename)
-                try:
-                    # Remove .html extension and split by underscore
-                    # e.g., "深蹲_训练报告_20250529_232324.html"
-                    name_parts = filename[:-5].split('_') 
-                    
-                    exercise_type = "Unknown"
-                    date_str_from_file = "Unknown Date"
-
-                    if len(name_parts) > 0:
-                        exercise_type = name_parts[0] # e.g., "深蹲"
-                    
-                    # Try to parse date and time assuming YYYYMMDD_HHMMSS at the end of name_parts
-                    # For "深蹲_训练报告_20250529_232324", parts are ['深蹲', '训练报告', '20250529', '232324']
-                    if len(name_parts) >= 3: # Need at least type_date_time or type_text_date_time
-                        potential_date_part = name_parts[-2] # e.g., "20250529"
-                        potential_time_part = name_parts[-1] # e.g., "232324"
-
-                        if len(potential_date_part) == 8 and potential_date_part.isdigit() and \
-                           len(potential_time_part) == 6 and potential_time_part.isdigit():
-                            date_str_from_file = (
-                                f"{potential_date_part[:4]}-{potential_date_part[4:6]}-{potential_date_part[6:8]} "
-                                f"{potential_time_part[:2]}:{potential_time_part[2:4]}:{potential_time_part[4:6]}"
-                            )
-                        elif len(potential_date_part) == 8 and potential_date_part.isdigit(): # Only date part found
-                             date_str_from_file = f"{potential_date_part[:4]}-{potential_date_part[4:6]}-{potential_date_part[6:8]}"
-                        # If pattern is different, date_str_from_file remains "Unknown Date" or last valid parse
-
-                    modification_time = os.path.getmtime(filepath)
-                    base_url = request.host_url.rstrip('/') 
-                    report_url = f"{base_url}/reports/{filename}"
-
-                    report_files_data.append({
-                        "filename": filename,
-                        "exercise_type": exercise_type,
-                        "date_str": date_str_from_file,
-                        "timestamp": modification_time, 
-                        "report_url": report_url
-                    })
-                except Exception as e_parse:
-                    logger.error(f"Error parsing metadata for report file {filename}: {e_parse}")
-                    # Add with default/error values if parsing fails for a specific file
-                    report_files_data.append({
-                        "filename": filename,
-                        "exercise_type": "Parse Error",
-                        "date_str": "Parse Error",
-                        "timestamp": os.path.getmtime(filepath), # Still need timestamp for sorting
-                        "report_url": f"{request.host_url.rstrip('/')}/reports/{filename}"
-                    })
-
-        # Sort reports by modification time (newest first)
-        report_files_data.sort(key=lambda x: x["timestamp"], reverse=True)
-        
-        return jsonify({"success": True, "reports": report_files_data})
+        dir_mtime = os.stat(reports_dir).st_mtime
+        if _reports_cache["dir_mtime"] != dir_mtime or _reports_cache["reports"] is None:
+            _reports_cache["reports"] = _scan_reports(reports_dir)
+            _reports_cache["dir_mtime"] = dir_mtime
+        else:
+            logger.info("报告列表缓存命中，跳过目录扫描")
+
+        # report_url 依赖请求的 host_url，不入缓存
+        base_url = request.host_url.rstrip('/')
+        reports = [
+            {**report, "report_url": f"{base_url}/reports/{report['filename']}"}
+            for report in _reports_cache["reports"]
+        ]
+        return jsonify({"success": True, "reports": reports})
 
     except Exception as e_main:
         logger.error(f"Error in /get-analysis-reports endpoint: {e_main}", exc_info=True)
         return jsonify({"success": False, "message": f"Server error while listing reports: {str(e_main)}"}), 500
 
 def main():
-    """主函数，启动Flask服务器"""
+    """主函数，启动Flask开发服务器 (仅限本地开发)
+
+    生产环境请勿使用 Werkzeug 开发服务器 (单进程、吞吐受限)，改用 gunicorn：
+
+        gunicorn -w 4 -k gevent -t 120 api_server:app
+
+    gevent worker 对本服务这种 DashScope I/O 密集型负载最合适，每个 worker
+    可同时挂起数百个在途请求。如前置 nginx，需同步设置 client_max_body_size
+    以匹配 MAX_CONTENT_LENGTH (100MB)。
+    """
     try:
         host = os.environ.get("API_HOST", "0.0.0.0")
         port = int(os.environ.get("API_PORT", 5000))
+        # debug 模式 (自动重载器) 每次重载都重建 Agent/ChatTongyi/RAG 工具，
+        # 冷启动代价高，默认关闭，仅开发时通过环境变量显式打开
+        debug_mode = os.environ.get("FLASK_DEBUG", "0").lower() in ("1", "true", "yes")
 
         print(f"\n{'='*50}")
         print(f"FitMirror API 服务器正在启动...")
@@ -367,7 +536,7 @@ def main():
         print(f"健康检查: http://{host if host != '0.0.0.0' else 'localhost'}:{port}/health")
         print(f"{'='*50}\n")
 
-        app.run(host=host, port=port, debug=True, threaded=True)
+        app.run(host=host, port=port, debug=debug_mode, threaded=True)
     except Exception as e:
         print(f"启动API服务器时出错: {e}")
         sys.exit(1)
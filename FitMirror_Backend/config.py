@@ -2,17 +2,27 @@
 健身动作识别系统配置文件
 """
 
+from enum import IntEnum
+
+import numpy as np
+
 # 科大讯飞语音合成API配置
 IFLYTEK_APP_ID = "6061e2ba"  # 需要填写你的科大讯飞AppID
 IFLYTEK_API_KEY = "448b0e4c05e3df7ec02a9ed791229e4d"  # 需要填写你的科大讯飞APIKey 
 IFLYTEK_API_SECRET = "MWNkMzdkMWUwYjRjZjRjOWE2MWI0NTgy"  # 需要填写你的科大讯飞APISecret
 
+# LLM调用配置
+LLM_MAX_RETRIES = 4  # DashScope 调用的最大尝试次数（指数退避+抖动），应对瞬时429/5xx
+
 # 错误检测配置
 ERROR_PERSISTENCE = 3  # 错误持续次数阈值，只有连续检测到ERROR_PERSISTENCE次才报告
 ERROR_COOLDOWN = 0.5  # 错误记录冷却时间，避免重复记录相似错误
 
 # 视频处理配置
 PROCESS_EVERY_N_FRAMES = 1  # 每隔多少帧处理一次，设为1表示每帧都处理
+TARGET_ANALYSIS_FPS = 15  # 分析采样帧率，高帧率视频按 round(fps/该值) 跨帧采样 (计数15fps已足够)
+MOTION_SKIP_THRESHOLD = 2.0  # 帧间运动量阈值 (64x64灰度帧差均值)，低于该值复用上一帧姿态结果
+POSE_INPUT_MAX_HEIGHT = 480  # 送入MediaPipe前的最大帧高，超过则等比降采样 (模型对1080p无额外收益)
 MAX_BUFFER_SIZE = 10  # 角度缓冲区大小，用于平滑处理
 ANGLE_THRESHOLD = 5.0  # 角度变化阈值，防止微小抖动导致状态变化
 
@@ -31,11 +41,33 @@ COLOR_MAP = {
     "blue": (255, 0, 0)
 }
 
-# 运动类型映射
+# 颜色的数组版本：COLOR_INDEX 把颜色名一次性换成整数下标后，
+# 热路径 (逐帧标注绘制) 可以直接按下标取 COLOR_ARR 行，免去字符串哈希
+COLOR_INDEX = {name: i for i, name in enumerate(COLOR_MAP)}
+COLOR_ARR = np.array(list(COLOR_MAP.values()), dtype=np.uint8)  # (N,3) BGR
+
+class ExerciseKind(IntEnum):
+    """支持的运动类型。整数值用作 EXERCISE_NAMES_ARR 等数组的下标，
+    入口处把字符串一次性转成枚举后，后续查表不再做字符串哈希"""
+    SQUAT = 0
+    CRUNCH = 1
+    SITUP = 2
+    JUMPING_JACK = 3
+    PUSHUP = 4
+
+    @classmethod
+    def from_str(cls, exercise_type: str) -> "ExerciseKind":
+        """把 API 传入的运动类型字符串转为枚举，不支持的类型抛 KeyError"""
+        return cls[exercise_type.upper()]
+
+# 运动类型映射 (字符串键保留用于 API 入参；内部热路径按枚举查下方数组)
 EXERCISE_NAMES = {
     "squat": "深蹲",
     "crunch": "卷腹",
     "situp": "仰卧起坐",
     "jumping_jack": "开合跳",
     "pushup": "俯卧撑"
-}
\ No newline at end of file
+}
+
+# 按 ExerciseKind 下标取中文名
+EXERCISE_NAMES_ARR = [EXERCISE_NAMES[kind.name.lower()] for kind in ExerciseKind]
\ No newline at end of file
@@ -6,102 +6,337 @@
 - 返回结构化的分析结果
 """
 
-import cv2
-import mediapipe as mp
 import numpy as np
 import time
 import os
 import math
-from collections import deque
+import queue
+import threading
+import logging
+from enum import IntEnum
+from types import SimpleNamespace
 from typing import Dict, Any, Tuple, List, Optional
 
-# 导入本地辅助模块
+# 导入本地辅助模块 (config 很轻量，保留在模块顶层)
 try:
     from config import (
-        EXERCISE_NAMES, PROCESS_EVERY_N_FRAMES, SCREEN_WIDTH, SCREEN_HEIGHT,
-        DISPLAY_SCALE, COLOR_MAP, ERROR_PERSISTENCE, MAX_BUFFER_SIZE, ANGLE_THRESHOLD
+        EXERCISE_NAMES, EXERCISE_NAMES_ARR, ExerciseKind,
+        PROCESS_EVERY_N_FRAMES, SCREEN_WIDTH, SCREEN_HEIGHT,
+        DISPLAY_SCALE, COLOR_MAP, COLOR_INDEX, ERROR_PERSISTENCE, MAX_BUFFER_SIZE, ANGLE_THRESHOLD,
+        MOTION_SKIP_THRESHOLD, POSE_INPUT_MAX_HEIGHT, TARGET_ANALYSIS_FPS
     )
-    # 确保 image_utils 中的 calculate_angle 可用
-    from image_utils import (
-        calculate_angle as calculate_angle_2d, # 重命名以区分 3D
-        cv2AddChineseText, draw_error_annotations, draw_skeleton_lines, draw_ui_elements
-    )
-    from training_stats import TrainingStats
-    # from voice_utils import speak_error_async # 暂时注释掉语音，可在Agent层处理
 except ImportError as e:
-    print(f"错误：无法导入必要的本地模块: {e}")
-    print("请确保 config.py, image_utils.py, training_stats.py 在同一目录下或Python路径中")
+    print(f"错误：无法导入配置模块: {e}")
+    print("请确保 config.py 在同一目录下或Python路径中")
     # 提供默认值以允许部分功能运行（或直接退出）
+    from enum import IntEnum
+    ExerciseKind = IntEnum("ExerciseKind", [("SQUAT", 0), ("CRUNCH", 1), ("SITUP", 2), ("JUMPING_JACK", 3), ("PUSHUP", 4)])
     EXERCISE_NAMES = {"squat": "深蹲", "pushup": "俯卧撑", "situp": "仰卧起坐", "crunch": "卷腹", "jumping_jack": "开合跳"}
+    EXERCISE_NAMES_ARR = [EXERCISE_NAMES[kind.name.lower()] for kind in ExerciseKind]
     PROCESS_EVERY_N_FRAMES = 1
     SCREEN_WIDTH, SCREEN_HEIGHT = 1920, 1080
     DISPLAY_SCALE = 0.8
-    COLOR_MAP = {"red": (0, 0, 255), "yellow": (0, 255, 255), "green": (0, 255, 0), "purple": (255, 0, 255)}
+    # 与 config.COLOR_MAP 保持相同的键顺序，保证 COLOR_INDEX 下标一致
+    COLOR_MAP = {"red": (0, 0, 255), "yellow": (0, 255, 255), "orange": (0, 165, 255),
+                 "purple": (255, 0, 255), "green": (0, 255, 0), "blue": (255, 0, 0)}
+    COLOR_INDEX = {name: i for i, name in enumerate(COLOR_MAP)}
     ERROR_PERSISTENCE = 3
     MAX_BUFFER_SIZE = 5
     ANGLE_THRESHOLD = {} # 需要为不同运动定义阈值
-    # 定义一个简单的 calculate_angle_2d 以防万一
-    def calculate_angle_2d(a,b,c):
-        a = np.array(a); b = np.array(b); c = np.array(c)
-        radians = np.arctan2(c[1]-b[1], c[0]-b[0]) - np.arctan2(a[1]-b[1], a[0]-b[0])
-        angle = np.abs(radians*180.0/np.pi)
-        return angle if angle <= 180.0 else 360-angle
-    # 其他函数也需要占位符或默认行为
-    class TrainingStats:
-        def __init__(self, *args): pass
-        def add_record(self, *args): pass
-        def update_count(self, *args): pass
-        def export_report(self, *args): return "dummy_report.txt"
-    def cv2AddChineseText(*args): pass
-    def draw_error_annotations(*args): return args[0] # return image
-    def draw_skeleton_lines(*args): return args[0] # return image
-    def draw_ui_elements(*args): return args[0], None # return image, button_rect
+    MOTION_SKIP_THRESHOLD = 2.0
+    POSE_INPUT_MAX_HEIGHT = 480
+    TARGET_ANALYSIS_FPS = 15
+
+# 重型依赖延迟加载：cv2/mediapipe 导入耗时数秒、占用数百 MB 内存，
+# 仅提供 /chat 的部署导入本模块时不应付出这个代价。
+# 以下名称由 _ensure_deps() 在第一次视频分析时填充。
+cv2 = None
+mp = None
+calculate_angle_2d = None
+cv2AddChineseText = None
+draw_error_annotations = None
+draw_skeleton_lines = None
+draw_ui_elements = None
+TrainingStats = None
+_heavy_deps_loaded = False
+
+def _ensure_deps():
+    """按需加载视频分析所需的重型依赖，每进程只实际执行一次"""
+    global cv2, mp, calculate_angle_2d, cv2AddChineseText, draw_error_annotations
+    global draw_skeleton_lines, draw_ui_elements, TrainingStats, _heavy_deps_loaded
+
+    if _heavy_deps_loaded:
+        return
+
+    import cv2 as _cv2
+    import mediapipe as _mp
+    # 确保 image_utils 中的 calculate_angle 可用
+    from image_utils import (
+        calculate_angle as _calculate_angle_2d, # 重命名以区分 3D
+        cv2AddChineseText as _cv2AddChineseText,
+        draw_error_annotations as _draw_error_annotations,
+        draw_skeleton_lines as _draw_skeleton_lines,
+        draw_ui_elements as _draw_ui_elements
+    )
+    from training_stats import TrainingStats as _TrainingStats
+    # from voice_utils import speak_error_async # 暂时注释掉语音，可在Agent层处理
+
+    cv2 = _cv2
+    mp = _mp
+    calculate_angle_2d = _calculate_angle_2d
+    cv2AddChineseText = _cv2AddChineseText
+    draw_error_annotations = _draw_error_annotations
+    draw_skeleton_lines = _draw_skeleton_lines
+    draw_ui_elements = _draw_ui_elements
+    TrainingStats = _TrainingStats
+    _build_landmark_indices(_mp.solutions.pose.PoseLandmark)
+    _build_angle_specs(_mp.solutions.pose.PoseLandmark)
+    _build_valid_pose_specs(_mp.solutions.pose.PoseLandmark)
+    _heavy_deps_loaded = True
 
 # =====================
 # 辅助函数区域 (从 pose_analyzer.py 迁移)
 # =====================
 
-# --- 三维向量工具函数 ---
-def vec3(a, b):
-    """计算三维向量 a->b"""
-    return [b.x - a.x, b.y - a.y, b.z - a.z]
-
-def norm3(u):
-    """三维向量模长"""
-    # 添加 epsilon 防止除零
-    norm_sq = u[0]**2 + u[1]**2 + u[2]**2
-    return math.sqrt(norm_sq) if norm_sq > 1e-9 else 0
-
-def dot3(u, v):
-    """三维向量点积"""
-    return u[0]*v[0] + u[1]*v[1] + u[2]*v[2]
-
-def cross3(u, v):
-    """三维向量叉积"""
-    return [
-        u[1]*v[2] - u[2]*v[1],
-        u[2]*v[0] - u[0]*v[2],
-        u[0]*v[1] - u[1]*v[0]
-    ]
-
-def angle3(a, b, c):
-    """三维空间角度，返回∠bac，a为顶点，单位为度"""
-    v1 = vec3(a, b)
-    v2 = vec3(a, c)
-    n1 = norm3(v1)
-    n2 = norm3(v2)
-    if n1 == 0 or n2 == 0:
-        return 0.0
-    # 防止浮点数精度问题导致 cos_theta 略大于 1 或小于 -1
-    cos_theta = dot3(v1, v2) / (n1 * n2)
-    cos_theta = max(min(cos_theta, 1.0), -1.0)
-    try:
-        return math.degrees(math.acos(cos_theta))
-    except ValueError:
-         # 如果仍然出错（理论上不应该），返回 0
-        print(f"Warning: acos ValueError for cos_theta={cos_theta}")
-        return 0.0
+# --- 批量角度计算 (NumPy 向量化) ---
+# 原先的 vec3/norm3/dot3/angle3 逐点纯 Python 实现每帧被调用多次，
+# 在 30fps x 数分钟的视频里累计数百万次函数调用。现在逐帧把 MediaPipe
+# 的 33 个关键点转成一个 (33, 3) 数组，一帧内所有感兴趣的角度用一次
+# 批量 einsum 计算完成。
+
+def _landmarks_to_array(landmarks) -> np.ndarray:
+    """把 MediaPipe landmark 列表转成 (33, 4) 的 float32 数组 (x, y, z, visibility)
 
+    每帧只做一次属性访问，后续辅助函数全部按整数下标读取该数组。
+    """
+    return np.fromiter(
+        (v for l in landmarks for v in (l.x, l.y, l.z, l.visibility)),
+        dtype=np.float32, count=len(landmarks) * 4
+    ).reshape(-1, 4)
+
+def _angles_batch(pts: np.ndarray, idx_a: np.ndarray, idx_vertex: np.ndarray, idx_c: np.ndarray) -> np.ndarray:
+    """批量计算多个 ∠(a-顶点-c)，返回角度数组 (单位为度)
+
+    Args:
+        pts: (33, D) 关键点坐标，D=2 时计算 2D 角度，D=3 时计算 3D 角度
+        idx_a / idx_vertex / idx_c: 等长索引数组，每个位置对应一个待算角度的三元组
+
+    退化情况 (向量模长为 0) 返回 0.0，与原 angle3 行为一致。
+    """
+    v1 = pts[idx_a] - pts[idx_vertex]
+    v2 = pts[idx_c] - pts[idx_vertex]
+    denom = np.linalg.norm(v1, axis=1) * np.linalg.norm(v2, axis=1)
+    cos_theta = np.where(
+        denom > 1e-9,
+        np.einsum('ij,ij->i', v1, v2) / np.maximum(denom, 1e-9),
+        1.0  # cos=1 -> 角度 0
+    )
+    return np.degrees(np.arccos(np.clip(cos_theta, -1.0, 1.0)))
+
+def _angle2d_scalar(ax: float, ay: float, vx: float, vy: float, cx: float, cy: float) -> float:
+    """单个 2D ∠(a-顶点-c) 角度 (度) 的纯标量实现
+
+    主角度一帧只算一个，math.atan2 标量路径避开 numpy 对微型数组的
+    分发开销 (约 10 倍差距)；一帧多个角度仍走 _angles_batch 批量计算。
+    """
+    ang = abs(math.degrees(math.atan2(cy - vy, cx - vx) - math.atan2(ay - vy, ax - vx)))
+    return 360.0 - ang if ang > 180.0 else ang
+
+# PoseLandmark 的整数下标常量，由 _ensure_deps() 填充一次。
+# 热路径里 _LM.LEFT_HIP 直接是 int，不再每帧经过 mediapipe 的枚举描述符
+_LM: Optional[SimpleNamespace] = None
+
+def _build_landmark_indices(pose_landmark) -> None:
+    """把 PoseLandmark 枚举展开成纯整数常量命名空间"""
+    global _LM
+    _LM = SimpleNamespace(**{name: member.value for name, member in pose_landmark.__members__.items()})
+
+# 各运动类型的角度三元组索引，由 _ensure_deps() 在 mediapipe 加载后编译一次：
+# ExerciseKind -> {"main": (ia, iv, ic) 主角度 (2D), "extra3d": (names, ia, iv, ic) 附加角度 (3D)}
+_ANGLE_SPECS: Dict[int, Dict[str, Any]] = {}
+
+def _build_angle_specs(pose_landmark) -> None:
+    """预编译每种运动一帧内需要的 landmark 三元组索引数组 (顶点在中间)"""
+    LS, LE, LW = pose_landmark.LEFT_SHOULDER.value, pose_landmark.LEFT_ELBOW.value, pose_landmark.LEFT_WRIST.value
+    LH, LK, LA = pose_landmark.LEFT_HIP.value, pose_landmark.LEFT_KNEE.value, pose_landmark.LEFT_ANKLE.value
+
+    def _idx(*triplets):
+        a, v, c = zip(*triplets)
+        return np.array(a), np.array(v), np.array(c)
+
+    _ANGLE_SPECS.update({
+        # 深蹲：主角度为膝关节角，附加髋部 3D 角 (原 angle3(hip, knee, shoulder))
+        ExerciseKind.SQUAT: {"main": (LH, LK, LA), "extra3d": (["hip_angle"],) + _idx((LK, LH, LS))},
+        # 俯卧撑：主角度为肘关节角，附加身体直线性 3D 角 (原 angle3(hip, shoulder, ankle))
+        ExerciseKind.PUSHUP: {"main": (LS, LE, LW), "extra3d": (["body_angle"],) + _idx((LS, LH, LA))},
+        # 仰卧起坐/卷腹：主角度为肩-髋-膝角
+        ExerciseKind.SITUP: {"main": (LS, LH, LK), "extra3d": None},
+        ExerciseKind.CRUNCH: {"main": (LS, LH, LK), "extra3d": None},
+    })
+
+
+# 各运动类型姿势校验所需的关键点下标数组与要求朝向，
+# 由 _ensure_deps() 在 mediapipe 加载后填充一次，免去每帧重建列表
+_KEY_POINTS: Dict[int, np.ndarray] = {}
+_FACING: Dict[int, str] = {}
+
+def _build_valid_pose_specs(pose_landmark) -> None:
+    """预计算 _is_valid_pose 每帧需要的关键点下标与朝向要求"""
+    LS, LE, LW = pose_landmark.LEFT_SHOULDER.value, pose_landmark.LEFT_ELBOW.value, pose_landmark.LEFT_WRIST.value
+    LH, LK, LA = pose_landmark.LEFT_HIP.value, pose_landmark.LEFT_KNEE.value, pose_landmark.LEFT_ANKLE.value
+    RS, RH, RA = pose_landmark.RIGHT_SHOULDER.value, pose_landmark.RIGHT_HIP.value, pose_landmark.RIGHT_ANKLE.value
+
+    _KEY_POINTS.update({
+        ExerciseKind.SQUAT: np.array([LH, LK, LA]),
+        ExerciseKind.PUSHUP: np.array([LS, LE, LW, LH]),
+        ExerciseKind.SITUP: np.array([LS, LH, LK]),
+        ExerciseKind.CRUNCH: np.array([LS, LH, LK]),
+        ExerciseKind.JUMPING_JACK: np.array([LS, LH, LA, RS, RH, RA]),
+    })
+    _FACING.update({
+        ExerciseKind.SQUAT: 'left',
+        ExerciseKind.PUSHUP: 'left',
+        ExerciseKind.SITUP: 'left',
+        ExerciseKind.CRUNCH: 'left',
+        ExerciseKind.JUMPING_JACK: 'front',
+    })
+
+# 姿势稳定性检查阈值 (模块级常量，避免每帧重建 dict)
+_STABILITY_THRESHOLDS = {
+    'shoulder_diff': 0.1,
+    'hip_diff': 0.1,
+    'ankle_diff': 0.1,
+    'shoulder_depth': 1.0,
+    'hip_depth': 1.0,
+    'ankle_y_diff': 0.1,
+    'knee_y_diff': 0.1
+}
+
+# --- 形态错误编码 ---
+# 错误类型用整数编码：逐帧的持续计数在定长 int16 数组上按下标累加，
+# 避免每帧对中文字符串做哈希；只在错误被确认时才转换回显示文本
+class FormError(IntEnum):
+    KNEE_VALGUS = 0       # 膝盖内扣
+    KNEE_VARUS = 1        # 膝盖外翻
+    WEIGHT_TOO_BACK = 2   # 重心过于靠后
+    WEIGHT_TOO_FORWARD = 3  # 重心过于靠前
+    SHOULDER_SAG = 4      # 肩部下沉
+    HIP_SAG = 5           # 臀部下沉
+    HIP_RAISED = 6        # 臀部抬高
+    TORSO_TWIST = 7       # 躯干扭转
+    HEAD_FLEXION = 8      # 头部前屈
+
+_FORM_ERROR_TEXTS = ("膝盖内扣", "膝盖外翻", "重心过于靠后", "重心过于靠前",
+                     "肩部下沉", "臀部下沉", "臀部抬高", "躯干扭转", "头部前屈")
+
+# _check_form_errors 每帧复用的候选错误 scratch 列表 (分析循环单线程访问，
+# 每帧开头清空)；每帧错误数有上界，复用避免反复分配列表对象
+# 标注颜色的整数下标 (对应 config.COLOR_INDEX / image_utils 的 LUT)，
+# 热路径逐条标注不再做颜色名字符串哈希
+_CLR_RED = COLOR_INDEX["red"]
+_CLR_YELLOW = COLOR_INDEX["yellow"]
+_CLR_PURPLE = COLOR_INDEX["purple"]
+
+_errors_scratch: List[Tuple[int, Optional[Tuple[float, float]], int]] = []
+
+# 帧间角度变化低于该值 (度) 时跳过动作状态机，量级取自 MediaPipe
+# 关键点的噪声底 (开合跳的"角度"是归一化宽度，不适用该阈值)
+_MOTION_EPS_DEG = 0.5
+
+# 逐帧调试输出开关：热路径的调试打印默认关闭 (30fps 下每帧的 f-string
+# 构造加 stdout 刷新开销可观)，排查时置 True 并把日志级别调到 DEBUG
+_DEBUG = False
+_log = logging.getLogger(__name__)
+
+# 非开合跳运动的状态机配置：角度阈值、阶段名与 (区域, 事件) -> 反馈文本。
+# 原先阈值选择和反馈选择是两串按运动类型重复的 if/elif 阶梯，每帧都要
+# 走一遍；现在折叠成一次查表，反馈文本也只在模块加载时构造一次
+_MOTION_CFG = {
+    ExerciseKind.SQUAT: {
+        "upper": 170,  # 站立时膝盖角度阈值
+        "lower": 155,  # 深蹲底部膝盖角度阈值
+        "stages": ("stand", "squat"),
+        "fb": {
+            ("a", "enter"): "站姿识别成功，可以下蹲",
+            ("a", "hold"): "准备开始深蹲",
+            ("b", "count"): "深蹲完成！",
+            ("b", "hold"): "下蹲姿势良好",
+            ("mid", "from_a"): "继续下蹲",
+            ("mid", "from_b"): "回到站立位置",
+        },
+    },
+    ExerciseKind.PUSHUP: {
+        "upper": 160,  # 起始位置肘部角度阈值
+        "lower": 90,   # 底部肘部角度阈值
+        "stages": ("up", "down"),
+        "fb": {
+            ("a", "enter"): "准备下压，保持手肘贴近身体",
+            ("a", "hold"): "准备下压，保持身体平直",
+            ("b", "count"): "标准俯卧撑，继续保持！",
+            ("b", "hold"): "保持住，确保身体平直",
+            ("mid", "from_a"): "继续下压，保持手肘贴近身体",
+            ("mid", "from_b"): "回到起始位置，挺胸收腹",
+        },
+    },
+    ExerciseKind.SITUP: {
+        "upper": 100,  # 起始位置躯干角度阈值
+        "lower": 85,   # 收缩位置躯干角度阈值
+        "stages": ("down", "up"),
+        "fb": {
+            ("a", "enter"): "准备起身，收紧腹肌",
+            ("a", "hold"): "收紧腹肌，准备起身",
+            ("b", "count"): "标准仰卧起坐！",
+            ("b", "hold"): "保持住，充分收缩腹肌",
+            ("mid", "from_a"): "继续用力，抬高上半身",
+            ("mid", "from_b"): "慢慢放低身体，准备下一个",
+        },
+    },
+}
+# 卷腹与仰卧起坐共用同一套阈值和反馈
+_MOTION_CFG[ExerciseKind.CRUNCH] = _MOTION_CFG[ExerciseKind.SITUP]
+
+# --- 环形缓冲区 ---
+class _RingBuffer:
+    """定长 float32 环形缓冲区，替代 deque 做角度/坐标平滑。
+
+    预分配一次、push 只写一个标量，均值/最值统计直接在 NumPy 数组上完成，
+    避免 deque 逐帧的 Python float 装箱和迭代。
+    """
+    __slots__ = ("_buf", "_idx", "_len")
+
+    def __init__(self, size: int):
+        self._buf = np.zeros(size, dtype=np.float32)
+        self._idx = 0
+        self._len = 0
+
+    def push(self, value: float) -> None:
+        self._buf[self._idx] = value
+        self._idx = (self._idx + 1) % len(self._buf)
+        if self._len < len(self._buf):
+            self._len += 1
+
+    def __len__(self) -> int:
+        return self._len
+
+    @property
+    def full(self) -> bool:
+        return self._len == len(self._buf)
+
+    def mean_recent(self, k: int) -> float:
+        """最近 k 个值的均值"""
+        k = min(k, self._len)
+        start = (self._idx - k) % len(self._buf)
+        if start + k <= len(self._buf):
+            return float(self._buf[start:start + k].mean())
+        head = self._buf[start:]
+        tail = self._buf[:k - len(head)]
+        return float((head.sum() + tail.sum()) / k)
+
+    def min(self) -> float:
+        return float(self._buf[:self._len].min())
+
+    def max(self) -> float:
+        return float(self._buf[:self._len].max())
 
 # --- 二维距离函数 ---
 def distance_2d(p1, p2):
@@ -121,7 +356,7 @@ def distance_2d(p1, p2):
 # 核心分析函数
 # =====================
 
-def analyze_exercise_video(video_path: str, exercise_type: str, debug_show_video: bool = False) -> Dict[str, Any]:
+def analyze_exercise_video(video_path: str, exercise_type: str, debug_show_video: bool = False, model_complexity: int = 0, frame_range: Optional[Tuple[int, int]] = None, generate_report: bool = True, report_dir: Optional[str] = None) -> Dict[str, Any]:
     """
     分析给定的视频文件，识别特定运动的次数和错误。
 
@@ -129,6 +364,13 @@ def analyze_exercise_video(video_path: str, exercise_type: str, debug_show_video
         video_path (str): 视频文件的路径。
         exercise_type (str): 运动类型 (e.g., 'squat', 'pushup').
         debug_show_video (bool): 是否显示带有调试信息的视频窗口。
+        model_complexity (int): MediaPipe Pose 模型复杂度 (0/1/2)。默认 0
+            (约快一倍)，连续低可见度帧会自动升级到 1。
+        frame_range (Optional[Tuple[int, int]]): 只分析 [start, end) 帧区间，
+            供 analyze_exercise_video_parallel 的分片工作进程使用。
+        generate_report (bool): 是否在结束时导出 HTML 报告 (分片模式关闭)。
+        report_dir (str, optional): 报告输出目录；调用方 (如工具层) 指定
+            最终目录后报告只写盘一次，省掉事后的整文件拷贝。
 
     Returns:
         Dict[str, Any]: 包含分析结果的字典，例如:
@@ -159,27 +401,63 @@ def analyze_exercise_video(video_path: str, exercise_type: str, debug_show_video
         "error_details": None
     }
 
+    # 延迟加载 cv2/mediapipe 等重型依赖 (首次分析时加载，之后直接复用)
+    try:
+        _ensure_deps()
+    except ImportError as e:
+        print(f"错误：无法导入必要的本地模块: {e}")
+        print("请确保已安装 opencv-python/mediapipe，且 image_utils.py, training_stats.py 在同一目录下或Python路径中")
+        results["message"] = "错误：缺少视频分析依赖"
+        results["error_details"] = str(e)
+        return results
+
     if not os.path.exists(video_path):
         results["message"] = "错误：视频文件未找到"
         results["error_details"] = f"路径不存在: {video_path}"
         print(results["message"])
         return results
 
-    if exercise_type not in EXERCISE_NAMES:
+    # 入口处把运动类型字符串一次性转成枚举，无效类型在这里立即被拦截
+    try:
+        exercise_kind = ExerciseKind[exercise_type.upper()]
+    except KeyError:
         results["message"] = "错误：不支持的运动类型"
         results["error_details"] = f"未知类型: {exercise_type}"
         print(results["message"])
         return results
 
-    exercise_name = EXERCISE_NAMES[exercise_type]
-    stats = TrainingStats(exercise_type) # 用于记录和报告
+    exercise_name = EXERCISE_NAMES_ARR[exercise_kind]
+    stats = TrainingStats(exercise_type, report_dir=report_dir) # 用于记录和报告
 
     # MediaPipe 初始化
     mp_pose = mp.solutions.pose
     mp_drawing = mp.solutions.drawing_utils
 
-    # 视频读取
-    cap = cv2.VideoCapture(video_path)
+    # 新版 Tasks API (PoseLandmarker, VIDEO 模式)：走 XNNPACK 加速路径且
+    # 支持帧时间戳，推理比 legacy mp.solutions.pose 快约 1.3-2 倍。
+    # 模型资产 (.task 文件) 存在时优先使用，否则回退 legacy API
+    task_model_path = os.environ.get(
+        "POSE_LANDMARKER_MODEL",
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "pose_landmarker.task")
+    )
+    use_tasks_api = os.path.exists(task_model_path)
+
+    # 视频读取：优先请求硬件解码 (FFmpeg 后端)，HD H.264 软解可占 20-40% CPU。
+    # 部分 opencv-python 构建缺少硬件加速常量或打开失败时回退软解
+    cap = None
+    try:
+        cap = cv2.VideoCapture(
+            video_path, cv2.CAP_FFMPEG,
+            [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY]
+        )
+        if not cap.isOpened():
+            cap.release()
+            cap = None
+    except (AttributeError, cv2.error) as e_hw:
+        print(f"硬件解码不可用，使用软件解码: {e_hw}")
+        cap = None
+    if cap is None:
+        cap = cv2.VideoCapture(video_path)
     if not cap.isOpened():
         results["message"] = "错误：无法打开视频文件"
         results["error_details"] = f"无法打开: {video_path}"
@@ -193,16 +471,29 @@ def analyze_exercise_video(video_path: str, exercise_type: str, debug_show_video
     results["total_frames"] = total_frames
     print(f"视频信息: {frame_width}x{frame_height} @ {fps:.2f} FPS, 总帧数: {total_frames}")
 
+    # 帧区间模式：并行分片时每个工作进程只处理自己的 [start, end) 区间
+    seg_start, seg_limit = 0, None
+    if frame_range is not None:
+        seg_start = max(0, int(frame_range[0]))
+        seg_limit = int(frame_range[1]) if total_frames <= 0 else min(total_frames, int(frame_range[1]))
+        if seg_start > 0:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, seg_start)
+        print(f"分片模式: 分析帧区间 [{seg_start}, {seg_limit})")
+
     # 分析状态变量
     counter = 0
     stage = None
     feedback = ""
     angle = 0.0
     last_angle = None
-    angle_buffer = deque(maxlen=MAX_BUFFER_SIZE)
-    error_buffer = {} # 每个错误类型的持续帧数
-    detected_errors_log = {} # 记录检测到的错误详情 {"错误类型": {"count": N, "first_timestamp": T}}
-    hip_y_history = deque(maxlen=7) # 用于深蹲膝盖检查
+    angle_buffer = _RingBuffer(MAX_BUFFER_SIZE)
+    error_buffer = np.zeros(len(_FORM_ERROR_TEXTS), dtype=np.int16) # 按 FormError 下标的持续帧数
+    detected_errors_log = {} # 记录检测到的错误详情 {FormError: {"type": 文本, "count": N, "first_timestamp": T}}
+    hip_y_history = _RingBuffer(7) # 用于深蹲膝盖检查
+    frame_cache = {} # 量化关键点 -> (姿势校验, 角度) 结果缓存
+    FRAME_CACHE_MAX = 256
+    stats_record_buffer = [] # 确认错误先缓冲在本地，批量回写 stats (调试模式除外)
+    last_count_print_t = 0.0 # 计数打印节流 (慢速终端上 \r 刷新开销可观)
 
     # 调试窗口设置
     window_name = f"FitMirror Analysis - {exercise_name}"
@@ -215,111 +506,305 @@ def analyze_exercise_video(video_path: str, exercise_type: str, debug_show_video
     processed_frames = 0
     start_time = time.time()
 
-    # --- MediaPipe Pose 模型 ---
-    with mp_pose.Pose(
-        min_detection_confidence=0.5, # 提高置信度要求
-        min_tracking_confidence=0.5,
-        model_complexity=1 # 0, 1, 2 -> 速度与精度权衡
-    ) as pose:
-        while cap.isOpened():
+    # 跨帧采样：高帧率视频相邻帧差异极小，按目标分析帧率计算采样步长，
+    # 非采样帧只 cap.grab() (跳过解码和推理)，计数 15fps 已经足够
+    stride = max(1, int(round(fps / TARGET_ANALYSIS_FPS))) if fps > 0 else 1
+    if stride > 1:
+        print(f"跨帧采样: 每 {stride} 帧分析一帧 (源 {fps:.0f}fps -> 约 {fps/stride:.0f}fps)")
+
+    # 自适应跳帧状态：pose.process 是视频分析中开销最大的一步，慢动作的保持
+    # 阶段相邻帧姿态几乎不变。帧间运动量低于阈值时直接复用上一帧的检测结果
+    prev_probe = None       # 上一帧的 64x64 灰度缩略图，用于帧差
+    pose_results = None     # 上一帧的 MediaPipe 检测结果，低运动量时复用
+    skipped_inferences = 0  # 复用次数统计
+
+    # 送入 MediaPipe 前的等比降采样尺寸 (landmark 为归一化坐标，不受缩放影响)。
+    # 按短边计算缩放比，竖屏手机视频 (1080x1920) 不会被过度缩小
+    infer_size = None
+    short_side = min(frame_width, frame_height)
+    if short_side > POSE_INPUT_MAX_HEIGHT:
+        scale = POSE_INPUT_MAX_HEIGHT / short_side
+        infer_size = (int(frame_width * scale), int(frame_height * scale))
+
+    # 预分配帧处理缓冲区：视频内帧尺寸固定，resize/cvtColor 通过 dst=
+    # 复用同一块内存，避免每帧都为中间结果新分配大数组。
+    # 灰度探针用双缓冲，保证 prev_probe 在写入新探针时仍然有效
+    probe_bgr = np.empty((64, 64, 3), dtype=np.uint8)
+    probe_bufs = (np.empty((64, 64), dtype=np.uint8), np.empty((64, 64), dtype=np.uint8))
+    probe_idx = 0
+    infer_buf = np.empty((infer_size[1], infer_size[0], 3), dtype=np.uint8) if infer_size else None
+    rgb_buf = np.empty((infer_size[1], infer_size[0], 3) if infer_size else (frame_height, frame_width, 3),
+                       dtype=np.uint8)
+
+    # --- 解码线程 (生产者) ---
+    # cap.read 的磁盘读取/解码与姿态推理流水线重叠，解码延迟隐藏在推理时间后。
+    # 有界队列限制内存占用；跨帧采样的 grab/read 逻辑也在解码线程内完成
+    frame_queue = queue.Queue(maxsize=4)
+    stop_decoding = threading.Event()
+
+    def _decode_frames():
+        n = seg_start
+        while not stop_decoding.is_set():
+            if seg_limit is not None and n >= seg_limit:
+                break
+            # 非采样帧仅 grab (不解码)，帧计数照常推进
+            if stride > 1 and n % stride != 0:
+                if not cap.grab():
+                    break
+                n += 1
+                continue
             ret, frame = cap.read()
             if not ret:
+                break
+            n += 1
+            while not stop_decoding.is_set():
+                try:
+                    frame_queue.put((n, frame), timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+        # EOF 哨兵
+        while not stop_decoding.is_set():
+            try:
+                frame_queue.put(None, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+
+    decoder_thread = threading.Thread(target=_decode_frames, daemon=True, name="video-decoder")
+    decoder_thread.start()
+
+    # --- MediaPipe Pose 模型 (消费者) ---
+    # 默认 complexity=0：取景良好的健身视频上与 1 档精度几乎无差、推理约快一倍。
+    # 连续多帧关键点可见度偏低时一次性升级到 complexity=1
+    LOW_VIS_THRESHOLD = 0.6
+    LOW_VIS_ESCALATE_FRAMES = 15
+    low_vis_streak = 0
+
+    landmarker = None
+    if use_tasks_api:
+        try:
+            from mediapipe.tasks import python as mp_tasks
+            from mediapipe.tasks.python import vision as mp_vision
+            # GPU delegate 按需启用 (POSE_DELEGATE=gpu)：并非所有主机都有
+            # 可用的 GPU 推理后端，默认仍走 CPU/XNNPACK
+            delegate = (mp_tasks.BaseOptions.Delegate.GPU
+                        if os.environ.get("POSE_DELEGATE", "").lower() == "gpu"
+                        else mp_tasks.BaseOptions.Delegate.CPU)
+            landmarker = mp_vision.PoseLandmarker.create_from_options(
+                mp_vision.PoseLandmarkerOptions(
+                    base_options=mp_tasks.BaseOptions(model_asset_path=task_model_path,
+                                                      delegate=delegate),
+                    running_mode=mp_vision.RunningMode.VIDEO,
+                    min_pose_detection_confidence=0.5,
+                    min_tracking_confidence=0.5
+                )
+            )
+            print(f"使用 MediaPipe Tasks PoseLandmarker: {task_model_path}")
+        except Exception as e:
+            print(f"PoseLandmarker 初始化失败，回退 legacy Pose API: {e}")
+            use_tasks_api = False
+            landmarker = None
+
+    # Tasks 模式下模型由 .task 资产决定，复杂度升级只适用于 legacy 路径
+    escalated = model_complexity >= 1 or use_tasks_api
+
+    pose = None
+    if not use_tasks_api:
+        pose = mp_pose.Pose(
+            min_detection_confidence=0.5, # 提高置信度要求
+            min_tracking_confidence=0.5,
+            model_complexity=model_complexity # 0, 1, 2 -> 速度与精度权衡
+        )
+
+    def _escalate_if_needed():
+        """低可见度/漏检帧计数，达到阈值时换用更高复杂度的模型 (只升一次)"""
+        nonlocal pose, escalated, low_vis_streak
+        low_vis_streak += 1
+        if not escalated and low_vis_streak >= LOW_VIS_ESCALATE_FRAMES:
+            print("\n关键点可见度持续偏低，升级到 model_complexity=1")
+            pose.close()
+            pose = mp_pose.Pose(
+                min_detection_confidence=0.5,
+                min_tracking_confidence=0.5,
+                model_complexity=1
+            )
+            escalated = True
+            low_vis_streak = 0
+
+    try:
+        while True:
+            item = frame_queue.get()
+            if item is None:
                 print("\n视频处理完成或读取结束.")
                 break
 
-            processed_frames += 1
+            processed_frames, frame = item
             current_time_sec = processed_frames / fps if fps > 0 else 0
 
             # --- 帧处理 ---
-            # 降低处理频率以提高性能 (可选)
-            # if processed_frames % PROCESS_EVERY_N_FRAMES != 0:
-            #     if debug_show_video and 'image' in locals(): # 显示上一帧处理结果
-            #          cv2.imshow(window_name, image)
-            #          if cv2.waitKey(1) & 0xFF == ord('q'): break
-            #     continue
-
-            # 转换颜色空间 BGR -> RGB
-            image_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            image_rgb.flags.writeable = False # 提高性能
-
-            # 进行姿态检测
-            pose_results = pose.process(image_rgb)
+            # 自适应跳帧：用 64x64 灰度帧差估算运动量，低运动量帧复用上一帧姿态
+            probe = probe_bufs[probe_idx]
+            cv2.resize(frame, (64, 64), dst=probe_bgr)
+            cv2.cvtColor(probe_bgr, cv2.COLOR_BGR2GRAY, dst=probe)
+            low_motion = False
+            if prev_probe is not None and pose_results is not None and pose_results.pose_landmarks:
+                motion = float(cv2.absdiff(probe, prev_probe).mean())
+                low_motion = motion < MOTION_SKIP_THRESHOLD
+            prev_probe = probe
+            probe_idx ^= 1
+
+            if low_motion:
+                skipped_inferences += 1  # 复用上一帧的 pose_results
+            else:
+                # 推理前等比降采样并转换颜色空间 BGR -> RGB
+                # INTER_AREA 是缩小图像时质量最好的插值方式
+                if infer_buf is not None:
+                    cv2.resize(frame, infer_size, dst=infer_buf, interpolation=cv2.INTER_AREA)
+                    infer_frame = infer_buf
+                else:
+                    infer_frame = frame
+                rgb_buf.flags.writeable = True
+                cv2.cvtColor(infer_frame, cv2.COLOR_BGR2RGB, dst=rgb_buf)
+                rgb_buf.flags.writeable = False # 提高性能
+
+                # 进行姿态检测
+                if use_tasks_api:
+                    # VIDEO 模式要求单调递增的毫秒时间戳
+                    timestamp_ms = int(current_time_sec * 1000) if fps > 0 else processed_frames
+                    task_result = landmarker.detect_for_video(
+                        mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb_buf), timestamp_ms
+                    )
+                    # 适配成 legacy 结果形状，下游 landmark 访问不变
+                    pose_results = SimpleNamespace(
+                        pose_landmarks=SimpleNamespace(landmark=task_result.pose_landmarks[0])
+                        if task_result.pose_landmarks else None
+                    )
+                else:
+                    pose_results = pose.process(rgb_buf)
 
-            # 转换回 BGR 以便 OpenCV 绘制
-            image_bgr = cv2.cvtColor(image_rgb, cv2.COLOR_RGB2BGR)
-            image_bgr.flags.writeable = True
+            # 原始分辨率帧用于 OpenCV 绘制
+            image_bgr = frame
 
             # --- 姿态分析 ---
             if pose_results.pose_landmarks:
                 landmarks = pose_results.pose_landmarks.landmark
+                # 每帧一次性转成 (33,4) 数组 (x,y,z,visibility)，后续辅助函数
+                # 都按整数下标读取，不再逐属性访问 Python landmark 对象
+                lm = _landmarks_to_array(landmarks)
+
+                # 低可见度监测：连续偏低则升级模型复杂度
+                if not escalated:
+                    if float(lm[:, 3].mean()) < LOW_VIS_THRESHOLD:
+                        _escalate_if_needed()
+                    else:
+                        low_vis_streak = 0
+
+                # 单帧分析的统一异常保护：辅助函数内部不再各自包
+                # try/except (热路径去掉 SETUP_FINALLY 开销)，任何一帧
+                # 的分析失败只跳过该帧的状态更新，不终止整个视频
+                try:
+                    # 近邻帧结果缓存：相邻帧关键点位移通常 <1% 图像宽度，把坐标
+                    # 量化到 1/64 作为键，命中时直接复用姿势校验与角度结果
+                    # (两者都是纯函数)。_check_form_errors 依赖逐帧错误持续计数
+                    # 等状态，不参与缓存
+                    frame_key = (lm[:, :2] * 64).astype(np.int16).tobytes()
+                    cached = frame_cache.get(frame_key)
+                    if cached is None:
+                        valid_pose, pose_feedback = _is_valid_pose(lm, mp_pose, exercise_kind)
+                        current_angle, additional_angles = _calculate_angles(lm, mp_pose, exercise_kind)
+                        if len(frame_cache) >= FRAME_CACHE_MAX:
+                            frame_cache.clear()  # 定期整体清空，限制内存
+                        frame_cache[frame_key] = (valid_pose, pose_feedback, current_angle, additional_angles)
+                    else:
+                        valid_pose, pose_feedback, current_angle, additional_angles = cached
 
-                valid_pose, pose_feedback = _is_valid_pose(landmarks, mp_pose, exercise_type)
-                form_valid, form_feedback, error_annotations = _check_form_errors(
-                    landmarks, mp_pose, exercise_type, hip_y_history, error_buffer, current_time_sec, detected_errors_log
-                )
-
-                current_angle, additional_angles = _calculate_angles(landmarks, mp_pose, exercise_type)
-
-                # 修改：尝试进行运动分析，即使姿势不完全有效（只要能计算角度）
-                if current_angle is not None:
-                    new_stage, should_count, motion_feedback, smoothed_angle = _analyze_exercise_motion(
-                        landmarks, mp_pose, exercise_type, stage, angle_buffer,
-                        last_angle, current_angle, additional_angles
+                    form_valid, form_feedback, error_annotations, new_confirmed_errors = _check_form_errors(
+                        lm, mp_pose, exercise_kind, hip_y_history, error_buffer, current_time_sec, detected_errors_log,
+                        collect_annotations=debug_show_video, geom=additional_angles
                     )
-                    stage = new_stage
-                    angle = smoothed_angle
-                    last_angle = smoothed_angle
+
+                    # 修改：尝试进行运动分析，即使姿势不完全有效（只要能计算角度）
+                    if current_angle is not None:
+                        # 慢速保持阶段角度几乎不变，跳过状态机 (不会改变 stage 或
+                        # 触发计数)；仍推入平滑缓冲，保证后续平滑一致
+                        if (stage is not None and last_angle is not None
+                                and exercise_kind != ExerciseKind.JUMPING_JACK
+                                and abs(current_angle - last_angle) < _MOTION_EPS_DEG):
+                            angle_buffer.push(current_angle)
+                            new_stage, should_count, motion_feedback, smoothed_angle = stage, False, feedback, current_angle
+                        else:
+                            new_stage, should_count, motion_feedback, smoothed_angle = _analyze_exercise_motion(
+                                lm, mp_pose, exercise_kind, stage, angle_buffer,
+                                last_angle, current_angle, additional_angles
+                            )
+                        stage = new_stage
+                        angle = smoothed_angle
+                        last_angle = smoothed_angle
                     
-                    # 如果姿势有效，使用运动反馈；否则使用姿势反馈
-                    if valid_pose:
-                        feedback = motion_feedback
-                    else:
-                        feedback = f"{pose_feedback} ({motion_feedback})"
+                        # 如果姿势有效，使用运动反馈；否则使用姿势反馈
+                        if valid_pose:
+                            feedback = motion_feedback
+                        else:
+                            feedback = f"{pose_feedback} ({motion_feedback})"
 
-                    if should_count:
-                        # 修改：无论动作是否正确，只要完成运动周期就计数
-                        counter += 1
-                        stats.update_count()
-                        
-                        # 添加质量指标数据，根据动作正确性和姿势有效性调整评分
-                        pose_penalty = 0 if valid_pose else 10
-                        form_penalty = 0 if form_valid else len(error_annotations) * 10
-                        standard_score = max(50, 90 - pose_penalty - form_penalty)
-                        stability_score = 85 if abs(smoothed_angle - (last_angle or smoothed_angle)) < 5 else 75
-                        depth_score = _calculate_depth_score(exercise_type, smoothed_angle, additional_angles)
-                        
-                        stats.add_quality_metrics(standard_score, stability_score, depth_score)
+                        if should_count:
+                            # 修改：无论动作是否正确，只要完成运动周期就计数
+                            counter += 1
+
+                            # 添加质量指标数据，根据动作正确性和姿势有效性调整评分
+                            pose_penalty = 0 if valid_pose else 10
+                            form_penalty = 0 if form_valid else len(error_annotations) * 10
+                            standard_score = max(50, 90 - pose_penalty - form_penalty)
+                            stability_score = 85 if abs(smoothed_angle - (last_angle or smoothed_angle)) < 5 else 75
+                            depth_score = _calculate_depth_score(exercise_kind, smoothed_angle, additional_angles)
+
+                            # 计数 + 质量指标合并为一次 stats 调用
+                            stats.add_rep(standard_score, stability_score, depth_score)
                         
-                        if valid_pose and form_valid:
-                            feedback = f"{motion_feedback} ({counter})"
-                        elif valid_pose and not form_valid:
-                            feedback = f"动作完成但有错误: {form_feedback} ({counter})"
-                        else:
-                            feedback = f"动作完成但姿势不佳: {pose_feedback} ({counter})"
-                        print(f"\r计数: {counter}", end="")
-
-                    # 优先显示错误反馈（如果有的话）
-                    if not form_valid and error_annotations:
-                        feedback = form_feedback
-                        # 记录错误到 stats - 修复：避免重复记录，只记录新确认的错误
-                        new_confirmed_errors = []
-                        for error_text, pos, color in error_annotations:
-                            if error_text in error_buffer and error_buffer[error_text] == ERROR_PERSISTENCE:
-                                new_confirmed_errors.append((error_text, pos, color))
-                        if new_confirmed_errors:
-                            stats.add_record(new_confirmed_errors)
-                    elif not valid_pose:
-                        # 如果姿势无效但没有具体的形态错误，显示姿势问题
-                        feedback = pose_feedback
-
-                else: # 无法计算角度
-                    feedback = "无法识别动作，请调整位置"
-                    angle = 0.0
+                            if valid_pose and form_valid:
+                                feedback = f"{motion_feedback} ({counter})"
+                            elif valid_pose and not form_valid:
+                                feedback = f"动作完成但有错误: {form_feedback} ({counter})"
+                            else:
+                                feedback = f"动作完成但姿势不佳: {pose_feedback} ({counter})"
+                            # 节流控制台输出：\r 刷新在慢速终端 (Jupyter/Windows cmd)
+                            # 上每次可达数百微秒，最多每 0.25 秒更新一次
+                            now = time.monotonic()
+                            if now - last_count_print_t > 0.25:
+                                print(f"\r计数: {counter}", end="")
+                                last_count_print_t = now
+
+                        # 优先显示错误反馈（如果有的话）
+                        if not form_valid and error_annotations:
+                            feedback = form_feedback
+                            # 记录错误到 stats - 只记录本帧新确认的错误，避免重复记录
+                            if new_confirmed_errors:
+                                if debug_show_video:
+                                    # 调试模式立即写入，保证语音提示实时
+                                    stats.add_record(new_confirmed_errors)
+                                else:
+                                    stats_record_buffer.append(new_confirmed_errors)
+                                    if len(stats_record_buffer) >= 128:
+                                        stats.extend_records(stats_record_buffer)
+                                        stats_record_buffer.clear()
+                        elif not valid_pose:
+                            # 如果姿势无效但没有具体的形态错误，显示姿势问题
+                            feedback = pose_feedback
+
+                    else: # 无法计算角度
+                        feedback = "无法识别动作，请调整位置"
+                        angle = 0.0
+
+                except Exception as e:
+                    print(f"帧分析异常: {e}")
+                    feedback = "帧分析异常"
+                    error_annotations = []
 
                 # --- 调试信息绘制 (如果启用) ---
                 if debug_show_video:
                     # 绘制骨架
-                    image_bgr = draw_skeleton_lines(image_bgr, landmarks, mp_pose, exercise_type)
+                    image_bgr = draw_skeleton_lines(image_bgr, lm, exercise_type)
                     # 绘制错误标注
                     if error_annotations:
                         image_bgr = draw_error_annotations(image_bgr, error_annotations, COLOR_MAP)
@@ -327,22 +812,25 @@ def analyze_exercise_video(video_path: str, exercise_type: str, debug_show_video
                     progress = (processed_frames / total_frames * 100) if total_frames > 0 else None
                     # 计算臀部像素距离
                     if processed_frames == 1:
-                        left_hip = _get_landmark(landmarks, mp_pose.PoseLandmark.LEFT_HIP)
-                        right_hip = _get_landmark(landmarks, mp_pose.PoseLandmark.RIGHT_HIP)
-                        hip_pixel_distance = 0
-                        if left_hip and right_hip:
-                            hip_pixel_distance = distance_2d([left_hip.x * frame_width, left_hip.y * frame_height], [right_hip.x * frame_width, right_hip.y * frame_height])
+                        px_scale = np.array([frame_width, frame_height], dtype=np.float32)
+                        hip_pixel_distance = float(np.linalg.norm(
+                            (lm[_LM.LEFT_HIP, :2]
+                             - lm[_LM.RIGHT_HIP, :2]) * px_scale
+                        ))
 
                     # 绘制 UI 元素，传递臀部像素距离
                     image_bgr, _ = draw_ui_elements(image_bgr, counter, angle, feedback, progress, hip_pixel_distance)
-                    # 绘制原始骨骼点
-                    mp_drawing.draw_landmarks(
-                        image_bgr, pose_results.pose_landmarks, mp_pose.POSE_CONNECTIONS,
-                        mp_drawing.DrawingSpec(color=(245,117,66), thickness=2, circle_radius=2),
-                        mp_drawing.DrawingSpec(color=(245,66,230), thickness=2, circle_radius=2)
-                    )
+                    # 绘制原始骨骼点 (Tasks 结果不是 protobuf，跳过 legacy 绘制)
+                    if not use_tasks_api:
+                        mp_drawing.draw_landmarks(
+                            image_bgr, pose_results.pose_landmarks, mp_pose.POSE_CONNECTIONS,
+                            mp_drawing.DrawingSpec(color=(245,117,66), thickness=2, circle_radius=2),
+                            mp_drawing.DrawingSpec(color=(245,66,230), thickness=2, circle_radius=2)
+                        )
             else:
-                # 未检测到姿势
+                # 未检测到姿势 (漏检帧同样计入低可见度升级判断)
+                if not escalated:
+                    _escalate_if_needed()
                 feedback = "未检测到人体"
                 if debug_show_video:
                     image_bgr, _ = draw_ui_elements(image_bgr, counter, 0, feedback, None)
@@ -351,29 +839,50 @@ def analyze_exercise_video(video_path: str, exercise_type: str, debug_show_video
             # --- 显示调试窗口 ---
             if debug_show_video:
                 cv2.imshow(window_name, image_bgr)
-                if cv2.waitKey(1) & 0xFF == ord('q'):
+                # waitKey(1) 实际会阻塞约 1ms 以上，每 4 帧才调用一次；
+                # 其余帧用非阻塞的 pollKey (OpenCV >= 4.5，缺失时退回 waitKey)
+                if processed_frames & 3 == 0 or not hasattr(cv2, "pollKey"):
+                    key = cv2.waitKey(1)
+                else:
+                    key = cv2.pollKey()
+                if key & 0xFF == ord('q'):
                     print("\n用户手动停止调试窗口.")
                     break
 
+    finally:
+        if pose is not None:
+            pose.close()
+        if landmarker is not None:
+            landmarker.close()
+
     # --- 清理和收尾 ---
+    # 先停解码线程再释放 cap (cap 只被解码线程读取)
+    stop_decoding.set()
+    decoder_thread.join(timeout=2.0)
     cap.release()
     if debug_show_video:
         cv2.destroyAllWindows()
 
+    # 落盘剩余缓冲的错误记录
+    if stats_record_buffer:
+        stats.extend_records(stats_record_buffer)
+        stats_record_buffer.clear()
+
     end_time = time.time()
     duration = end_time - start_time
     print(f"\n分析结束. 总耗时: {duration:.2f} 秒.")
-    print(f"总帧数: {total_frames}, 处理帧数: {processed_frames}")
+    print(f"总帧数: {total_frames}, 处理帧数: {processed_frames}, 跳过推理帧数: {skipped_inferences}")
     print(f"最终计数: {counter}")
 
-    # 生成报告
-    try:
-        report_path = stats.export_report()
-        results["report_path"] = report_path
-        print(f"分析报告已生成: {report_path}")
-    except Exception as e:
-        print(f"生成报告时出错: {e}")
-        results["report_path"] = None
+    # 生成报告 (分片工作进程跳过，由上层合并结果)
+    if generate_report:
+        try:
+            report_path = stats.export_report()
+            results["report_path"] = report_path
+            print(f"分析报告已生成: {report_path}")
+        except Exception as e:
+            print(f"生成报告时出错: {e}")
+            results["report_path"] = None
 
 
     # 整理错误日志
@@ -386,48 +895,124 @@ def analyze_exercise_video(video_path: str, exercise_type: str, debug_show_video
 
     return results
 
-def _calculate_depth_score(exercise_type: str, angle: float, additional_angles: Dict[str, float]) -> float:
-    """根据运动类型和角度计算动作深度得分"""
-    if exercise_type == "squat":
-        # 深蹲：膝盖角度越小（蹲得越深），得分越高
-        if angle < 90:
-            return 100  # 深蹲到位
-        elif angle < 120:
-            return 90  # 较好深度
-        elif angle < 140:
-            return 80  # 一般深度
-        else:
-            return 70  # 深度不够
-            
-    elif exercise_type == "pushup":
-        # 俯卧撑：手肘角度越小（下压越深），得分越高
-        if angle < 90:
-            return 90
-        elif angle < 120:
-            return 80
-        else:
-            return 70
-            
-    elif exercise_type in ["situp", "crunch"]:
-        # 仰卧起坐/卷腹：角度越小（起身越高），得分越高
-        if angle < 80:
-            return 90
-        elif angle < 90:
-            return 80
-        else:
-            return 70
-            
-    elif exercise_type == "jumping_jack":
-        # 开合跳：根据脚踝距离判断
-        ankle_width = angle  # 这里angle存储的是脚踝宽度
-        if ankle_width > 0.3:
+def _limit_worker_threads():
+    """multiprocessing 工作进程的线程数限制。
+
+    每个分片进程里 OpenCV/OpenMP/BLAS 默认都按全部核心开线程池，
+    N 个分片就是 N 份线程池互相争抢核心与缓存行 (过订阅)；并行度
+    已由进程分片提供，进程内压到单线程反而整体更快。
+    必须在 cv2/numpy 的线程池真正启动前调用。
+    """
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ.setdefault(var, "1")
+    try:
+        _ensure_deps()
+        cv2.setNumThreads(1)
+    except Exception:
+        pass
+
+def _analyze_video_segment(args) -> Dict[str, Any]:
+    """multiprocessing 工作进程入口：分析视频的一个帧区间 (不生成报告)"""
+    video_path, exercise_type, start, end = args
+    _limit_worker_threads()
+    return analyze_exercise_video(video_path, exercise_type, frame_range=(start, end), generate_report=False)
+
+def analyze_exercise_video_parallel(video_path: str, exercise_type: str, workers: int = 4, min_frames_per_worker: int = 300) -> Dict[str, Any]:
+    """把长视频按帧区间分片到多个进程并行分析，合并计数与错误统计。
+
+    每个工作进程独立运行 analyze_exercise_video 处理自己的 [start, end)
+    区间。状态机以 stage=None 起步时不会对进入下行区的首次过渡计数，
+    跨分片边界的动作只会被包含"上行区 -> 下行区"过渡帧的那个分片计到，
+    因此计数直接求和即可，无需边界去重。短视频退回单进程路径。
+
+    注意：分片进程不生成 HTML 报告，合并结果的 report_path 为 None。
+    """
+    try:
+        _ensure_deps()
+    except ImportError as e:
+        return {"success": False, "message": "错误：缺少视频分析依赖", "error_details": str(e)}
+
+    # 探测总帧数，决定是否值得分片
+    cap = cv2.VideoCapture(video_path)
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) if cap.isOpened() else 0
+    cap.release()
+
+    workers = max(1, int(workers))
+    if workers == 1 or total_frames < workers * min_frames_per_worker:
+        print(f"视频较短 ({total_frames} 帧)，使用单进程分析")
+        return analyze_exercise_video(video_path, exercise_type)
+
+    # 平均切分帧区间，最后一片吃掉余数
+    seg_len = total_frames // workers
+    ranges = [(i * seg_len, (i + 1) * seg_len if i < workers - 1 else total_frames)
+              for i in range(workers)]
+    print(f"并行分析: {workers} 个进程，每片约 {seg_len} 帧")
+
+    import multiprocessing
+    with multiprocessing.Pool(workers) as pool:
+        segment_results = pool.map(
+            _analyze_video_segment,
+            [(video_path, exercise_type, start, end) for start, end in ranges]
+        )
+
+    # --- 合并各分片结果 ---
+    merged = {
+        "success": all(r.get("success") for r in segment_results),
+        "message": "",
+        "exercise_type": exercise_type,
+        "total_frames": total_frames,
+        "processed_frames": max((r.get("processed_frames", 0) for r in segment_results), default=0),
+        "counter": sum(r.get("counter", 0) for r in segment_results),
+        "errors_detected": [],
+        "report_path": None,
+        "error_details": None
+    }
+
+    # 错误日志按类型合并：次数求和，首次出现时间取最早
+    errors_by_type: Dict[str, Dict[str, Any]] = {}
+    for r in segment_results:
+        for err in r.get("errors_detected", []):
+            merged_err = errors_by_type.get(err["type"])
+            if merged_err is None:
+                errors_by_type[err["type"]] = dict(err)
+            else:
+                merged_err["count"] += err["count"]
+                merged_err["first_timestamp"] = min(merged_err["first_timestamp"], err["first_timestamp"])
+    merged["errors_detected"] = list(errors_by_type.values())
+
+    if merged["success"]:
+        merged["message"] = f"并行分析完成，共识别 {merged['counter']} 个动作。"
+    else:
+        failed = [r.get("message", "") for r in segment_results if not r.get("success")]
+        merged["message"] = "部分分片分析失败: " + "; ".join(failed)
+    return merged
+
+# 深度得分阈值表：(角度上限, 得分) 按序取第一个命中档位，未命中取兜底分 70。
+# 角度越小动作越到位 (深蹲蹲得深 / 俯卧撑压得低 / 仰卧起坐起得高)
+_DEPTH_SCORE_TABLE = {
+    ExerciseKind.SQUAT: ((90, 100), (120, 90), (140, 80)),
+    ExerciseKind.PUSHUP: ((90, 90), (120, 80)),
+    ExerciseKind.SITUP: ((80, 90), (90, 80)),
+    ExerciseKind.CRUNCH: ((80, 90), (90, 80)),
+}
+
+def _calculate_depth_score(exercise_kind: "ExerciseKind", angle: float, additional_angles: Dict[str, float]) -> float:
+    """根据运动类型和角度计算动作深度得分 (阈值表查找)"""
+    if exercise_kind == ExerciseKind.JUMPING_JACK:
+        # 开合跳：根据脚踝宽度判断 (这里 angle 存储的是脚踝宽度，越大越到位)
+        if angle > 0.3:
             return 90  # 张开充分
-        elif ankle_width > 0.2:
+        elif angle > 0.2:
             return 80
-        else:
-            return 70
-            
-    return 75  # 默认值
+        return 70
+
+    table = _DEPTH_SCORE_TABLE.get(exercise_kind)
+    if table is None:
+        return 75  # 默认值
+    for upper, score in table:
+        if angle < upper:
+            return score
+    return 70
 
 # ============================================================
 # 下一步：实现以下内部辅助函数，迁移 pose_analyzer.py 逻辑
@@ -439,78 +1024,48 @@ def _get_landmark(landmarks, landmark_enum):
     except (IndexError, AttributeError, TypeError):
         return None
 
-def _is_valid_pose(landmarks, mp_pose, exercise_type) -> Tuple[bool, str]:
-    """检查姿势是否有效（关键点可见性，朝向）"""
-    try:
-        # 从 config 加载或使用默认值
-        vis_threshold = 0.2  # 可见度阈值
-        
-        # 确定关键点和朝向要求
-        key_point_names = []
-        required_facing = None
-        
-        if exercise_type == "squat":
-            key_point_names = ["LEFT_HIP", "LEFT_KNEE", "LEFT_ANKLE"]
-            required_facing = 'left'
-        elif exercise_type == "pushup":
-            key_point_names = ["LEFT_SHOULDER", "LEFT_ELBOW", "LEFT_WRIST", "LEFT_HIP"] 
-            required_facing = 'left'
-        elif exercise_type in ["situp", "crunch"]:
-            key_point_names = ["LEFT_SHOULDER", "LEFT_HIP", "LEFT_KNEE"]
-            required_facing = 'left'
-        elif exercise_type == "jumping_jack":
-            key_point_names = ["LEFT_SHOULDER", "LEFT_HIP", "LEFT_ANKLE", 
-                               "RIGHT_SHOULDER", "RIGHT_HIP", "RIGHT_ANKLE"]
-            required_facing = 'front'
-            
-        # 如果没有定义关键点，返回错误
-        if not key_point_names:
-             return False, "未定义关键点"
-
-        # 获取并检查关键点可见性
-        key_points = []
-        for name in key_point_names:
-            lm = _get_landmark(landmarks, getattr(mp_pose.PoseLandmark, name, None))
-            if lm is None:
-                return False, f"无法获取关键点 {name}"
-            key_points.append(lm)
-
-        if any(point.visibility < vis_threshold for point in key_points):
-            invisible_points = [name for name, point in zip(key_point_names, key_points) if point.visibility < vis_threshold]
-            return False, f"无法清晰识别关键点，请调整位置"
-
-        # 检查朝向
-        left_shoulder = _get_landmark(landmarks, mp_pose.PoseLandmark.LEFT_SHOULDER)
-        right_shoulder = _get_landmark(landmarks, mp_pose.PoseLandmark.RIGHT_SHOULDER)
-
-        if left_shoulder and right_shoulder:
-            if required_facing == 'left':
-                # 如果要求左侧朝向，右肩可见度不应远超左肩
-                if right_shoulder.visibility > vis_threshold + 0.3 and right_shoulder.visibility > left_shoulder.visibility * 1.2:
-                    return False, "请保持左侧面对相机"
-            elif required_facing == 'front':
-                # 如果要求正面朝向，左右肩可见度应相似
-                 if abs(left_shoulder.visibility - right_shoulder.visibility) > 0.3:
-                     return False, "请正面面对相机"
+def _is_valid_pose(lm: np.ndarray, mp_pose, exercise_kind) -> Tuple[bool, str]:
+    """检查姿势是否有效（关键点可见性，朝向）
+
+    lm: (33,4) 关键点数组 (x, y, z, visibility)
+    """
+    # 从 config 加载或使用默认值
+    vis_threshold = 0.2  # 可见度阈值
+    P = _LM
+
+    # 关键点下标与朝向要求来自模块级预计算表
+    key_indices = _KEY_POINTS.get(exercise_kind)
+    required_facing = _FACING.get(exercise_kind)
+
+    # 如果没有定义关键点，返回错误
+    if key_indices is None:
+         return False, "未定义关键点"
+
+    # 关键点可见性批量检查
+    if np.any(lm[key_indices, 3] < vis_threshold):
+        return False, f"无法清晰识别关键点，请调整位置"
+
+    # 检查朝向 (用左右肩可见度对比)
+    left_vis = float(lm[P.LEFT_SHOULDER, 3])
+    right_vis = float(lm[P.RIGHT_SHOULDER, 3])
+
+    if required_facing == 'left':
+        # 如果要求左侧朝向，右肩可见度不应远超左肩
+        if right_vis > vis_threshold + 0.3 and right_vis > left_vis * 1.2:
+            return False, "请保持左侧面对相机"
+    elif required_facing == 'front':
+        # 如果要求正面朝向，左右肩可见度应相似
+        if abs(left_vis - right_vis) > 0.3:
+            return False, "请正面面对相机"
+
+    return True, ""
 
-        return True, ""
-    except Exception as e:
-        print(f"姿势验证异常: {e}")
-        return False, "姿势验证失败"
 
 def _check_pose_stability(landmarks, mp_pose, exercise_type) -> Tuple[bool, str]:
     """检查姿势稳定性（身体平直、对称等）- 可选"""
     # 注意：这个检查可能过于严格，可以根据需要调整或移除
     try:
-        thresholds = {
-            'shoulder_diff': 0.1,
-            'hip_diff': 0.1,
-            'ankle_diff': 0.1,
-            'shoulder_depth': 1.0,
-            'hip_depth': 1.0,
-            'ankle_y_diff': 0.1,
-            'knee_y_diff': 0.1
-        }  # 默认阈值
+        thresholds = _STABILITY_THRESHOLDS  # 模块级默认阈值
         
         if exercise_type == "pushup":
             left_shoulder = _get_landmark(landmarks, mp_pose.PoseLandmark.LEFT_SHOULDER)
@@ -569,124 +1124,69 @@ def _check_pose_stability(landmarks, mp_pose, exercise_type) -> Tuple[bool, str]
         print(f"稳定性检查异常: {e}")
         return True, "" # 出现异常时，默认稳定
 
-def _calculate_angles(landmarks, mp_pose, exercise_type) -> Tuple[Optional[float], Dict[str, float]]:
-    """计算主要角度和附加角度"""
+def _calculate_angles(lm: np.ndarray, mp_pose, exercise_kind) -> Tuple[Optional[float], Dict[str, float]]:
+    """计算主要角度和附加角度
+
+    lm: (33,4) 关键点数组，本帧所有角度/距离在数组上批量完成
+    """
     current_angle = None
     additional_angles = {}
 
-    try:
-        # 根据运动类型计算不同的角度
-        if exercise_type == "squat":
-            # 深蹲：计算膝关节角度，处理膝盖内扣情况
-            hip = _get_landmark(landmarks, mp_pose.PoseLandmark.LEFT_HIP)
-            knee = _get_landmark(landmarks, mp_pose.PoseLandmark.LEFT_KNEE)
-            ankle = _get_landmark(landmarks, mp_pose.PoseLandmark.LEFT_ANKLE)
-            
-            if hip and knee and ankle:
-                hip_pos = [hip.x, hip.y]
-                knee_pos = [knee.x, knee.y]
-                ankle_pos = [ankle.x, ankle.y]
-                
-                # 标准2D角度计算
-                standard_angle = calculate_angle_2d(hip_pos, knee_pos, ankle_pos)
-                
-                # 检测膝盖内扣并添加调试信息，但不修改角度计算
-                right_knee = _get_landmark(landmarks, mp_pose.PoseLandmark.RIGHT_KNEE)
-                right_ankle = _get_landmark(landmarks, mp_pose.PoseLandmark.RIGHT_ANKLE)
-                
-                is_knee_valgus = False
-                if right_knee and right_ankle:
-                    # 检查膝盖内扣
-                    left_knee_2d = [knee.x, knee.y]
-                    right_knee_2d = [right_knee.x, right_knee.y]
-                    left_ankle_2d = [ankle.x, ankle.y]
-                    right_ankle_2d = [right_ankle.x, right_ankle.y]
-                    
-                    knee_dist = distance_2d(left_knee_2d, right_knee_2d)
-                    ankle_dist = distance_2d(left_ankle_2d, right_ankle_2d)
-                    
-                    # 膝盖内扣检测阈值（保持检测，但不修改角度）
-                    valgus_threshold = 0.95
-                    min_ankle_dist = 0.05
-                    
-                    if ankle_dist > min_ankle_dist:
-                        ratio = knee_dist / ankle_dist
-                        is_knee_valgus = ratio < valgus_threshold
-                        
-                        # 添加调试输出，比较膝盖内扣时的角度
-                        if is_knee_valgus:
-                            print(f"[膝盖内扣检测] 膝盖距离比例: {ratio:.3f}, 角度: {standard_angle:.1f}°")
-                
-                # 直接使用标准角度，不进行修正
-                current_angle = standard_angle
-                
-                # 计算髋部角度 (3D) 作为附加角度
-                hip_angle = angle3(hip, knee, _get_landmark(landmarks, mp_pose.PoseLandmark.LEFT_SHOULDER))
-                additional_angles["hip_angle"] = hip_angle
-            
-        elif exercise_type == "pushup":
-            # 俯卧撑：计算手肘角度 (2D) 作为主要角度
-            shoulder = _get_landmark(landmarks, mp_pose.PoseLandmark.LEFT_SHOULDER)
-            elbow = _get_landmark(landmarks, mp_pose.PoseLandmark.LEFT_ELBOW)
-            wrist = _get_landmark(landmarks, mp_pose.PoseLandmark.LEFT_WRIST)
-            
-            if shoulder and elbow and wrist:
-                shoulder_pos = [shoulder.x, shoulder.y]
-                elbow_pos = [elbow.x, elbow.y]
-                wrist_pos = [wrist.x, wrist.y]
-                current_angle = calculate_angle_2d(shoulder_pos, elbow_pos, wrist_pos)
-                
-                # 计算身体直线性 (3D) 作为附加角度
-                hip = _get_landmark(landmarks, mp_pose.PoseLandmark.LEFT_HIP)
-                if hip:
-                    ankle = _get_landmark(landmarks, mp_pose.PoseLandmark.LEFT_ANKLE)
-                    if ankle:
-                        body_angle = angle3(hip, shoulder, ankle)
-                        additional_angles["body_angle"] = body_angle
-            
-        elif exercise_type in ["situp", "crunch"]:
-            # 仰卧起坐/卷腹：使用肩部-臀部-膝盖的角度
-            shoulder = _get_landmark(landmarks, mp_pose.PoseLandmark.LEFT_SHOULDER)
-            hip = _get_landmark(landmarks, mp_pose.PoseLandmark.LEFT_HIP)
-            knee = _get_landmark(landmarks, mp_pose.PoseLandmark.LEFT_KNEE)
-            
-            if shoulder and hip and knee:
-                shoulder_pos = [shoulder.x, shoulder.y]
-                hip_pos = [hip.x, hip.y]
-                knee_pos = [knee.x, knee.y]
-                current_angle = calculate_angle_2d(shoulder_pos, hip_pos, knee_pos)
-            
-        elif exercise_type == "jumping_jack":
-            # 开合跳：使用脚踝间距作为"角度"
-            left_ankle = _get_landmark(landmarks, mp_pose.PoseLandmark.LEFT_ANKLE)
-            right_ankle = _get_landmark(landmarks, mp_pose.PoseLandmark.RIGHT_ANKLE)
-            
-            if left_ankle and right_ankle:
-                ankle_width = abs(left_ankle.x - right_ankle.x)
-                current_angle = ankle_width  # 在这里，使用宽度代替角度
-                
-                # 计算手腕间距
-                left_wrist = _get_landmark(landmarks, mp_pose.PoseLandmark.LEFT_WRIST)
-                right_wrist = _get_landmark(landmarks, mp_pose.PoseLandmark.RIGHT_WRIST)
-                
-                if left_wrist and right_wrist:
-                    hand_distance = distance_2d([left_wrist.x, left_wrist.y], [right_wrist.x, right_wrist.y])
-                    additional_angles["hand_distance"] = hand_distance
-
-                # 可能的附加测量：肩部宽度，用于比较上下肢协调性
-                left_shoulder = _get_landmark(landmarks, mp_pose.PoseLandmark.LEFT_SHOULDER)
-                right_shoulder = _get_landmark(landmarks, mp_pose.PoseLandmark.RIGHT_SHOULDER)
-                if left_shoulder and right_shoulder:
-                    shoulder_width = abs(left_shoulder.x - right_shoulder.x)
-                    additional_angles["shoulder_width"] = shoulder_width
-
-    except Exception as e:
-        print(f"角度计算异常: {e}")
+    pts = lm[:, :3]  # 角度计算只用坐标列
+    P = _LM
+
+    if exercise_kind == ExerciseKind.JUMPING_JACK:
+        # 开合跳：使用脚踝间距作为"角度"
+        current_angle = abs(float(pts[P.LEFT_ANKLE, 0] - pts[P.RIGHT_ANKLE, 0]))
+        # 手腕间距
+        additional_angles["hand_distance"] = math.hypot(
+            float(pts[P.LEFT_WRIST, 0]) - float(pts[P.RIGHT_WRIST, 0]),
+            float(pts[P.LEFT_WRIST, 1]) - float(pts[P.RIGHT_WRIST, 1])
+        )
+        # 肩部宽度，用于比较上下肢协调性
+        additional_angles["shoulder_width"] = abs(
+            float(pts[P.LEFT_SHOULDER, 0] - pts[P.RIGHT_SHOULDER, 0])
+        )
+    else:
+        spec = _ANGLE_SPECS.get(exercise_kind)
+        if spec is not None:
+            # 主角度 (2D)：深蹲=膝关节角，俯卧撑=肘关节角，仰卧起坐/卷腹=肩-髋-膝角
+            a, v, c = spec["main"]
+            current_angle = _angle2d_scalar(
+                float(pts[a, 0]), float(pts[a, 1]),
+                float(pts[v, 0]), float(pts[v, 1]),
+                float(pts[c, 0]), float(pts[c, 1])
+            )
+
+            # 附加角度 (3D)：深蹲髋部角 / 俯卧撑身体直线性
+            if spec["extra3d"] is not None:
+                names, ia3, iv3, ic3 = spec["extra3d"]
+                values = _angles_batch(pts, ia3, iv3, ic3)
+                additional_angles.update(zip(names, map(float, values)))
+
+        if exercise_kind == ExerciseKind.SQUAT and current_angle is not None:
+            # 检测膝盖内扣并添加调试信息，但不修改角度计算
+            knee_dist = math.hypot(float(pts[P.LEFT_KNEE, 0]) - float(pts[P.RIGHT_KNEE, 0]),
+                                   float(pts[P.LEFT_KNEE, 1]) - float(pts[P.RIGHT_KNEE, 1]))
+            ankle_dist = math.hypot(float(pts[P.LEFT_ANKLE, 0]) - float(pts[P.RIGHT_ANKLE, 0]),
+                                    float(pts[P.LEFT_ANKLE, 1]) - float(pts[P.RIGHT_ANKLE, 1]))
+
+            # 膝盖内扣检测阈值（保持检测，但不修改角度）
+            valgus_threshold = 0.95
+            min_ankle_dist = 0.05
+
+            if ankle_dist > min_ankle_dist:
+                ratio = knee_dist / ankle_dist
+                # 缓存到附加角度里，_check_form_errors 直接复用，避免重算
+                additional_angles["knee_ankle_ratio"] = ratio
+                if ratio < valgus_threshold:
+                    if _DEBUG:
+                        _log.debug("[膝盖内扣检测] 膝盖距离比例: %.3f, 角度: %.1f°", ratio, current_angle)
 
     return current_angle, additional_angles
 
-def _analyze_exercise_motion(landmarks, mp_pose, exercise_type, stage, angle_buffer, last_angle, current_angle, additional_angles) -> Tuple[Optional[str], bool, str, float]:
-    """分析动作阶段和计数逻辑"""
+def _analyze_exercise_motion(lm, mp_pose, exercise_kind, stage, angle_buffer, last_angle, current_angle, additional_angles) -> Tuple[Optional[str], bool, str, float]:
+    """分析动作阶段和计数逻辑 (角度已在 _calculate_angles 中算好，lm 仅作签名统一)"""
     new_stage = stage
     should_count = False
     feedback = ""
@@ -696,452 +1196,377 @@ def _analyze_exercise_motion(landmarks, mp_pose, exercise_type, stage, angle_buf
         return stage, False, "无法计算角度", 0.0 # 如果无法计算角度，不进行分析
 
     # --- 角度平滑 ---
-    angle_buffer.append(current_angle)
+    angle_buffer.push(current_angle)
     
     # 改进的角度平滑逻辑：
     # 1. 如果缓冲区少于3个值，直接使用当前角度，避免初期误差
     # 2. 使用较小的缓冲区减少滞后
     if len(angle_buffer) < 3:
         smoothed_angle = current_angle
-        print(f"[角度调试] 缓冲区初期，使用原始角度: {current_angle:.1f}°")
+        if _DEBUG:
+            _log.debug("[角度调试] 缓冲区初期，使用原始角度: %.1f°", current_angle)
     else:
         # 使用最近5帧的平均值（而不是全部10帧）
-        recent_angles = list(angle_buffer)[-5:]
-        smoothed_angle = sum(recent_angles) / len(recent_angles)
-        print(f"[角度调试] 原始角度: {current_angle:.1f}°, 平滑角度: {smoothed_angle:.1f}°")
-
-    # --- 为每个运动类型设置阈值 ---
-    upper_threshold = 0
-    lower_threshold = 0
-
-    # 根据运动类型设置不同阈值
-    if exercise_type == "squat":
-        upper_threshold = 170  # 站立时膝盖角度阈值
-        lower_threshold = 155  # 深蹲底部膝盖角度阈值
-    elif exercise_type == "pushup":
-        upper_threshold = 160  # 起始位置肘部角度阈值
-        lower_threshold = 90   # 底部肘部角度阈值
-    elif exercise_type in ["situp", "crunch"]:
-        # upper_threshold = 120  # 起始位置躯干角度阈值
-        # lower_threshold = 70   # 收缩位置躯干角度阈值
-        upper_threshold = 100  # 起始位置躯干角度阈值 
-        lower_threshold = 85   # 收缩位置躯干角度阈值
-    elif exercise_type == "jumping_jack":
+        smoothed_angle = angle_buffer.mean_recent(5)
+        if _DEBUG:
+            _log.debug("[角度调试] 原始角度: %.1f°, 平滑角度: %.1f°", current_angle, smoothed_angle)
+
+    # --- 阈值 ---
+    # 非开合跳运动的阈值在 _MOTION_CFG 表里；开合跳阈值依赖当帧肩宽，单独计算
+    if exercise_kind == ExerciseKind.JUMPING_JACK:
         # 开合跳阈值：脚踝宽度和手腕距离
         # 根据用户要求，将脚踝合拢阈值也根据肩宽调整
         # 从 additional_angles 中获取肩宽
         shoulder_width = additional_angles.get("shoulder_width", 0)
-        # 如果获取到肩宽，则动态计算阈值，否则使用一个默认值
+        # 合拢阈值取肩宽的 0.5 倍、张开阈值取肩宽的 1.5 倍，
+        # 无法获取肩宽时用固定默认值 (一个分支同时得出两个阈值)
         if shoulder_width > 0:
-            # 设置为肩宽的一个小比例，例如 0.1 倍
             ankle_closed_threshold = shoulder_width * 0.5
-        else:
-            ankle_closed_threshold = 0.025 # 默认值，如果无法获取肩宽
-        # 根据用户要求，将脚踝分开阈值调整为肩宽的1.5倍
-        
-        # 如果获取到肩宽，则动态计算阈值，否则使用一个默认值
-        if shoulder_width > 0:
             ankle_open_threshold = shoulder_width * 1.5
         else:
-            ankle_open_threshold = 0.3 # 默认值，如果无法获取肩宽
-        print(ankle_closed_threshold, ankle_open_threshold)
+            ankle_closed_threshold = 0.025
+            ankle_open_threshold = 0.3
+        if _DEBUG:
+            _log.debug("[JJ调试] 脚踝阈值: closed=%.3f, open=%.3f", ankle_closed_threshold, ankle_open_threshold)
         hand_closed_threshold = 0.07 # 手腕合拢阈值 (适当调低)
         hand_open_threshold = 0.2   # 手腕分开阈值 (适当调低)
 
-    try:
-        # --- 开合跳定制计数逻辑 --- (新增)
-        if exercise_type == "jumping_jack":
-            hand_distance = additional_angles.get("hand_distance", 0)
-            ankle_width = smoothed_angle # smoothed_angle 现在是脚踝宽度
-
-            # 调试输出，便于定位问题
-            print(f"[JJ调试] ankle_width={ankle_width:.3f}, hand_distance={hand_distance:.3f}, stage={stage}")
-
-            # 定义阶段：closed (脚踝合拢, 手腕合拢/下方), open (脚踝分开, 手腕分开/上方)
-            is_closed_pose = ankle_width < ankle_closed_threshold# and hand_distance < hand_closed_threshold
-            is_open_pose = ankle_width > ankle_open_threshold# and hand_distance > hand_open_threshold
-
-            stage_a, stage_b = "closed", "open"
-
-            # 判断当前姿势属于哪个阶段
-            current_stage = None
-            if is_closed_pose:
-                current_stage = stage_a
-            elif is_open_pose:
-                current_stage = stage_b
-            # else: current_stage 保持 None，表示在过渡区域
-
-            new_stage = stage # 默认保持当前阶段
-            should_count = False
-            feedback = ""
-
-            # 状态机逻辑
-            if stage is None: # 初始状态
-                if current_stage == stage_a:
-                    new_stage = stage_a
-                    feedback = "已识别到起始合拢姿势，请跳跃并张开手脚"
-                elif current_stage == stage_b:
-                    new_stage = stage_b
-                    feedback = "已识别到张开姿势，请合拢手脚回到起始"
-                else:
-                    feedback = "请调整到起始姿势 (手脚合拢或分开)"
-
-            elif stage == stage_a: # 当前在 closed 阶段
-                if current_stage == stage_b: # 从 closed 进入 open
-                    new_stage = stage_b
-                    feedback = "张开手脚，保持动作到位"
-                elif current_stage == stage_a: # 保持在 closed 阶段
-                    feedback = "保持合拢，准备跳跃张开"
-                else: # 从 closed 进入过渡区域
-                    feedback = "幅度不够，请大幅度张开手脚"
-
-            elif stage == stage_b: # 当前在 open 阶段
-                if current_stage == stage_a: # 从 open 回到 closed，完成一次动作
-                    new_stage = stage_a
-                    should_count = True # 在回到 closed 状态时计数
-                    feedback = "标准开合跳！已计数"
-                elif current_stage == stage_b: # 保持在 open 阶段
-                    feedback = "保持张开，准备合拢"
-                else: # 从 open 进入过渡区域
-                    feedback = "幅度不够，请完全合拢手脚"
-
-            # 如果在过渡区域，保持原阶段反馈
-            if current_stage is None:
-                 if stage == stage_a:
-                     feedback = "幅度不够，请大幅度张开手脚"
-                 elif stage == stage_b:
-                     feedback = "幅度不够，请完全合拢手脚"
-                 else:
-                     feedback = "请调整到起始姿势..."
-
-        # --- 其他运动类型的原有计数逻辑 --- (保留)
-        else:
-             # 根据运动类型调整阈值比较方式
-            is_width_based = False # 其他运动类型不是基于宽度
-
-            # 判断当前处于哪个理论区域
-            in_a_zone = (smoothed_angle > upper_threshold) if not is_width_based else (smoothed_angle < upper_threshold)
-            in_b_zone = (smoothed_angle < lower_threshold) if not is_width_based else (smoothed_angle > lower_threshold)
-            print(f"[JJ调试] smoothed_angle={smoothed_angle:.3f}, stage={stage}")
-            # 根据运动类型定制阶段名称
-            if exercise_type == "squat":
-                stage_a, stage_b = "stand", "squat"
-            elif exercise_type == "pushup":
-                stage_a, stage_b = "up", "down"
-            elif exercise_type in ["situp", "crunch"]:
-                stage_a, stage_b = "down", "up"
+    # --- 开合跳定制计数逻辑 --- (新增)
+    if exercise_kind == ExerciseKind.JUMPING_JACK:
+        hand_distance = additional_angles.get("hand_distance", 0)
+        ankle_width = smoothed_angle # smoothed_angle 现在是脚踝宽度
+
+        # 调试输出，便于定位问题
+        if _DEBUG:
+            _log.debug("[JJ调试] ankle_width=%.3f, hand_distance=%.3f, stage=%s", ankle_width, hand_distance, stage)
+
+        # 定义阶段：closed (脚踝合拢, 手腕合拢/下方), open (脚踝分开, 手腕分开/上方)
+        is_closed_pose = ankle_width < ankle_closed_threshold# and hand_distance < hand_closed_threshold
+        is_open_pose = ankle_width > ankle_open_threshold# and hand_distance > hand_open_threshold
+
+        stage_a, stage_b = "closed", "open"
+
+        # 判断当前姿势属于哪个阶段
+        current_stage = None
+        if is_closed_pose:
+            current_stage = stage_a
+        elif is_open_pose:
+            current_stage = stage_b
+        # else: current_stage 保持 None，表示在过渡区域
+
+        new_stage = stage # 默认保持当前阶段
+        should_count = False
+        feedback = ""
+
+        # 状态机逻辑
+        if stage is None: # 初始状态
+            if current_stage == stage_a:
+                new_stage = stage_a
+                feedback = "已识别到起始合拢姿势，请跳跃并张开手脚"
+            elif current_stage == stage_b:
+                new_stage = stage_b
+                feedback = "已识别到张开姿势，请合拢手脚回到起始"
             else:
-                stage_a, stage_b = "stage_a", "stage_b"
-
-            # 根据角度区域判断阶段
-            if in_a_zone:
-                if stage == stage_b or stage is None: # 从 B 区回到 A 区，或初始状态
-                    new_stage = stage_a
-                    if exercise_type == "squat":
-                        feedback = "站姿识别成功，可以下蹲"
-                    elif exercise_type == "pushup":
-                        feedback = "准备下压，保持手肘贴近身体"
-                    elif exercise_type in ["situp", "crunch"]:
-                        feedback = "准备起身，收紧腹肌"
-                    else:
-                        feedback = "进入起始/结束阶段"
-                else: # 保持在 A 区
-                    if exercise_type == "squat":
-                        feedback = "准备开始深蹲"
-                    elif exercise_type == "pushup":
-                        feedback = "准备下压，保持身体平直"
-                    elif exercise_type in ["situp", "crunch"]:
-                        feedback = "收紧腹肌，准备起身"
-                    else:
-                        feedback = "保持起始/结束阶段"
-            elif in_b_zone:
-                if stage == stage_a: # 从 A 区进入 B 区，完成一次动作
-                    new_stage = stage_b
-                    should_count = True
-                    if exercise_type == "squat":
-                        feedback = "深蹲完成！"
-                    elif exercise_type == "pushup":
-                        feedback = "标准俯卧撑，继续保持！"
-                    elif exercise_type in ["situp", "crunch"]:
-                        feedback = "标准仰卧起坐！"
-                    else:
-                        feedback = "动作完成!"
-                else: # 保持在 B 区
-                    if exercise_type == "squat":
-                        feedback = "下蹲姿势良好"
-                    elif exercise_type == "pushup":
-                        feedback = "保持住，确保身体平直"
-                    elif exercise_type in ["situp", "crunch"]:
-                        feedback = "保持住，充分收缩腹肌"
-                    else:
-                        feedback = "保持动作中间阶段"
-            else: # 在中间过渡区域
-                if stage == stage_a:
-                    if exercise_type == "squat":
-                        feedback = "继续下蹲"
-                    elif exercise_type == "pushup":
-                        feedback = "继续下压，保持手肘贴近身体"
-                    elif exercise_type in ["situp", "crunch"]:
-                        feedback = "继续用力，抬高上半身"
-                    else:
-                        feedback = "继续动作..."
-                elif stage == stage_b:
-                    if exercise_type == "squat":
-                        feedback = "回到站立位置"
-                    elif exercise_type == "pushup":
-                        feedback = "回到起始位置，挺胸收腹"
-                    elif exercise_type in ["situp", "crunch"]:
-                        feedback = "慢慢放低身体，准备下一个"
-                    else:
-                        feedback = "返回起始/结束阶段..."
-                else: # 初始状态在中间区域
-                     feedback = "准备开始..."
-                     new_stage = stage_a # 假设从 A 区开始
+                feedback = "请调整到起始姿势 (手脚合拢或分开)"
+
+        elif stage == stage_a: # 当前在 closed 阶段
+            if current_stage == stage_b: # 从 closed 进入 open
+                new_stage = stage_b
+                feedback = "张开手脚，保持动作到位"
+            elif current_stage == stage_a: # 保持在 closed 阶段
+                feedback = "保持合拢，准备跳跃张开"
+            else: # 从 closed 进入过渡区域
+                feedback = "幅度不够，请大幅度张开手脚"
+
+        elif stage == stage_b: # 当前在 open 阶段
+            if current_stage == stage_a: # 从 open 回到 closed，完成一次动作
+                new_stage = stage_a
+                should_count = True # 在回到 closed 状态时计数
+                feedback = "标准开合跳！已计数"
+            elif current_stage == stage_b: # 保持在 open 阶段
+                feedback = "保持张开，准备合拢"
+            else: # 从 open 进入过渡区域
+                feedback = "幅度不够，请完全合拢手脚"
+
+        # 如果在过渡区域，保持原阶段反馈
+        if current_stage is None:
+             if stage == stage_a:
+                 feedback = "幅度不够，请大幅度张开手脚"
+             elif stage == stage_b:
+                 feedback = "幅度不够，请完全合拢手脚"
+             else:
+                 feedback = "请调整到起始姿势..."
+
+    # --- 其他运动类型：查表驱动的通用状态机 ---
+    else:
+        cfg = _MOTION_CFG[exercise_kind]
+        stage_a, stage_b = cfg["stages"]
+        fb = cfg["fb"]
+
+        # 判断当前处于哪个理论区域
+        in_a_zone = smoothed_angle > cfg["upper"]
+        in_b_zone = smoothed_angle < cfg["lower"]
+        if _DEBUG:
+            _log.debug("[JJ调试] smoothed_angle=%.3f, stage=%s", smoothed_angle, stage)
+
+        if in_a_zone:
+            if stage == stage_b or stage is None: # 从 B 区回到 A 区，或初始状态
+                new_stage = stage_a
+                feedback = fb[("a", "enter")]
+            else: # 保持在 A 区
+                feedback = fb[("a", "hold")]
+        elif in_b_zone:
+            if stage == stage_a: # 从 A 区进入 B 区，完成一次动作
+                new_stage = stage_b
+                should_count = True
+                feedback = fb[("b", "count")]
+            else: # 保持在 B 区
+                feedback = fb[("b", "hold")]
+        else: # 在中间过渡区域
+            if stage == stage_a:
+                feedback = fb[("mid", "from_a")]
+            elif stage == stage_b:
+                feedback = fb[("mid", "from_b")]
+            else: # 初始状态在中间区域
+                feedback = "准备开始..."
+                new_stage = stage_a # 假设从 A 区开始
+
+        # 检查附加角度限制 (例如俯卧撑中的身体直线要求)
+        if exercise_kind == ExerciseKind.PUSHUP and "body_angle" in additional_angles:
+            body_angle = additional_angles["body_angle"]
+            if abs(body_angle - 180) >= 20:  # 身体偏离直线超过20度
+                feedback = "请保持身体平直，不要耸肩"
 
-            # 检查附加角度限制 (例如俯卧撑中的身体直线要求)
-            if exercise_type == "pushup" and "body_angle" in additional_angles:
-                body_angle = additional_angles["body_angle"]
-                if abs(body_angle - 180) >= 20:  # 身体偏离直线超过20度
-                    feedback = "请保持身体平直，不要耸肩"
+    return new_stage, should_count, feedback, smoothed_angle
 
-    except Exception as e:
-        print(f"动作分析异常: {e}")
-        feedback = "动作分析错误"
+def _check_form_errors(lm: np.ndarray, mp_pose, exercise_kind, hip_y_history: "_RingBuffer", error_buffer: np.ndarray, current_time_sec: float, detected_errors_log: dict, collect_annotations: bool = True, geom: Optional[Dict[str, float]] = None) -> Tuple[bool, str, List[Tuple[str, Tuple[float, float], str]], List[Tuple[str, Tuple[float, float], str]]]:
+    """检查形态错误
 
-    return new_stage, should_count, feedback, smoothed_angle
+    lm: (33,4) 关键点数组 (x, y, z, visibility)，按整数下标读取
+    error_buffer: 按 FormError 下标累加的持续帧数数组 (int16)
+    collect_annotations: 是否计算标注坐标。错误计数/统计只用错误文本，
+    无调试窗口时跳过坐标元组构建
+    geom: _calculate_angles 本帧已算好的几何量 (如膝距/踝距比例)，
+    传入后相同输入不再重算
 
-def _check_form_errors(landmarks, mp_pose, exercise_type, hip_y_history: deque, error_buffer: dict, current_time_sec: float, detected_errors_log: dict) -> Tuple[bool, str, List[Tuple[str, Tuple[float, float], str]]]:
-    """检查形态错误"""
-    current_errors_details = [] # 存储 (错误文本, 标注位置, 颜色)
+    返回 (form_valid, feedback, final_errors, new_confirmed_errors)，
+    后两者均为 (错误文本, 标注位置, 颜色下标) 列表；new_confirmed_errors
+    是本帧刚达到持续阈值的子集，供统计记录使用。
+    """
+    # 存储 (错误编码, 标注位置, 颜色下标)；复用模块级 scratch。
+    # final_errors / new_confirmed_errors 会被下游跨帧缓存，必须保持新建列表
+    current_errors_details = _errors_scratch
+    current_errors_details.clear()
     form_valid = True
     feedback = ""
 
-    try:
-        # --- 通用关键点获取 ---
-        lm_dict = {name: _get_landmark(landmarks, getattr(mp_pose.PoseLandmark, name, None)) 
-                 for name in mp_pose.PoseLandmark.__members__}
-
-        # --- 深蹲错误检测 ---
-        if exercise_type == "squat":
-            # === 膝盖检查 ===
-            left_knee = lm_dict.get("LEFT_KNEE")
-            right_knee = lm_dict.get("RIGHT_KNEE")
-            left_ankle = lm_dict.get("LEFT_ANKLE")
-            right_ankle = lm_dict.get("RIGHT_ANKLE")
-            left_hip = lm_dict.get("LEFT_HIP")
-            right_hip = lm_dict.get("RIGHT_HIP")
-            left_shoulder = lm_dict.get("LEFT_SHOULDER")
-            right_shoulder = lm_dict.get("RIGHT_SHOULDER")
-
-            if all([left_knee, right_knee, left_ankle, right_ankle, left_hip, right_hip]):
-                # 更新髋关节 Y 坐标历史
-                current_hip_y = (left_hip.y + right_hip.y) / 2
-                hip_y_history.append(current_hip_y)
-
-                # 判断是否在深蹲底部附近进行检查
-                should_check_knees = False
-                if len(hip_y_history) == hip_y_history.maxlen:
-                    highest_y = min(hip_y_history) # Y值最小的是最高点
-                    lowest_y = max(hip_y_history)  # Y值最大的是最低点
-                    descent_distance = current_hip_y - highest_y
-                    avg_knee_y = (left_knee.y + right_knee.y) / 2
-                    thigh_y_projection = avg_knee_y - current_hip_y # 大腿Y轴投影
-
-                    # 阈值
-                    desc_thresh_ratio = 1.0 / 3.0  # 下蹲深度阈值比例
-                    lowest_prox_thresh = 0.03  # 接近最低点的容差
-                    
-                    has_descended_enough = thigh_y_projection > 0 and (descent_distance > desc_thresh_ratio * thigh_y_projection)
-                    is_near_lowest = abs(current_hip_y - lowest_y) < lowest_prox_thresh
-
-                    should_check_knees = has_descended_enough and is_near_lowest
-
-                if should_check_knees:
-                    # 使用 2D 距离检查膝盖内扣/外翻
-                    left_knee_2d = [left_knee.x, left_knee.y]
-                    right_knee_2d = [right_knee.x, right_knee.y]
-                    left_ankle_2d = [left_ankle.x, left_ankle.y]
-                    right_ankle_2d = [right_ankle.x, right_ankle.y]
-
-                    knee_dist = distance_2d(left_knee_2d, right_knee_2d)
-                    ankle_dist = distance_2d(left_ankle_2d, right_ankle_2d)
-
-                    valgus_thresh = 0.95  # 膝盖内扣阈值
-                    varus_thresh = 1.3   # 膝盖外翻阈值
-                    min_ankle_dist = 0.05  # 最小脚踝距离阈值
-
-                    if ankle_dist > min_ankle_dist:
-                        ratio = knee_dist / ankle_dist
-                        knee_center_pos = ((left_knee.x + right_knee.x)/2, (left_knee.y + right_knee.y)/2)
-                        if ratio < valgus_thresh:
-                            current_errors_details.append(("膝盖内扣", knee_center_pos, "red"))
-                        elif ratio > varus_thresh:
-                            current_errors_details.append(("膝盖外翻", knee_center_pos, "yellow"))
-
-                # === 重心检查 ===
-                ankle_center_x = (left_ankle.x + right_ankle.x) / 2
-                hip_center_x = (left_hip.x + right_hip.x) / 2
-                shoulder_center_x = (left_shoulder.x + right_shoulder.x) / 2
-                gravity_center_x = (hip_center_x + shoulder_center_x) / 2
-                gravity_pos_y = (left_hip.y + right_hip.y) / 2
-                
-                gravity_offset_threshold = 0.12  # 重心偏移阈值
-
-                if abs(gravity_center_x - ankle_center_x) > gravity_offset_threshold:
-                    gravity_pos = (gravity_center_x, gravity_pos_y)
-                    if gravity_center_x > ankle_center_x:
-                        current_errors_details.append(("重心过于靠后", gravity_pos, "purple"))
-                    else:
-                        current_errors_details.append(("重心过于靠前", gravity_pos, "purple"))
+    P = _LM
+
+    # --- 深蹲错误检测 ---
+    if exercise_kind == ExerciseKind.SQUAT:
+        lk, rk = lm[P.LEFT_KNEE], lm[P.RIGHT_KNEE]
+        la, ra = lm[P.LEFT_ANKLE], lm[P.RIGHT_ANKLE]
+        lh, rh = lm[P.LEFT_HIP], lm[P.RIGHT_HIP]
+        ls, rs = lm[P.LEFT_SHOULDER], lm[P.RIGHT_SHOULDER]
+
+        # === 膝盖检查 ===
+        # 更新髋关节 Y 坐标历史
+        current_hip_y = float(lh[1] + rh[1]) / 2
+        hip_y_history.push(current_hip_y)
+
+        # 判断是否在深蹲底部附近进行检查
+        should_check_knees = False
+        if hip_y_history.full:
+            highest_y = hip_y_history.min() # Y值最小的是最高点
+            lowest_y = hip_y_history.max()  # Y值最大的是最低点
+            descent_distance = current_hip_y - highest_y
+            avg_knee_y = float(lk[1] + rk[1]) / 2
+            thigh_y_projection = avg_knee_y - current_hip_y # 大腿Y轴投影
+
+            # 阈值
+            desc_thresh_ratio = 1.0 / 3.0  # 下蹲深度阈值比例
+            lowest_prox_thresh = 0.03  # 接近最低点的容差
+
+            has_descended_enough = thigh_y_projection > 0 and (descent_distance > desc_thresh_ratio * thigh_y_projection)
+            is_near_lowest = abs(current_hip_y - lowest_y) < lowest_prox_thresh
+
+            should_check_knees = has_descended_enough and is_near_lowest
+
+        if should_check_knees:
+            valgus_thresh = 0.95  # 膝盖内扣阈值
+            varus_thresh = 1.3   # 膝盖外翻阈值
+
+            # 膝距/踝距比例优先取 _calculate_angles 本帧算好的缓存值，
+            # 输入与阈值完全一致，避免重复的 2D 距离计算
+            ratio = geom.get("knee_ankle_ratio") if geom is not None else None
+            if ratio is None:
+                knee_dist = math.hypot(float(lk[0] - rk[0]), float(lk[1] - rk[1]))
+                ankle_dist = math.hypot(float(la[0] - ra[0]), float(la[1] - ra[1]))
+                if ankle_dist > 0.05:  # 最小脚踝距离阈值
+                    ratio = knee_dist / ankle_dist
+
+            if ratio is not None:
+                knee_center_pos = (float(lk[0] + rk[0]) / 2, float(lk[1] + rk[1]) / 2) if collect_annotations else None
+                if ratio < valgus_thresh:
+                    current_errors_details.append((FormError.KNEE_VALGUS, knee_center_pos, _CLR_RED))
+                elif ratio > varus_thresh:
+                    current_errors_details.append((FormError.KNEE_VARUS, knee_center_pos, _CLR_YELLOW))
+
+        # === 重心检查 ===
+        ankle_center_x = float(la[0] + ra[0]) / 2
+        hip_center_x = float(lh[0] + rh[0]) / 2
+        shoulder_center_x = float(ls[0] + rs[0]) / 2
+        gravity_center_x = (hip_center_x + shoulder_center_x) / 2
+        gravity_pos_y = current_hip_y
+
+        gravity_offset_threshold = 0.12  # 重心偏移阈值
+
+        if abs(gravity_center_x - ankle_center_x) > gravity_offset_threshold:
+            gravity_pos = (gravity_center_x, gravity_pos_y) if collect_annotations else None
+            if gravity_center_x > ankle_center_x:
+                current_errors_details.append((FormError.WEIGHT_TOO_BACK, gravity_pos, _CLR_PURPLE))
+            else:
+                current_errors_details.append((FormError.WEIGHT_TOO_FORWARD, gravity_pos, _CLR_PURPLE))
+
+    # --- 俯卧撑错误检测 ---
+    elif exercise_kind == ExerciseKind.PUSHUP:
+        ls, rs = lm[P.LEFT_SHOULDER], lm[P.RIGHT_SHOULDER]
+        le, re_ = lm[P.LEFT_ELBOW], lm[P.RIGHT_ELBOW]
+        lh, rh = lm[P.LEFT_HIP], lm[P.RIGHT_HIP]
+
+        # 肩部下沉检查
+        shoulder_height = float(ls[1] + rs[1]) / 2
+        elbow_height = float(le[1] + re_[1]) / 2
+        if shoulder_height > elbow_height:  # 肩部下沉
+            shoulder_pos = (float(ls[0] + rs[0]) / 2, shoulder_height) if collect_annotations else None
+            current_errors_details.append((FormError.SHOULDER_SAG, shoulder_pos, _CLR_RED))
+
+        # 臀部下沉或抬高
+        hip_shoulder_line = abs(float(lh[1] - ls[1]))
+        if hip_shoulder_line > 0.12:  # 臀部下沉/抬高
+            hip_pos = (float(lh[0] + rh[0]) / 2, float(lh[1] + rh[1]) / 2) if collect_annotations else None
+            if lh[1] > ls[1]:
+                current_errors_details.append((FormError.HIP_SAG, hip_pos, _CLR_YELLOW))
+            else:
+                current_errors_details.append((FormError.HIP_RAISED, hip_pos, _CLR_YELLOW))
+
+    # --- 仰卧起坐/卷腹错误检测 ---
+    elif exercise_kind in (ExerciseKind.SITUP, ExerciseKind.CRUNCH):
+        ls, rs = lm[P.LEFT_SHOULDER], lm[P.RIGHT_SHOULDER]
+        lh, rh = lm[P.LEFT_HIP], lm[P.RIGHT_HIP]
+
+        # 躯干扭转检查
+        shoulder_hip_diff = abs(
+            math.hypot(float(ls[0] - rs[0]), float(ls[1] - rs[1]))
+            - math.hypot(float(lh[0] - rh[0]), float(lh[1] - rh[1]))
+        )
+        if shoulder_hip_diff > 0.12:  # 躯干扭转
+            torso_pos = (float(ls[0] + rs[0]) / 2, float(ls[1] + lh[1]) / 2) if collect_annotations else None
+            current_errors_details.append((FormError.TORSO_TWIST, torso_pos, _CLR_RED))
+
+        # 头部前屈检查
+        if ls[1] > lh[1]:  # 头部前屈
+            head_pos = (float(ls[0]), float(ls[1])) if collect_annotations else None
+            current_errors_details.append((FormError.HEAD_FLEXION, head_pos, _CLR_YELLOW))
+    
+    # --- 开合跳错误检测 ---
+    # elif exercise_kind == ExerciseKind.JUMPING_JACK:
+    #     left_shoulder = lm_dict.get("LEFT_SHOULDER")
+    #     right_shoulder = lm_dict.get("RIGHT_SHOULDER")
+    #     left_ankle = lm_dict.get("LEFT_ANKLE")
+    #     right_ankle = lm_dict.get("RIGHT_ANKLE")
+    #     left_knee = lm_dict.get("LEFT_KNEE")
+    #     right_knee = lm_dict.get("RIGHT_KNEE")
+    #     left_hip = lm_dict.get("LEFT_HIP") # 获取左臀关键点
+    #     right_hip = lm_dict.get("RIGHT_HIP") # 获取右臀关键点
         
-        # --- 俯卧撑错误检测 ---
-        elif exercise_type == "pushup":
-            left_shoulder = lm_dict.get("LEFT_SHOULDER")
-            right_shoulder = lm_dict.get("RIGHT_SHOULDER")
-            left_elbow = lm_dict.get("LEFT_ELBOW")
-            right_elbow = lm_dict.get("RIGHT_ELBOW")
-            left_hip = lm_dict.get("LEFT_HIP")
-            right_hip = lm_dict.get("RIGHT_HIP")
+        # if all([left_shoulder, right_shoulder, left_ankle, right_ankle, left_knee, right_knee]):
+        #     # 动作不对称检查
+        #     shoulder_diff = distance_2d([left_shoulder.x, left_shoulder.y], 
+        #                               [right_shoulder.x, right_shoulder.y])
+        #     ankle_diff = distance_2d([left_ankle.x, left_ankle.y], 
+        #                             [right_ankle.x, right_ankle.y])
             
-            if all([left_shoulder, right_shoulder, left_elbow, right_elbow, left_hip, right_hip]):
-                # 肩部下沉检查
-                shoulder_height = (left_shoulder.y + right_shoulder.y) / 2
-                elbow_height = (left_elbow.y + right_elbow.y) / 2
-                if shoulder_height > elbow_height:  # 肩部下沉
-                    shoulder_pos = ((left_shoulder.x + right_shoulder.x)/2, shoulder_height)
-                    current_errors_details.append(("肩部下沉", shoulder_pos, "red"))
-                
-                # 臀部下沉或抬高
-                left_ankle = lm_dict.get("LEFT_ANKLE")
-                if left_ankle:
-                    hip_shoulder_line = abs(left_hip.y - left_shoulder.y)
-                    if hip_shoulder_line > 0.12:  # 臀部下沉/抬高
-                        hip_pos = ((left_hip.x + right_hip.x)/2, (left_hip.y + right_hip.y)/2)
-                        if left_hip.y > left_shoulder.y:
-                            current_errors_details.append(("臀部下沉", hip_pos, "yellow"))
-                        else:
-                            current_errors_details.append(("臀部抬高", hip_pos, "yellow"))
-        
-        # --- 仰卧起坐/卷腹错误检测 ---
-        elif exercise_type in ["situp", "crunch"]:
-            left_shoulder = lm_dict.get("LEFT_SHOULDER")
-            right_shoulder = lm_dict.get("RIGHT_SHOULDER")
-            left_hip = lm_dict.get("LEFT_HIP")
-            right_hip = lm_dict.get("RIGHT_HIP")
-            left_knee = lm_dict.get("LEFT_KNEE")
+        #     if abs(shoulder_diff - ankle_diff) > 0.15:  # 动作不对称 (调整)
+        #         center_pos = ((left_shoulder.x + right_shoulder.x)/2, 
+        #                      (left_shoulder.y + right_shoulder.y)/2)
+        #         current_errors_details.append(("动作不对称", center_pos, "red"))
             
-            if all([left_shoulder, right_shoulder, left_hip, right_hip, left_knee]):
-                # 躯干扭转检查
-                shoulder_hip_diff = abs(distance_2d([left_shoulder.x, left_shoulder.y], 
-                                                  [right_shoulder.x, right_shoulder.y]) - 
-                                      distance_2d([left_hip.x, left_hip.y], 
-                                                [right_hip.x, right_hip.y]))
-                if shoulder_hip_diff > 0.12:  # 躯干扭转
-                    torso_pos = ((left_shoulder.x + right_shoulder.x)/2, (left_shoulder.y + left_hip.y)/2)
-                    current_errors_details.append(("躯干扭转", torso_pos, "red"))
-                
-                # 头部前屈检查
-                if left_shoulder.y > left_hip.y:  # 头部前屈
-                    head_pos = (left_shoulder.x, left_shoulder.y)
-                    current_errors_details.append(("头部前屈", head_pos, "yellow"))
-        
-        # --- 开合跳错误检测 ---
-        # elif exercise_type == "jumping_jack":
-        #     left_shoulder = lm_dict.get("LEFT_SHOULDER")
-        #     right_shoulder = lm_dict.get("RIGHT_SHOULDER")
-        #     left_ankle = lm_dict.get("LEFT_ANKLE")
-        #     right_ankle = lm_dict.get("RIGHT_ANKLE")
-        #     left_knee = lm_dict.get("LEFT_KNEE")
-        #     right_knee = lm_dict.get("RIGHT_KNEE")
-        #     left_hip = lm_dict.get("LEFT_HIP") # 获取左臀关键点
-        #     right_hip = lm_dict.get("RIGHT_HIP") # 获取右臀关键点
+            # 膝盖弯曲检查 - 使用 3D 角度更准确
+            # left_knee_3d_pos = [left_knee.x, left_knee.y, left_knee.z]
+            # right_knee_3d_pos = [right_knee.x, right_knee.y, right_knee.z]
+            # left_ankle_3d_pos = [left_ankle.x, left_ankle.y, left_ankle.z]
+            # right_ankle_3d_pos = [right_ankle.x, right_ankle.y, right_ankle.z]
+            # left_shoulder_3d_pos = [left_shoulder.x, left_shoulder.y, left_shoulder.z]
+            # right_shoulder_3d_pos = [right_shoulder.x, right_shoulder.y, right_shoulder.z]
             
-            # if all([left_shoulder, right_shoulder, left_ankle, right_ankle, left_knee, right_knee]):
-            #     # 动作不对称检查
-            #     shoulder_diff = distance_2d([left_shoulder.x, left_shoulder.y], 
-            #                               [right_shoulder.x, right_shoulder.y])
-            #     ankle_diff = distance_2d([left_ankle.x, left_ankle.y], 
-            #                             [right_ankle.x, right_ankle.y])
-                
-            #     if abs(shoulder_diff - ankle_diff) > 0.15:  # 动作不对称 (调整)
-            #         center_pos = ((left_shoulder.x + right_shoulder.x)/2, 
-            #                      (left_shoulder.y + right_shoulder.y)/2)
-            #         current_errors_details.append(("动作不对称", center_pos, "red"))
-                
-                # 膝盖弯曲检查 - 使用 3D 角度更准确
-                # left_knee_3d_pos = [left_knee.x, left_knee.y, left_knee.z]
-                # right_knee_3d_pos = [right_knee.x, right_knee.y, right_knee.z]
-                # left_ankle_3d_pos = [left_ankle.x, left_ankle.y, left_ankle.z]
-                # right_ankle_3d_pos = [right_ankle.x, right_ankle.y, right_ankle.z]
-                # left_shoulder_3d_pos = [left_shoulder.x, left_shoulder.y, left_shoulder.z]
-                # right_shoulder_3d_pos = [right_shoulder.x, right_shoulder.y, right_shoulder.z]
-                
-                # 这里应使用 3D 角度，但为简化我们用 2D
-                # left_leg = [left_knee.x - left_ankle.x, left_knee.y - left_ankle.y]
-                # right_leg = [right_knee.x - right_ankle.x, right_knee.y - right_ankle.y]
-                
-                # left_thigh = [left_knee.x - left_hip.x, left_knee.y - left_hip.y] if left_hip else [0, 0]
-                # right_thigh = [right_knee.x - right_hip.x, right_knee.y - right_hip.y] if right_hip else [0, 0]
-                
-                # 用向量的点积估算角度
-                # def dot_product(v1, v2):
-                #     return v1[0]*v2[0] + v1[1]*v2[1]
-                
-                # def vector_magnitude(v):
-                #     return math.sqrt(v[0]**2 + v[1]**2)
-                
-                # def angle_between(v1, v2):
-                #     dot = dot_product(v1, v2)
-                #     mag1 = vector_magnitude(v1)
-                #     mag2 = vector_magnitude(v2)
-                #     if mag1 * mag2 == 0: return 180.0
-                #     cos_angle = dot / (mag1 * mag2)
-                #     cos_angle = max(min(cos_angle, 1.0), -1.0)  # 处理浮点误差
-                #     return math.degrees(math.acos(cos_angle))
-                
-                # 估计膝盖角度 (腿与大腿的夹角)
-                # left_knee_angle = angle_between(left_leg, left_thigh) if left_hip else 180.0
-                # right_knee_angle = angle_between(right_leg, right_thigh) if right_hip else 180.0
-                
-                # if left_knee_angle < 155 or right_knee_angle < 155:  # 膝盖弯曲阈值 (调整)
-                #     knee_pos = ((left_knee.x + right_knee.x)/2, (left_knee.y + right_knee.y)/2)
-                #     current_errors_details.append(("膝盖弯曲", knee_pos, "yellow"))
-
-        # --- 错误缓冲和最终判断 ---
-        final_errors = [] # 存储确认的错误 (error_text, pos, color)
-        current_error_texts = {e[0] for e in current_errors_details}
-
-        # 增加新检测到的错误的计数
-        for error_text, pos, color in current_errors_details:
-            error_buffer[error_text] = error_buffer.get(error_text, 0) + 1
-            if error_buffer[error_text] >= ERROR_PERSISTENCE:
-                final_errors.append((error_text, pos, color))
-                # 更新错误日志 - 修复：只在第一次达到阈值时计数，避免重复计数
-                if error_text not in detected_errors_log:
-                    detected_errors_log[error_text] = {"type": error_text, "count": 0, "first_timestamp": current_time_sec}
-                # 只在刚刚达到持续阈值时计数一次，避免重复计数
-                if error_buffer[error_text] == ERROR_PERSISTENCE:
-                    detected_errors_log[error_text]["count"] += 1
-
-        # 减少未检测到的错误的计数 - 修复：使用更保守的减少策略
-        for error_text in list(error_buffer.keys()):
-            if error_text not in current_error_texts:
-                error_buffer[error_text] = max(0, error_buffer[error_text] - 1)
-                if error_buffer[error_text] <= 0:
-                    del error_buffer[error_text]
-
-        if final_errors:
-            form_valid = False
-            feedback = "注意: " + ", ".join([e[0] for e in final_errors])
-        else:
-            form_valid = True
-            feedback = "" # 没有稳定错误时，反馈由动作分析函数提供
-
-        return form_valid, feedback, final_errors
+            # 这里应使用 3D 角度，但为简化我们用 2D
+            # left_leg = [left_knee.x - left_ankle.x, left_knee.y - left_ankle.y]
+            # right_leg = [right_knee.x - right_ankle.x, right_knee.y - right_ankle.y]
+            
+            # left_thigh = [left_knee.x - left_hip.x, left_knee.y - left_hip.y] if left_hip else [0, 0]
+            # right_thigh = [right_knee.x - right_hip.x, right_knee.y - right_hip.y] if right_hip else [0, 0]
+            
+            # 用向量的点积估算角度
+            # def dot_product(v1, v2):
+            #     return v1[0]*v2[0] + v1[1]*v2[1]
+            
+            # def vector_magnitude(v):
+            #     return math.sqrt(v[0]**2 + v[1]**2)
+            
+            # def angle_between(v1, v2):
+            #     dot = dot_product(v1, v2)
+            #     mag1 = vector_magnitude(v1)
+            #     mag2 = vector_magnitude(v2)
+            #     if mag1 * mag2 == 0: return 180.0
+            #     cos_angle = dot / (mag1 * mag2)
+            #     cos_angle = max(min(cos_angle, 1.0), -1.0)  # 处理浮点误差
+            #     return math.degrees(math.acos(cos_angle))
+            
+            # 估计膝盖角度 (腿与大腿的夹角)
+            # left_knee_angle = angle_between(left_leg, left_thigh) if left_hip else 180.0
+            # right_knee_angle = angle_between(right_leg, right_thigh) if right_hip else 180.0
+            
+            # if left_knee_angle < 155 or right_knee_angle < 155:  # 膝盖弯曲阈值 (调整)
+            #     knee_pos = ((left_knee.x + right_knee.x)/2, (left_knee.y + right_knee.y)/2)
+            #     current_errors_details.append(("膝盖弯曲", knee_pos, "yellow"))
+
+    # --- 错误缓冲和最终判断 ---
+    final_errors = [] # 存储确认的错误 (error_text, pos, color)
+    new_confirmed_errors = [] # 本帧刚达到持续阈值的错误
+
+    # 计数更新整体向量化：先由本帧候选生成活跃掩码，再一次完成
+    # "活跃 +1 / 非活跃 -1 / 下限 0" 三步，阈值判断也在数组上做完，
+    # 之后的 Python 循环只处理确认/新确认错误的文本与日志
+    active = np.zeros(len(_FORM_ERROR_TEXTS), dtype=bool)
+    for code, _pos, _color in current_errors_details:
+        active[code] = True
+    np.add(error_buffer, 1, out=error_buffer, where=active)
+    np.subtract(error_buffer, 1, out=error_buffer, where=~active)
+    np.maximum(error_buffer, 0, out=error_buffer)
+    confirmed = error_buffer >= ERROR_PERSISTENCE
+    newly_confirmed = error_buffer == ERROR_PERSISTENCE
+
+    for code, pos, color in current_errors_details:
+        if confirmed[code]:
+            error_text = _FORM_ERROR_TEXTS[code]
+            final_errors.append((error_text, pos, color))
+            # 更新错误日志 - 修复：只在第一次达到阈值时计数，避免重复计数
+            if code not in detected_errors_log:
+                detected_errors_log[code] = {"type": error_text, "count": 0, "first_timestamp": current_time_sec}
+            # 只在刚刚达到持续阈值时计数一次，避免重复计数
+            if newly_confirmed[code]:
+                detected_errors_log[code]["count"] += 1
+                new_confirmed_errors.append((error_text, pos, color))
+
+    if final_errors:
+        form_valid = False
+        feedback = "注意: " + ", ".join([e[0] for e in final_errors])
+    else:
+        form_valid = True
+        feedback = "" # 没有稳定错误时，反馈由动作分析函数提供
 
-    except Exception as e:
-        print(f"错误检测异常: {e}")
-        return True, "", [] # 异常时，默认有效，无错误
+    return form_valid, feedback, final_errors, new_confirmed_errors
 
 
 # --- 可选：添加一个简单的测试入口 ---
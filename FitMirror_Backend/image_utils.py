@@ -2,54 +2,116 @@
 图像处理工具模块 - 处理图像渲染和分析功能
 """
 
+import functools
+
 import cv2
 import numpy as np
 from PIL import Image, ImageDraw, ImageFont
 
+# 标注颜色查找表：上游 (fitness_analyzer) 把颜色名一次性换成
+# config.COLOR_INDEX 整数下标后，逐条标注的颜色解析只是按下标取
+# 元组，免去每条标注一次的字符串哈希；字符串键仍走 color_map 兼容
+try:
+    from config import COLOR_MAP as _CONFIG_COLOR_MAP
+except ImportError:
+    _CONFIG_COLOR_MAP = {
+        "red": (0, 0, 255),
+        "yellow": (0, 255, 255),
+        "orange": (0, 165, 255),
+        "purple": (255, 0, 255),
+        "green": (0, 255, 0),
+        "blue": (255, 0, 0),
+    }
+_COLOR_LUT = tuple(_CONFIG_COLOR_MAP.values())
+
 def calculate_angle(a, b, c):
-    """计算三个点形成的角度。
-    
+    """计算三个点形成的角度，支持单点或批量输入。
+
+    批量形式把整段视频的关键点三元组堆成 (N,2) 一次算完，
+    避免逐帧构造小数组的 Python 开销。用点积 + arccos 求夹角，
+    只做一次超越函数调用 (原先是两次 arctan2)，且 arccos 天然
+    落在 [0,180] 区间，不再需要 >180 的折返分支。
+
     Args:
-        a: 第一个点的坐标 [x, y]
-        b: 角度顶点的坐标 [x, y]
-        c: 第三个点的坐标 [x, y]
-    
+        a: 第一个点的坐标 [x, y]，或 (N,2) 的批量坐标
+        b: 角度顶点的坐标，形状同 a
+        c: 第三个点的坐标，形状同 a
+
     Returns:
-        float: 角度值（0-180度）
+        float 或 np.ndarray: 角度值（0-180度），批量输入时逐行返回
     """
-    a = np.array(a)
-    b = np.array(b)
-    c = np.array(c)
+    a = np.asarray(a, dtype=np.float32)
+    b = np.asarray(b, dtype=np.float32)
+    c = np.asarray(c, dtype=np.float32)
 
-    radians = np.arctan2(c[1]-b[1], c[0]-b[0]) - np.arctan2(a[1]-b[1], a[0]-b[0])
-    calculated_angle = np.abs(radians*180.0/np.pi)
+    v1 = a - b
+    v2 = c - b
+    dot = (v1 * v2).sum(-1)
+    mag = np.sqrt((v1 * v1).sum(-1) * (v2 * v2).sum(-1))
+    # 夹角顶点与端点重合时模长为 0，用极小值兜底避免除零
+    cos_angle = np.clip(dot / np.maximum(mag, 1e-12), -1.0, 1.0)
+    calculated_angle = np.degrees(np.arccos(cos_angle))
 
-    if calculated_angle > 180.0:
-        calculated_angle = 360 - calculated_angle
+    return float(calculated_angle) if calculated_angle.ndim == 0 else calculated_angle
 
-    return calculated_angle
+# 字体缓存：ImageFont.truetype 每次都会重新打开并解析 ttf 文件，
+# 而同一帧里计数、按钮、各错误标注要多次写字，按字号缓存一次加载即可
+_FONT_CACHE = {}
 
-def cv2AddChineseText(img, text, position, textColor=(0, 255, 0), textSize=30):
-    """在图片上添加中文文字"""
-    if isinstance(img, np.ndarray):
-        img = Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
-    
-    draw = ImageDraw.Draw(img)
-    try:
-        # 首先尝试使用项目目录中的字体文件
-        fontStyle = ImageFont.truetype("simhei.ttf", textSize, encoding="utf-8")
-    except IOError:
-        # 如果失败，尝试使用系统字体
+def _get_font(textSize):
+    """按字号获取 (并缓存) 中文字体，加载失败时退回默认字体"""
+    font = _FONT_CACHE.get(textSize)
+    if font is None:
         try:
-            fontStyle = ImageFont.truetype("C:/Windows/Fonts/simhei.ttf", textSize, encoding="utf-8")
+            # 首先尝试使用项目目录中的字体文件
+            font = ImageFont.truetype("simhei.ttf", textSize, encoding="utf-8")
         except IOError:
-            # 如果仍然失败，使用默认字体
-            fontStyle = ImageFont.load_default()
-            print("[警告] 无法加载指定字体，使用默认字体")
-    
-    draw.text(position, text, textColor, font=fontStyle)
-    
-    return cv2.cvtColor(np.asarray(img), cv2.COLOR_RGB2BGR)
+            # 如果失败，尝试使用系统字体
+            try:
+                font = ImageFont.truetype("C:/Windows/Fonts/simhei.ttf", textSize, encoding="utf-8")
+            except IOError:
+                # 如果仍然失败，使用默认字体
+                font = ImageFont.load_default()
+                print("[警告] 无法加载指定字体，使用默认字体")
+        _FONT_CACHE[textSize] = font
+    return font
+
+def begin_text_batch(frame, color_space="bgr"):
+    """把帧转成 PIL 画布，供同一帧的多处中文写入共用。
+
+    BGR->RGB->BGR 往返是两次全帧拷贝加颜色空间转换，一帧里写几处
+    文字就该只做一对转换：begin 一次、draw.text 若干次、end 一次。
+    已经处于 RGB 的上游管线 (如 MediaPipe 推理帧) 传
+    color_space="rgb" 可连这一对转换也省掉。
+
+    Returns:
+        (pil_img, draw): 画布与对应的 ImageDraw 对象
+    """
+    if color_space == "rgb":
+        pil_img = Image.fromarray(frame)
+    else:
+        pil_img = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    return pil_img, ImageDraw.Draw(pil_img)
+
+def end_text_batch(pil_img, color_space="bgr"):
+    """把 begin_text_batch 的画布转回 ndarray (默认 BGR，rgb 时原样返回)"""
+    if color_space == "rgb":
+        return np.asarray(pil_img)
+    return cv2.cvtColor(np.asarray(pil_img), cv2.COLOR_RGB2BGR)
+
+def cv2AddChineseText(img, text, position, textColor=(0, 255, 0), textSize=30, color_space="bgr"):
+    """在图片上添加中文文字 (单条写入；同帧多条文字请用 begin/end_text_batch)
+
+    color_space="rgb" 表示传入帧已是 RGB，跳过两次全帧颜色空间转换
+    """
+    if isinstance(img, np.ndarray):
+        img, draw = begin_text_batch(img, color_space)
+    else:
+        draw = ImageDraw.Draw(img)
+
+    draw.text(position, text, textColor, font=_get_font(textSize))
+
+    return end_text_batch(img, color_space)
 
 def draw_error_annotations(image, error_annotations, color_map=None):
     """在图像上绘制错误标注
@@ -70,117 +132,140 @@ def draw_error_annotations(image, error_annotations, color_map=None):
             "purple": (255, 0, 255)
         }
         
+    if not error_annotations:
+        return image
+
     h, w, _ = image.shape
+
+    # 半透明背景：逐框只混合标注框覆盖的 ROI，混合成本 O(框面积)
+    # 而非 O(整帧)，也不再做任何全帧 copy/addWeighted
+    rects = []  # (pos_x, pos_y, bgr_color)
     for error_text, error_pos, error_color in error_annotations:
         pos_x = int(error_pos[0] * w)
         pos_y = int(error_pos[1] * h)
-        
-        # 创建半透明背景
-        overlay = image.copy()
-        # 绘制标注框和文字
-        cv2.rectangle(overlay,
-                    (pos_x - 160, pos_y - 80),
-                    (pos_x + 120, pos_y),
-                    color_map[error_color],
-                    -1)
-        # 设置透明度
-        image = cv2.addWeighted(overlay, 0.4, image, 0.6, 0)
-        # 添加文字
-        image = cv2AddChineseText(image, error_text, (pos_x - 150, pos_y - 70),
-                                (255, 255, 255), 60)
-        
-        # 绘制指向线
+        # 整数颜色下标直接查 LUT，字符串颜色名走 color_map 兼容旧调用
+        color = _COLOR_LUT[error_color] if isinstance(error_color, int) else color_map[error_color]
+        x0, y0 = max(pos_x - 160, 0), max(pos_y - 80, 0)
+        x1, y1 = min(pos_x + 120, w), min(pos_y, h)
+        if x1 > x0 and y1 > y0:
+            roi = image[y0:y1, x0:x1]
+            rect = np.empty_like(roi)
+            rect[:] = color
+            # 设置透明度 (只作用于 ROI)
+            image[y0:y1, x0:x1] = cv2.addWeighted(rect, 0.4, roi, 0.6, 0)
+        rects.append((pos_x, pos_y, color))
+
+    # 添加文字：全部中文一次 BGR->PIL->BGR 往返写完，
+    # 而不是每条标注各做一对全帧颜色空间转换
+    pil_img, draw = begin_text_batch(image)
+    font = _get_font(60)
+    for (error_text, _, _), (pos_x, pos_y, _) in zip(error_annotations, rects):
+        draw.text((pos_x - 150, pos_y - 70), error_text, (255, 255, 255), font=font)
+    image = end_text_batch(pil_img)
+
+    # 绘制指向线
+    for pos_x, pos_y, color in rects:
         cv2.line(image,
                 (pos_x, pos_y),
                 (pos_x, pos_y + 20),
-                color_map[error_color],
+                color,
                 2)
-    
+
     return image
 
-def draw_skeleton_lines(image, landmarks, mp_pose, exercise_type):
+# 骨骼线用到的关键点整数下标 (与 mediapipe PoseLandmark 的 value 一致)，
+# 模块加载时定死，避免每帧重复的枚举属性查找
+_LEFT_SHOULDER, _RIGHT_SHOULDER = 11, 12
+_LEFT_ELBOW, _LEFT_WRIST = 13, 15
+_LEFT_HIP, _RIGHT_HIP = 23, 24
+_LEFT_KNEE = 25
+_LEFT_ANKLE, _RIGHT_ANKLE = 27, 28
+
+_RED = (0, 0, 255)
+_GREEN = (0, 255, 0)
+
+# 每种运动的骨骼线规格：(关键点下标数组, 按颜色分组的折线段)，
+# 每组为 (颜色, (段数,2) 的序号数组)，序号指向前面的下标数组；
+# 同色线段合并成一次 cv2.polylines 调用
+_SKELETON_SPECS = {
+    # 深蹲：髋关节-膝盖-脚踝线
+    "squat": (np.array([_LEFT_HIP, _LEFT_KNEE, _LEFT_ANKLE]),
+              ((_RED, np.array([[1, 0], [1, 2]])),)),
+    # 俯卧撑：肩膀-肘部-手腕线
+    "pushup": (np.array([_LEFT_SHOULDER, _LEFT_ELBOW, _LEFT_WRIST]),
+               ((_RED, np.array([[1, 0], [1, 2]])),)),
+    # 仰卧起坐/卷腹：躯干线 (红) + 腿部参考线 (绿)
+    "situp": (np.array([_LEFT_SHOULDER, _LEFT_HIP, _LEFT_KNEE]),
+              ((_RED, np.array([[1, 0]])),
+               (_GREEN, np.array([[1, 2]])))),
+    # 开合跳：肩部线 (红) + 脚踝线 (绿)
+    "jumping_jack": (np.array([_LEFT_SHOULDER, _RIGHT_SHOULDER, _LEFT_ANKLE, _RIGHT_ANKLE]),
+                     ((_RED, np.array([[0, 1]])),
+                      (_GREEN, np.array([[2, 3]])))),
+}
+_SKELETON_SPECS["crunch"] = _SKELETON_SPECS["situp"]
+
+def draw_skeleton_lines(image, joints, exercise_type):
     """根据运动类型在图像上绘制骨骼线
-    
+
     Args:
         image: 输入图像
-        landmarks: 关键点坐标
-        mp_pose: MediaPipe Pose对象
+        joints: (33, 2+) 的关键点数组，前两列为归一化 x/y
+            (上游姿态结果已转为 SoA 数组，这里直接整片切片取点)
         exercise_type: 运动类型
-        
+
     Returns:
         绘制了骨骼线的图像
     """
+    spec = _SKELETON_SPECS.get(exercise_type)
+    if spec is None:
+        return image
+
+    idx, color_groups = spec
     h, w, _ = image.shape
-    
-    if exercise_type == "squat":
-        # 深蹲：绘制髋关节-膝盖-脚踝线
-        hip = [landmarks[mp_pose.PoseLandmark.LEFT_HIP.value].x,
-               landmarks[mp_pose.PoseLandmark.LEFT_HIP.value].y]
-        knee = [landmarks[mp_pose.PoseLandmark.LEFT_KNEE.value].x,
-                landmarks[mp_pose.PoseLandmark.LEFT_KNEE.value].y]
-        ankle = [landmarks[mp_pose.PoseLandmark.LEFT_ANKLE.value].x,
-                landmarks[mp_pose.PoseLandmark.LEFT_ANKLE.value].y]
-        
-        knee_point = (int(knee[0] * w), int(knee[1] * h))
-        hip_point = (int(hip[0] * w), int(hip[1] * h))
-        ankle_point = (int(ankle[0] * w), int(ankle[1] * h))
-        
-        cv2.line(image, knee_point, hip_point, (0, 0, 255), 3)
-        cv2.line(image, knee_point, ankle_point, (0, 0, 255), 3)
-        
-    elif exercise_type == "pushup":
-        # 俯卧撑：绘制肩膀-肘部-手腕线
-        shoulder = [landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].x,
-                  landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].y]
-        elbow = [landmarks[mp_pose.PoseLandmark.LEFT_ELBOW.value].x,
-                landmarks[mp_pose.PoseLandmark.LEFT_ELBOW.value].y]
-        wrist = [landmarks[mp_pose.PoseLandmark.LEFT_WRIST.value].x,
-                landmarks[mp_pose.PoseLandmark.LEFT_WRIST.value].y]
-        
-        shoulder_point = (int(shoulder[0] * w), int(shoulder[1] * h))
-        elbow_point = (int(elbow[0] * w), int(elbow[1] * h))
-        wrist_point = (int(wrist[0] * w), int(wrist[1] * h))
-        
-        cv2.line(image, elbow_point, shoulder_point, (0, 0, 255), 3)
-        cv2.line(image, elbow_point, wrist_point, (0, 0, 255), 3)
-        
-    elif exercise_type in ["situp", "crunch"]:
-        # 仰卧起坐/卷腹：绘制肩膀-臀部-膝盖线
-        shoulder = [landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].x,
-                  landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].y]
-        hip = [landmarks[mp_pose.PoseLandmark.LEFT_HIP.value].x,
-              landmarks[mp_pose.PoseLandmark.LEFT_HIP.value].y]
-        knee = [landmarks[mp_pose.PoseLandmark.LEFT_KNEE.value].x,
-               landmarks[mp_pose.PoseLandmark.LEFT_KNEE.value].y]
-        
-        shoulder_point = (int(shoulder[0] * w), int(shoulder[1] * h))
-        hip_point = (int(hip[0] * w), int(hip[1] * h))
-        knee_point = (int(knee[0] * w), int(knee[1] * h))
-        
-        cv2.line(image, hip_point, shoulder_point, (0, 0, 255), 3)  # 躯干线
-        cv2.line(image, hip_point, knee_point, (0, 255, 0), 3)  # 腿部参考线
-        
-    elif exercise_type == "jumping_jack":
-        # 开合跳：绘制肩膀线和脚踝线
-        left_shoulder = [landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].x,
-                        landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].y]
-        right_shoulder = [landmarks[mp_pose.PoseLandmark.RIGHT_SHOULDER.value].x,
-                         landmarks[mp_pose.PoseLandmark.RIGHT_SHOULDER.value].y]
-        left_ankle = [landmarks[mp_pose.PoseLandmark.LEFT_ANKLE.value].x,
-                     landmarks[mp_pose.PoseLandmark.LEFT_ANKLE.value].y]
-        right_ankle = [landmarks[mp_pose.PoseLandmark.RIGHT_ANKLE.value].x,
-                      landmarks[mp_pose.PoseLandmark.RIGHT_ANKLE.value].y]
-        
-        left_shoulder_point = (int(left_shoulder[0] * w), int(left_shoulder[1] * h))
-        right_shoulder_point = (int(right_shoulder[0] * w), int(right_shoulder[1] * h))
-        left_ankle_point = (int(left_ankle[0] * w), int(left_ankle[1] * h))
-        right_ankle_point = (int(right_ankle[0] * w), int(right_ankle[1] * h))
-        
-        cv2.line(image, left_shoulder_point, right_shoulder_point, (0, 0, 255), 3)  # 肩部线
-        cv2.line(image, left_ankle_point, right_ankle_point, (0, 255, 0), 3)  # 脚踝线
-    
+    # 一次取出本运动需要的关键点并整体换算到像素坐标
+    pts = (joints[idx, :2] * np.array([w, h], dtype=np.float32)).astype(np.int32)
+    # 同色线段一次 polylines 画完，减少 Python<->OpenCV 的调用往返
+    for color, segs in color_groups:
+        cv2.polylines(image, list(pts[segs]), False, color, 3)
+
     return image
 
+@functools.lru_cache(maxsize=32)
+def _circle_sprite(radius, bgr_color):
+    """按半径预渲染实心圆 sprite 及其布尔掩码。
+
+    计数背景圆的半径只随字号变化，同一半径逐帧重复；把 cv2.circle
+    的整圆填充换成一次性渲染 + 逐帧 ROI 贴图"""
+    size = 2 * radius + 1
+    sprite = np.zeros((size, size, 3), dtype=np.uint8)
+    mask = np.zeros((size, size), dtype=np.uint8)
+    cv2.circle(sprite, (radius, radius), radius, bgr_color, -1)
+    cv2.circle(mask, (radius, radius), radius, 255, -1)
+    return sprite, mask.astype(bool)
+
+def _blit_circle(image, center_x, center_y, radius, bgr_color):
+    """把缓存的圆形 sprite 按掩码贴到 image 上 (就地修改)，越界自动裁剪"""
+    sprite, mask = _circle_sprite(radius, bgr_color)
+    h, w = image.shape[:2]
+    y0, x0 = center_y - radius, center_x - radius
+    y1, x1 = y0 + sprite.shape[0], x0 + sprite.shape[1]
+    sy, sx = max(-y0, 0), max(-x0, 0)
+    roi = image[max(y0, 0):min(y1, h), max(x0, 0):min(x1, w)]
+    sub_sprite = sprite[sy:sy + roi.shape[0], sx:sx + roi.shape[1]]
+    sub_mask = mask[sy:sy + roi.shape[0], sx:sx + roi.shape[1]]
+    np.copyto(roi, sub_sprite, where=sub_mask[..., None])
+
+@functools.lru_cache(maxsize=256)
+def _pil_text_size(text, size):
+    """用实际渲染字体的 getbbox 测量文本像素尺寸 (带缓存)。
+
+    文本最终由 PIL 字体渲染，用 OpenCV Hershey 字体估算尺寸
+    本来就不准；getbbox 便宜且与渲染结果一致，居中不再需要
+    经验偏移量。UI 文本最多随一次计数变化，缓存逐帧命中"""
+    left, top, right, bottom = _get_font(size).getbbox(text)
+    return right - left, bottom - top
+
 def draw_ui_elements(image, counter, angle, feedback, progress=None, hip_pixel_distance=0):
     """在图像上绘制UI元素（仅保留计数和结束按钮）"""
     # 根据臀部像素距离动态计算文本大小
@@ -204,8 +289,11 @@ def draw_ui_elements(image, counter, angle, feedback, progress=None, hip_pixel_d
 
     if hip_pixel_distance > 0:
         dynamic_font_size = int(base_offset + hip_pixel_distance * scaling_factor)
-        # 限制字体大小在合理范围内
+        # 限制字体大小在合理范围内，并量化到最近的 5px 档：臀距逐帧
+        # 微抖时字号保持稳定，字体/文字尺寸/圆形 sprite 等下游缓存
+        # 才能逐帧命中，而不是被连续变化的字号打穿
         font_size = max(min_font_size_limit, min(max_font_size_limit, dynamic_font_size))
+        font_size = 5 * round(font_size / 5)
     else:
         font_size = 30 # 如果无法获取臀部距离，使用默认大小
 
@@ -214,41 +302,44 @@ def draw_ui_elements(image, counter, angle, feedback, progress=None, hip_pixel_d
     center_y = 200 # 圆心Y坐标
     radius = int(font_size * 1.5) # 半径根据字体大小调整
     background_color = (128, 128, 128) # 灰色背景
-    cv2.circle(image, (center_x, center_y), radius, background_color, -1)
+    _blit_circle(image, center_x, center_y, radius, background_color)
 
-    # 显示 COUNTER 文字
+    # COUNTER 文字位置 (按渲染字体实测宽度居中)
     counter_text = "COUNTER"
-    counter_font_size = max(15, int(font_size * 0.7)) # COUNTER文字大小
-    # 计算文本大小以居中 (近似)
-    # 注意：cv2.getTextSize 对于中文字符可能不准确，这里先用一个近似值或假设
-    # 更精确的做法可能需要依赖PIL或其他库，或者预估一个偏移量
-    counter_text_size, _ = cv2.getTextSize(counter_text, cv2.FONT_HERSHEY_SIMPLEX, counter_font_size/30, 2) # 使用OpenCV字体估算大小
-    counter_text_x = center_x - counter_text_size[0] // 2 + 37
-    counter_text_y = center_y - int(radius * 0.5) 
-    image = cv2AddChineseText(image, counter_text, (counter_text_x, counter_text_y), (255, 255, 255), counter_font_size)
-
-    # 显示计数
+    counter_font_size = max(15, 5 * round(font_size * 0.7 / 5)) # COUNTER文字大小 (同样按5px量化)
+    counter_text_w, _ = _pil_text_size(counter_text, counter_font_size)
+    counter_text_x = center_x - counter_text_w // 2
+    counter_text_y = center_y - int(radius * 0.5)
+
+    # 计数数字位置
     count_str = f"{counter}"
     count_font_size = font_size # 计数数字使用动态计算的字体大小
-    count_text_size, _ = cv2.getTextSize(count_str, cv2.FONT_HERSHEY_SIMPLEX, count_font_size/30, 2) # 使用OpenCV字体估算大小
-    count_text_x = center_x - count_text_size[0] // 2 + 5
-    count_text_y = center_y + count_text_size[1] // 2 - 20# 调整Y位置使其在圆心下方
-    image = cv2AddChineseText(image, count_str, (count_text_x, count_text_y), (255, 255, 255), count_font_size)
+    count_text_w, count_text_h = _pil_text_size(count_str, count_font_size)
+    count_text_x = center_x - count_text_w // 2
+    count_text_y = center_y + count_text_h // 2 - 20 # 调整Y位置使其在圆心下方
 
     # 不再显示角度、动作指导、进度等内容
-    # 保留结束按钮
+    # 保留结束按钮 (OpenCV 绘制先做完，再统一写文字)
     h, w, _ = image.shape
     button_width = int(font_size * 3.4)  #120
     button_height = int(font_size * 1) #40
     button_x = 30
     button_y = h - 100
-    overlay = image.copy()
-    cv2.rectangle(overlay, 
-                (button_x, button_y), 
-                (button_x + button_width, button_y + button_height),
-                (0, 0, 200),
-                -1)
-    image = cv2.addWeighted(overlay, 0.7, image, 0.3, 0)
-    image = cv2AddChineseText(image, "结束分析", (button_x + 25, button_y + 12), (255, 255, 255), counter_font_size)
+    # 按钮半透明背景同样只混合按钮 ROI，免去整帧复制 + 整帧混合
+    bx1 = min(button_x + button_width, w)
+    by1 = min(button_y + button_height, h)
+    if bx1 > button_x and by1 > button_y:
+        roi = image[button_y:by1, button_x:bx1]
+        rect = np.empty_like(roi)
+        rect[:] = (0, 0, 200)
+        image[button_y:by1, button_x:bx1] = cv2.addWeighted(rect, 0.7, roi, 0.3, 0)
     button_rect = (button_x, button_y, button_x + button_width, button_y + button_height)
+
+    # 三处文字共用一次 BGR<->RGB 往返 (原先每条文字各一对全帧转换)
+    pil_img, draw = begin_text_batch(image)
+    draw.text((counter_text_x, counter_text_y), counter_text, (255, 255, 255), font=_get_font(counter_font_size))
+    draw.text((count_text_x, count_text_y), count_str, (255, 255, 255), font=_get_font(count_font_size))
+    draw.text((button_x + 25, button_y + 12), "结束分析", (255, 255, 255), font=_get_font(counter_font_size))
+    image = end_text_batch(pil_img)
+
     return image, button_rect
\ No newline at end of file
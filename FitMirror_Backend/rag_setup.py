@@ -7,6 +7,10 @@ RAG Setup Module
 
 import os
 import glob
+import hashlib
+
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Dict, Any, List, Optional, Union
 from dotenv import load_dotenv # 添加导入
 
@@ -34,9 +38,52 @@ from pydantic import BaseModel, Field
 # 默认的知识库目录
 KNOWLEDGE_BASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "knowledge_base")
 
+# HNSW 检索参数：efSearch 越大召回越高、单次查询越慢，
+# 知识库规模增长后可按延迟预算调整
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+
 # 全局变量，存储创建的检索器，避免重复加载
 _retriever = None
 
+# 知识库查询结果缓存：用户反复询问同样的经典问题 ("深蹲原理"、"俯卧撑技巧")，
+# 同一规范化问题直接复用检索结果，省掉一次嵌入 + FAISS 检索。
+# 知识库目录 mtime 变化时整体失效；命中/未命中计数便于调优
+_query_cache: Dict[str, Dict[str, Any]] = {}
+_query_cache_kb_mtime: Optional[float] = None
+_query_cache_stats = {"hits": 0, "misses": 0}
+_QUERY_CACHE_MAX = 512
+
+def _kb_mtime() -> Optional[float]:
+    """知识库目录的修改时间，作为查询缓存的失效键"""
+    try:
+        return os.stat(KNOWLEDGE_BASE_DIR).st_mtime
+    except OSError:
+        return None
+
+# 嵌入模型单例：每次 DashScopeEmbeddings(...) 都会新建底层 HTTP
+# 客户端，大量小嵌入请求时反复 TLS 握手的开销不可忽略；
+# 进程内复用同一个实例即可复用连接池
+_embeddings = None
+
+def _init_embeddings() -> Any:
+    """获取 DashScope 嵌入模型单例 (缺少依赖或 API Key 时抛出异常)"""
+    global _embeddings
+    if _embeddings is not None:
+        return _embeddings
+    if DashScopeEmbeddings is None:
+        raise ImportError("无法导入 DashScopeEmbeddings")
+    api_key = os.environ.get("DASHSCOPE_API_KEY") or os.environ.get("QWEN_API_KEY")
+    if not api_key:
+        print("错误：未找到 DASHSCOPE_API_KEY 或 QWEN_API_KEY 环境变量！")
+        raise ValueError("API Key not found")
+    _embeddings = DashScopeEmbeddings(
+        model="text-embedding-v2",  # 通义千问嵌入模型
+        dashscope_api_key=api_key
+    )
+    return _embeddings
+
 def setup_retriever(knowledge_base_dir: str = KNOWLEDGE_BASE_DIR) -> Any:
     """
     设置文档检索器
@@ -85,35 +132,52 @@ def setup_retriever(knowledge_base_dir: str = KNOWLEDGE_BASE_DIR) -> Any:
         print("--- 结束执行 setup_retriever (无文件) ---") # 添加结束标记
         return None
         
-    # 加载所有文档
-    all_documents = []
-    print("开始加载文档...")
-    
-    # 加载PDF文件
-    for pdf_file in pdf_files:
-        print(f"加载PDF: {os.path.basename(pdf_file)}")
-        loader = PyPDFLoader(pdf_file)
-        try:
-            documents = loader.load()
-            all_documents.extend(documents)
-            print(f"成功加载 {len(documents)} 页")
-        except Exception as e:
-            print(f"加载 {pdf_file} 时出错: {e}")
-            import traceback
-            traceback.print_exc() # 打印详细错误堆栈
-    
-    # 加载Markdown文件
-    for md_file in md_files:
-        print(f"加载Markdown: {os.path.basename(md_file)}")
+    # --- 向量库磁盘缓存 ---
+    # 冷启动时对每个文本块做一次 DashScope 嵌入是纯网络往返，动辄
+    # 数分钟；指纹由源文件路径+mtime+分块参数构成，源文件没变时直接
+    # 从磁盘加载 FAISS 索引，完全跳过加载/分割/嵌入
+    fingerprint_src = "|".join(
+        f"{f}:{os.path.getmtime(f)}" for f in sorted(pdf_files + md_files)
+    ) + "|chunk=500,overlap=100"
+    fingerprint = hashlib.md5(fingerprint_src.encode("utf-8")).hexdigest()
+    cache_dir = os.path.join(knowledge_base_dir, ".cache", fingerprint)
+    if os.path.isdir(cache_dir):
         try:
-            loader = UnstructuredMarkdownLoader(md_file)
-            documents = loader.load()
-            all_documents.extend(documents)
-            print(f"成功加载 {len(documents)} 个文档部分")
+            print(f"发现向量库缓存: {cache_dir}，跳过重新嵌入")
+            embeddings = _init_embeddings()
+            vector_db = FAISS.load_local(cache_dir, embeddings,
+                                         allow_dangerous_deserialization=True)
+            retriever = vector_db.as_retriever(
+                search_type="similarity",
+                search_kwargs={"k": 1}
+            )
+            _retriever = retriever
+            print("--- 结束执行 setup_retriever (缓存加载成功) ---")
+            return retriever
         except Exception as e:
-            print(f"加载 {md_file} 时出错: {e}")
-            import traceback
-            traceback.print_exc() # 打印详细错误堆栈
+            print(f"加载向量库缓存失败，将重新构建: {e}")
+
+    # 加载所有文档：PDF/Markdown 解析主要是 I/O 和释放 GIL 的 C 层
+    # 解析，多个文件用线程池并行加载，而不是逐个串行等待
+    all_documents = []
+    print("开始加载文档...")
+
+    def _load_one(file_path, loader_cls, unit):
+        """加载单个文件，返回 (文件路径, 文档列表, 单位名)"""
+        return file_path, loader_cls(file_path).load(), unit
+
+    with ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 4)) as executor:
+        futures = [executor.submit(_load_one, f, PyPDFLoader, "页") for f in pdf_files]
+        futures += [executor.submit(_load_one, f, UnstructuredMarkdownLoader, "个文档部分") for f in md_files]
+        for future in as_completed(futures):
+            try:
+                file_path, documents, unit = future.result()
+                all_documents.extend(documents)
+                print(f"加载完成: {os.path.basename(file_path)} ({len(documents)} {unit})")
+            except Exception as e:
+                print(f"加载文档时出错: {e}")
+                import traceback
+                traceback.print_exc() # 打印详细错误堆栈
     
     if not all_documents:
         print("未能成功加载任何文档")
@@ -143,27 +207,59 @@ def setup_retriever(knowledge_base_dir: str = KNOWLEDGE_BASE_DIR) -> Any:
     try:
         # 创建嵌入和向量存储
         print("开始创建嵌入和向量存储...")
-        if DashScopeEmbeddings is None:
-            raise ImportError("无法导入 DashScopeEmbeddings")
-            
+
         # 初始化通义千问嵌入模型
         print("初始化 DashScopeEmbeddings...")
-        api_key = os.environ.get("DASHSCOPE_API_KEY") or os.environ.get("QWEN_API_KEY")
-        if not api_key:
-            print("错误：未找到 DASHSCOPE_API_KEY 或 QWEN_API_KEY 环境变量！")
-            raise ValueError("API Key not found")
-        print("API Key 已找到。") # 确认找到Key
-        
-        embeddings = DashScopeEmbeddings(
-            model="text-embedding-v2",  # 通义千问嵌入模型
-            dashscope_api_key=api_key
-        )
+        embeddings = _init_embeddings()
         print("DashScopeEmbeddings 初始化完成。")
         
-        # 构建向量数据库
+        # 构建向量数据库：from_documents 在 DashScope 下近似逐块发
+        # HTTP 请求，整体耗时由网络往返数决定。改为按 DashScope 单批
+        # 上限 25 条分批、用小线程池并发调用 embed_documents (并发度 4
+        # 以内以免触发 QPS 限制)，最后 from_embeddings 一次构建索引
         print(f"开始使用 FAISS 创建向量数据库...")
-        vector_db = FAISS.from_documents(chunks, embeddings)
+        try:
+            texts = [chunk.page_content for chunk in chunks]
+            metadatas = [chunk.metadata for chunk in chunks]
+            batches = [texts[i:i + 25] for i in range(0, len(texts), 25)]
+            batch_vectors = [None] * len(batches)
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                futures = {executor.submit(embeddings.embed_documents, batch): i
+                           for i, batch in enumerate(batches)}
+                for future in as_completed(futures):
+                    batch_vectors[futures[future]] = future.result()
+            vectors = [vec for batch in batch_vectors for vec in batch]
+            vector_db = FAISS.from_embeddings(
+                text_embeddings=list(zip(texts, vectors)),
+                embedding=embeddings,
+                metadatas=metadatas,
+            )
+            # 把默认的 IndexFlatL2 (每次查询 O(N*d) 暴力扫描) 换成
+            # HNSW 近似索引；向量按原顺序重新 add，docstore 映射不变
+            try:
+                import faiss
+                vec_arr = np.asarray(vectors, dtype=np.float32)
+                hnsw_index = faiss.IndexHNSWFlat(vec_arr.shape[1], HNSW_M)
+                hnsw_index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+                hnsw_index.hnsw.efSearch = HNSW_EF_SEARCH
+                hnsw_index.add(vec_arr)
+                vector_db.index = hnsw_index
+                print(f"已启用 HNSW 索引 (M={HNSW_M}, efSearch={HNSW_EF_SEARCH})")
+            except Exception as e:
+                print(f"构建 HNSW 索引失败，保留平坦索引: {e}")
+        except Exception as e:
+            print(f"批量嵌入失败，退回逐块构建: {e}")
+            vector_db = FAISS.from_documents(chunks, embeddings)
         print(f"向量数据库创建完成。")
+
+        # 落盘缓存，下次启动同样的知识库内容直接加载
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            vector_db.save_local(cache_dir)
+            print(f"向量库已缓存到: {cache_dir}")
+        except Exception as e:
+            print(f"保存向量库缓存失败 (不影响本次使用): {e}")
+
         
         # 创建检索器
         print("创建检索器...")
@@ -198,6 +294,23 @@ def query_fitness_knowledge_tool(query: str) -> Dict[str, Any]:
     当用户询问有关健身运动的一般性信息而不是特定视频分析时，使用此工具。
     """
     print(f"--- 开始执行 query_fitness_knowledge_tool (查询: '{query}') ---") # 添加开始标记
+
+    # --- 查询缓存 ---
+    global _query_cache_kb_mtime
+    cache_key = query.strip().lower()
+    kb_mtime = _kb_mtime()
+    if kb_mtime != _query_cache_kb_mtime:
+        if _query_cache:
+            print("知识库已更新，清空查询缓存")
+        _query_cache.clear()
+        _query_cache_kb_mtime = kb_mtime
+    if cache_key in _query_cache:
+        _query_cache_stats["hits"] += 1
+        print(f"查询缓存命中 (hits={_query_cache_stats['hits']}, misses={_query_cache_stats['misses']})")
+        print(f"--- 结束执行 query_fitness_knowledge_tool (缓存命中) ---")
+        return _query_cache[cache_key]
+    _query_cache_stats["misses"] += 1
+
     try:
         # 获取检索器
         print("调用 setup_retriever 获取检索器...")
@@ -238,6 +351,12 @@ def query_fitness_knowledge_tool(query: str) -> Dict[str, Any]:
             "query": query,
             "contexts": contexts
         }
+
+        # 只缓存成功的查询结果，容量满时按插入顺序淘汰最旧条目
+        if len(_query_cache) >= _QUERY_CACHE_MAX:
+            _query_cache.pop(next(iter(_query_cache)))
+        _query_cache[cache_key] = result
+
         print(f"--- 结束执行 query_fitness_knowledge_tool (成功) ---") # 添加结束标记
         return result
         
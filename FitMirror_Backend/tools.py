@@ -5,28 +5,54 @@ FitMirror Tools Module
 """
 
 from langchain.tools import tool
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Literal, Optional
 from pydantic import BaseModel, Field
+from dataclasses import dataclass
 import os
 import json
+import time
 from datetime import datetime
 import logging # Add logging import
 
 # 导入核心分析模块
 from fitness_analyzer import analyze_exercise_video
-import shutil # Import shutil for copying files
 
 # Configure logger for this module
 logger = logging.getLogger(__name__)
 
-# 全局变量，用于存储最近一次的分析结果
-_last_analysis_result: Optional[Dict[str, Any]] = None
+# 最近一次分析结果：冻结 dataclass + 存储时只记 time.time() 的
+# 浮点时间戳，字符串格式化推迟到真正被查询时才做
+@dataclass(frozen=True)
+class _LastResult:
+    data: Dict[str, Any]
+    analyzed_at: float
+
+_last_analysis_result: Optional[_LastResult] = None
+
+# 成功分析结果的缓存：键为 (路径, mtime_ns, 大小, 运动类型)，
+# 文件一旦被替换或修改键就失效；按插入序淘汰最旧条目
+_ANALYSIS_CACHE: Dict[tuple, Dict[str, Any]] = {}
+_ANALYSIS_CACHE_MAX = 32
+
+# 支持的运动类型 (与 config.EXERCISE_NAMES 的键一致)
+VALID_EXERCISE_TYPES = ("squat", "pushup", "situp", "crunch", "jumping_jack")
+
+# 报告目录：与 api_server.py 对外提供文件服务的目录一致，
+# 导入时创建一次，工具体内不再逐次拼路径 + makedirs
+_REPORTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'user_reports')
+os.makedirs(_REPORTS_DIR, exist_ok=True)
+
+# api_server.py 以该前缀对外提供 user_reports 下的文件
+_REPORTS_URL_PREFIX = "/reports/"
 
 # === 健身分析工具的输入模型 ===
 class VideoAnalysisInput(BaseModel):
     """用于视频分析的输入模型"""
     video_path: str = Field(..., description="视频文件的绝对路径")
-    exercise_type: str = Field(..., description="运动类型，支持 'squat'(深蹲), 'pushup'(俯卧撑), 'situp'(仰卧起坐), 'crunch'(卷腹), 'jumping_jack'(开合跳)")
+    # Literal 让非法运动类型在 schema 校验阶段就被拒绝 (底层是一次
+    # 集合查找)，工具体内不再需要逐次的 Python 成员检查
+    exercise_type: Literal["squat", "pushup", "situp", "crunch", "jumping_jack"] = Field(
+        ..., description="运动类型，支持 'squat'(深蹲), 'pushup'(俯卧撑), 'situp'(仰卧起坐), 'crunch'(卷腹), 'jumping_jack'(开合跳)")
 
 @tool("analyze_exercise_video", args_schema=VideoAnalysisInput, return_direct=False)
 def analyze_exercise_video_tool(video_path: str, exercise_type: str) -> Dict[str, Any]:
@@ -42,24 +68,35 @@ def analyze_exercise_video_tool(video_path: str, exercise_type: str) -> Dict[str
     """
     global _last_analysis_result  # 声明使用全局变量
     try:
-        # 检查文件是否存在
-        if not os.path.exists(video_path):
+        # 检查文件是否存在：用一次 os.stat 代替 os.path.exists，
+        # 拿到的元数据 (大小/修改时间) 后续还能复用
+        try:
+            video_stat = os.stat(video_path)
+        except OSError:
             return {
                 "success": False,
                 "message": f"错误：无法找到视频文件，请确认路径是否正确: '{video_path}'"
             }
-        
-        # 验证运动类型
-        valid_exercise_types = ["squat", "pushup", "situp", "crunch", "jumping_jack"]
-        if exercise_type not in valid_exercise_types:
-            return {
-                "success": False,
-                "message": f"错误：不支持的运动类型 '{exercise_type}'。支持的类型有: {', '.join(valid_exercise_types)}"
-            }
-        
-        # 调用核心分析逻辑（显示调试窗口）
-        result = analyze_exercise_video(video_path, exercise_type, debug_show_video=True)
-        
+
+        # 运动类型已由输入 schema 的 Literal 校验，这里无需再检查
+
+        # 命中缓存：同一文件 (路径 + mtime + 大小) 的同类运动分析
+        # 直接复用上次结果，跳过整条逐帧推理流水线
+        cache_key = (video_path, video_stat.st_mtime_ns, video_stat.st_size, exercise_type)
+        cached = _ANALYSIS_CACHE.get(cache_key)
+        if cached is not None:
+            report_path = cached.get("report_path")
+            if report_path is None or os.path.exists(report_path):
+                _last_analysis_result = _LastResult(dict(cached), time.time())
+                return dict(cached)
+            # 报告文件已被清理，该缓存条目不再完整
+            _ANALYSIS_CACHE.pop(cache_key, None)
+
+        # 调用核心分析逻辑（显示调试窗口），报告直接写入最终目录，
+        # 省掉 "Desktop 临时目录写一遍 + shutil.copy 再读写一遍" 的中间盘 I/O
+        result = analyze_exercise_video(video_path, exercise_type, debug_show_video=True,
+                                        report_dir=_REPORTS_DIR)
+
         # 简化结果以更好地显示在对话中
         simplified_result = {
             "success": result.get("success", False),
@@ -67,40 +104,36 @@ def analyze_exercise_video_tool(video_path: str, exercise_type: str) -> Dict[str
             "exercise_type": exercise_type,
             "counter": result.get("counter", 0),
             "errors_detected": result.get("errors_detected", []),
-            # "report_path": result.get("report_path", None) # Keep original report_path from analyzer
         }
 
-        # Handle report path: copy to a publicly accessible reports folder if analysis was successful
-        original_report_path = result.get("report_path")
-        if simplified_result["success"] and original_report_path and os.path.exists(original_report_path):
-            # Define a reports directory relative to this script or a configured one
-            # This path should match what api_server.py expects for serving files.
-            reports_dir = os.path.join(os.path.dirname(__file__), 'user_reports') 
-            os.makedirs(reports_dir, exist_ok=True)
-            report_filename = os.path.basename(original_report_path)
-            new_report_path = os.path.join(reports_dir, report_filename)
-            
-            try:
-                shutil.copy(original_report_path, new_report_path)
-                simplified_result["report_path"] = new_report_path # This is the new, accessible path
-                logger.info(f"Report copied to {new_report_path}")
-            except Exception as e:
-                logger.error(f"Failed to copy report from {original_report_path} to {new_report_path}: {e}")
-                simplified_result["report_path"] = None 
+        # 报告已由分析器直接写入 user_reports：本地路径原样透出，
+        # 同时预先烘好相对 URL，下游无需再从文件系统路径反推
+        report_path = result.get("report_path")
+        if simplified_result["success"] and report_path and os.path.exists(report_path):
+            simplified_result["report_path"] = report_path
+            simplified_result["report_url"] = _REPORTS_URL_PREFIX + os.path.basename(report_path)
+            logger.info(f"Report written to {report_path}")
         else:
             simplified_result["report_path"] = None
+            simplified_result["report_url"] = None
         
-        # 如果分析成功，存储结果
+        # 如果分析成功，存储结果（副本 + 冻结，避免后续修改影响）并写入缓存
         if simplified_result["success"]:
-            _last_analysis_result = simplified_result.copy() # 使用副本以避免后续修改影响
-            _last_analysis_result["analysis_time"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            
+            _last_analysis_result = _LastResult(dict(simplified_result), time.time())
+            if len(_ANALYSIS_CACHE) >= _ANALYSIS_CACHE_MAX:
+                _ANALYSIS_CACHE.pop(next(iter(_ANALYSIS_CACHE)))
+            _ANALYSIS_CACHE[cache_key] = dict(simplified_result)
+
         return simplified_result
-        
-    except Exception as e:
+
+    except Exception:
+        # 完整堆栈走日志 (惰性格式化)；返回给 LLM 的消息保持固定且简短，
+        # 避免把大型异常对象 (如 MediaPipe 首次加载失败) 字符串化后
+        # 整段塞进对话上下文
+        logger.exception("analyze_exercise_video_tool failed for %s", video_path)
         return {
             "success": False,
-            "message": f"分析过程中出现错误: {str(e)}"
+            "message": "分析过程中出现内部错误，详情请查看服务端日志。"
         }
 
 class LastExerciseResultInput(BaseModel):
@@ -116,11 +149,14 @@ def get_last_exercise_result_tool() -> Dict[str, Any]:
     global _last_analysis_result # 声明使用全局变量
     try:
         if _last_analysis_result:
+            analysis_time = datetime.fromtimestamp(
+                _last_analysis_result.analyzed_at).strftime("%Y-%m-%d %H:%M:%S")
             return {
                 "success": True,
                 "message": "已获取最近的分析结果。",
                 "has_result": True,
-                **_last_analysis_result # 解包存储的结果
+                "analysis_time": analysis_time,
+                **_last_analysis_result.data # 解包存储的结果
             }
         else:
             return {
@@ -3,24 +3,43 @@
 """
 import time
 import os
+import re
+import math
 import datetime
 import json
 import base64
+from array import array
+from statistics import fmean
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 from voice_utils import speak_error_async
 import shutil # 新增导入
 
-# 尝试导入绘图库
-try:
-    import matplotlib.pyplot as plt
-    import matplotlib
-    matplotlib.use('Agg')  # 使用非交互式后端
-    import numpy as np
-    from matplotlib.patches import Polygon
-    MATPLOTLIB_AVAILABLE = True
-except ImportError:
-    MATPLOTLIB_AVAILABLE = False
-    print("警告：matplotlib 未安装，无法生成雷达图")
+# 绘图库延迟导入：matplotlib 导入要数百毫秒并构建字体缓存，
+# 只记录数据、不导出报告的进程不该付这笔启动成本
+_plt = None
+_matplotlib_failed = False
+
+def _ensure_matplotlib():
+    """首次需要时导入 matplotlib (Agg 后端)，不可用返回 None"""
+    global _plt, _matplotlib_failed
+    if _plt is None and not _matplotlib_failed:
+        try:
+            import matplotlib
+            matplotlib.use('Agg')  # 使用非交互式后端
+            import matplotlib.pyplot as plt
+            _plt = plt
+        except ImportError:
+            _matplotlib_failed = True
+            print("警告：matplotlib 未安装，无法生成雷达图")
+    return _plt
+
+# 雷达图的静态几何：四个维度的角度 (首元素重复一次闭合) 与
+# 优秀水平参考线，均为常量，无需每次绘制重算
+_RADAR_CATEGORIES = ['标准度', '稳定性', '动作深度', '动作频率']
+_RADAR_ANGLES = [i * 2 * math.pi / len(_RADAR_CATEGORIES) for i in range(len(_RADAR_CATEGORIES))]
+_RADAR_ANGLES.append(_RADAR_ANGLES[0])
+_EXCELLENT_VALUES = [90] * (len(_RADAR_CATEGORIES) + 1)
 
 try:
     from config import ERROR_COOLDOWN, EXERCISE_NAMES
@@ -34,52 +53,180 @@ except ImportError:
         "pushup": "俯卧撑"
     }
 
-# 尝试导入大模型API
-try:
-    from dashscope import Generation
-    from dashscope.api_entities.dashscope_response import Role
-    DASHSCOPE_AVAILABLE = True
-except ImportError:
-    DASHSCOPE_AVAILABLE = False
+# 复用的雷达图画布：Figure 创建与字体扫描是绘制成本的大头，
+# 首次调用时建一次，之后 cla() 清空重画
+_RADAR_FIG = None
+_RADAR_AX = None
+
+# 大模型API同样延迟导入，首次生成 AI 建议时才加载
+_dashscope_api = None
+_dashscope_failed = False
+
+def _ensure_dashscope():
+    """首次需要时导入 dashscope，返回 (Generation, Role) 或 None"""
+    global _dashscope_api, _dashscope_failed
+    if _dashscope_api is None and not _dashscope_failed:
+        try:
+            from dashscope import Generation
+            from dashscope.api_entities.dashscope_response import Role
+            _dashscope_api = (Generation, Role)
+        except ImportError:
+            _dashscope_failed = True
+    return _dashscope_api
+
+# 各运动类型的理想动作频率区间（次/分钟）
+_IDEAL_FREQUENCIES = {
+    "squat": (8, 12),
+    "pushup": (6, 10),
+    "situp": (10, 15),
+    "crunch": (12, 18),
+    "jumping_jack": (20, 30)
+}
+
+# AI 不可用时的兜底建议：内容固定，提升为模块常量避免每次
+# 调用重建列表；各列表只读共享，调用方只做遍历不得原地修改
+_DEFAULT_SUGGESTIONS = {
+    "squat": {
+        "beginner_suggestions": [
+            "从浅蹲开始，逐渐增加下蹲深度",
+            "保持膝盖与脚尖方向一致，避免内扣",
+            "可以背靠墙练习，确保重心稳定",
+            "控制下蹲和起立的速度，注重动作质量"
+        ],
+        "advanced_suggestions": [
+            "尝试负重深蹲，增加训练强度",
+            "练习单腿深蹲，提升平衡能力",
+            "增加深蹲变式：相扑深蹲、跳跃深蹲",
+            "结合其他下肢训练动作，形成训练组合"
+        ],
+        "form_tips": [
+            "保持核心收紧，避免身体前倾",
+            "下蹲时重心放在脚跟，而非脚尖",
+            "呼吸要配合动作：下蹲吸气，起立呼气"
+        ]
+    },
+    "pushup": {
+        "beginner_suggestions": [
+            "可以从膝盖俯卧撑开始练习",
+            "注意保持身体平直，避免塌腰",
+            "控制下降和上升的速度",
+            "逐渐增加训练次数和组数"
+        ],
+        "advanced_suggestions": [
+            "尝试钻石俯卧撑，增强三头肌力量",
+            "增加俯卧撑变式：宽距、窄距俯卧撑",
+            "可以负重训练或单手俯卧撑",
+            "结合其他上肢训练动作"
+        ],
+        "form_tips": [
+            "手掌位置在肩膀正下方",
+            "保持身体一条直线",
+            "手肘贴近身体，不要过度外展"
+        ]
+    }
+    # ...existing default suggestions for other exercises...
+}
+
+_GENERIC_SUGGESTIONS = {
+    "beginner_suggestions": [],
+    "advanced_suggestions": [],
+    "form_tips": []
+}
+
+# 训练概况四个占位数值的单遍替换
+_STAT_VALUE_RE = re.compile(r'<div class="stat-value">(15|5\.2|3|80%)</div>')
+
+# 纯文本 AI 回复的解析：小节关键词与条目符各编译一次，
+# 每行一次正则派发替代多个子串扫描
+_SECTION_KEYWORD_RE = re.compile(r'错误分析|error_analysis|初学者|beginner|进阶|advanced|要点|form_tips', re.I)
+_SECTION_BY_KEYWORD = {
+    '错误分析': 'error_analysis', 'error_analysis': 'error_analysis',
+    '初学者': 'beginner_suggestions', 'beginner': 'beginner_suggestions',
+    '进阶': 'advanced_suggestions', 'advanced': 'advanced_suggestions',
+    '要点': 'form_tips', 'form_tips': 'form_tips'
+}
+_BULLET_RE = re.compile(r'^(?:[-•]|\d+\.)')
+
+# AI 回复里 ```json 围栏块的提取（单遍 DFA 扫描）
+_JSON_FENCE_RE = re.compile(r'```json\s*(\{.*?\})\s*```', re.S)
+
+# 肌群激活图的 Base64 缓存：文件基本不变，按 mtime 失效，
+# 多次导出报告只读盘编码一次
+_MUSCLE_IMG_CACHE = {}
+
+def _get_muscle_img_b64(path):
+    """读取图片并返回 Base64 字符串，结果按 (路径, mtime) 缓存；失败返回 None"""
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    cached = _MUSCLE_IMG_CACHE.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    try:
+        with open(path, "rb") as image_file:
+            encoded = base64.b64encode(image_file.read()).decode()
+    except Exception as e:
+        print(f"DEBUG: Error encoding {path}: {e}")
+        return None
+    _MUSCLE_IMG_CACHE[path] = (mtime, encoded)
+    return encoded
+
 
 class TrainingStats:
-    def __init__(self, exercise_type):
+    def __init__(self, exercise_type, report_dir=None):
         self.exercise_type = exercise_type
-        self.start_time = time.time()
+        self.exercise_name = EXERCISE_NAMES.get(exercise_type, "未知运动")
+        self._ideal_freq = _IDEAL_FREQUENCIES.get(exercise_type, (8, 12))
+        # 相对计时一律用 monotonic：不受系统时间调整影响且取值更便宜
+        self.start_time = time.monotonic()
         self.error_records = []
         self.total_count = 0
         self.error_summary = {}
-        self.last_error_types = set()
+        self._total_error_occurrences = 0  # error_summary 各计数之和的增量维护
+        self.last_error_types = frozenset()
+        self._last_errors_key = ()  # 上一帧原始错误文本元组，用于恒等短路
         self.last_speak_time = 0
         self.error_cooldown = ERROR_COOLDOWN
         self.frame_count = 0
         self.user_name = "健身爱好者"
+        # 质量维度得分缓存：(total_count, frame_count, 错误记录数) 不变时
+        # 复用上次结果，报告渲染中多处取分不再重复遍历打分列表
+        self._qd_cache = None
         
         # 新增：动作质量维度数据
+        # 打分序列用 array('f') 存储：长训练下比 Python float 列表
+        # 省约 6 倍内存，且 fmean 可在 C 层一次扫过连续缓冲求均值
         self.quality_metrics = {
-            "standard_scores": [],     # 标准度得分（每次动作）
-            "stability_scores": [],    # 稳定性得分
-            "depth_scores": [],        # 动作深度得分
-            "frequency_data": []       # 频率数据（时间戳）
+            "standard_scores": array('f'),   # 标准度得分（每次动作）
+            "stability_scores": array('f'),  # 稳定性得分
+            "depth_scores": array('f'),      # 动作深度得分
+            "frequency_data": array('f')     # 频率数据（相对时间戳）
         }
 
-        # 根据运动类型设置报告目录
-        exercise_name = EXERCISE_NAMES.get(self.exercise_type, "未知运动")
-        report_folder = f"{exercise_name}训练报告"
-        self.report_dir = os.path.join(os.path.expanduser("~"), "Desktop", report_folder)
-        if not os.path.exists(self.report_dir):
-            os.makedirs(self.report_dir, exist_ok=True)
+        # 根据运动类型设置报告目录；调用方可直接指定最终目录
+        # (如 API 的 user_reports)，报告只写盘一次、无需事后拷贝
+        if report_dir is not None:
+            self.report_dir = report_dir
+        else:
+            report_folder = f"{self.exercise_name}训练报告"
+            self.report_dir = os.path.join(os.path.expanduser("~"), "Desktop", report_folder)
+        os.makedirs(self.report_dir, exist_ok=True)
 
     def add_record(self, errors):
         """记录错误，在新的错误类型出现时更新统计，并根据冷却时间决定是否语音播报"""
         self.frame_count += 1
-        current_time = time.time()
-        # 修改点：确保 error_text 在加入集合前去除首尾空格
-        current_error_types = {error_text.strip() for error_text, _, _ in errors} if errors else set()
 
-        # print(f"--- Frame {self.frame_count} (Time: {current_time:.2f}) ---")
-        # print(f"  Incoming errors: {current_error_types if current_error_types else 'None'}")
-        # print(f"  Last frame errors: {self.last_error_types if self.last_error_types else 'None'}")
+        # 快路径：错误组合与上一帧完全相同 (视频稳态下绝大多数帧)，
+        # 不重建集合、不做差分，直接返回
+        key = tuple(error_text.strip() for error_text, _, _ in errors) if errors else ()
+        if key == self._last_errors_key:
+            return
+        self._last_errors_key = key
+
+        current_time = time.monotonic()
+        # 确保 error_text 在加入集合前去除首尾空格 (key 已 strip 过)
+        current_error_types = frozenset(key)
 
         newly_appeared_error_types = current_error_types - self.last_error_types
 
@@ -88,6 +235,7 @@ class TrainingStats:
             for error_type in newly_appeared_error_types: # error_type 已经是 .strip() 过的
                 # 更新错误统计
                 self.error_summary[error_type] = self.error_summary.get(error_type, 0) + 1
+                self._total_error_occurrences += 1
                 self.error_records.append({
                     "timestamp": current_time - self.start_time,
                     "error_type": error_type, 
@@ -109,11 +257,25 @@ class TrainingStats:
         # self.last_error_types 现在存储的是去除空格后的错误类型集合
         self.last_error_types = current_error_types
 
+    def extend_records(self, batches):
+        """批量写入多帧的确认错误记录
+
+        与逐帧调用 add_record 等价：新旧错误差分依赖调用顺序，
+        必须按帧顺序处理，批量的收益在于把写入移出逐帧热路径。
+        """
+        for errors in batches:
+            self.add_record(errors)
+
+    def add_rep(self, standard_score=85, stability_score=80, depth_score=75):
+        """记录一次完成的动作及其质量指标 (合并 update_count + add_quality_metrics)"""
+        self.update_count()
+        self.add_quality_metrics(standard_score, stability_score, depth_score)
+
     def update_count(self):
         """更新总动作次数"""
         self.total_count += 1
         # 记录动作完成时间（用于频率计算）
-        self.quality_metrics["frequency_data"].append(time.time() - self.start_time)
+        self.quality_metrics["frequency_data"].append(time.monotonic() - self.start_time)
 
     def add_quality_metrics(self, standard_score=85, stability_score=80, depth_score=75):
         """添加动作质量指标数据"""
@@ -123,13 +285,17 @@ class TrainingStats:
 
     def calculate_quality_dimensions(self):
         """计算四个质量维度的综合得分"""
+        cache_key = (self.total_count, self.frame_count, len(self.error_records))
+        if self._qd_cache is not None and self._qd_cache[0] == cache_key:
+            return self._qd_cache[1]
+
         # 标准度：基于错误率计算
-        error_rate = sum(self.error_summary.values()) / self.total_count * 100 if self.total_count > 0 else 0
+        error_rate = self._total_error_occurrences / self.total_count * 100 if self.total_count > 0 else 0
         standard_score = max(60, 100 - error_rate * 2)  # 错误率越低，标准度越高
         
         # 稳定性：基于动作一致性（模拟计算）
         if self.quality_metrics["stability_scores"]:
-            stability_score = sum(self.quality_metrics["stability_scores"]) / len(self.quality_metrics["stability_scores"])
+            stability_score = fmean(self.quality_metrics["stability_scores"])
         else:
             # 基于错误类型数量计算
             error_types_count = len(self.error_summary)
@@ -137,26 +303,18 @@ class TrainingStats:
         
         # 动作深度：基于运动类型和完成质量
         if self.quality_metrics["depth_scores"]:
-            depth_score = sum(self.quality_metrics["depth_scores"]) / len(self.quality_metrics["depth_scores"])
+            depth_score = fmean(self.quality_metrics["depth_scores"])
         else:
             # 基于总体表现估算
             depth_score = min(90, max(65, standard_score - 5))
         
         # 动作频率：基于训练时长和动作次数
-        training_duration = (time.time() - self.start_time) / 60  # 分钟
+        training_duration = (time.monotonic() - self.start_time) / 60  # 分钟
         if training_duration > 0 and self.total_count > 0:
             frequency_per_min = self.total_count / training_duration
-            
-            # 根据运动类型设置理想频率范围
-            ideal_frequencies = {
-                "squat": (8, 12),      # 每分钟8-12个
-                "pushup": (6, 10),     # 每分钟6-10个
-                "situp": (10, 15),     # 每分钟10-15个
-                "crunch": (12, 18),    # 每分钟12-18个
-                "jumping_jack": (20, 30) # 每分钟20-30个
-            }
-            
-            ideal_min, ideal_max = ideal_frequencies.get(self.exercise_type, (8, 12))
+
+            # 理想频率范围在 __init__ 里按运动类型取好
+            ideal_min, ideal_max = self._ideal_freq
             
             if ideal_min <= frequency_per_min <= ideal_max:
                 frequency_score = 90
@@ -167,51 +325,51 @@ class TrainingStats:
         else:
             frequency_score = 75  # 默认值
         
-        return {
+        scores = {
             "standard": round(standard_score, 1),
             "stability": round(stability_score, 1),
             "depth": round(depth_score, 1),
             "frequency": round(frequency_score, 1)
         }
+        self._qd_cache = (cache_key, scores)
+        return scores
 
     def generate_radar_chart(self, quality_scores):
         """生成雷达图并返回base64编码的图片"""
-        if not MATPLOTLIB_AVAILABLE:
+        plt = _ensure_matplotlib()
+        if plt is None:
             return None
-        
+
         try:
-            # 设置中文字体
-            plt.rcParams['font.sans-serif'] = ['SimHei', 'DejaVu Sans']
-            plt.rcParams['axes.unicode_minus'] = False
-            
-            # 雷达图数据
-            categories = ['标准度', '稳定性', '动作深度', '动作频率']
+            global _RADAR_FIG, _RADAR_AX
+            if _RADAR_FIG is None:
+                # 设置中文字体（一次性全局配置）
+                plt.rcParams['font.sans-serif'] = ['SimHei', 'DejaVu Sans']
+                plt.rcParams['axes.unicode_minus'] = False
+                _RADAR_FIG, _RADAR_AX = plt.subplots(figsize=(6, 6), subplot_kw=dict(projection='polar'))
+                _RADAR_FIG.tight_layout()
+            fig, ax = _RADAR_FIG, _RADAR_AX
+            ax.cla()
+
+            # 雷达图数据（闭合：首元素重复一次）
             values = [
                 quality_scores["standard"],
                 quality_scores["stability"], 
                 quality_scores["depth"],
                 quality_scores["frequency"]
             ]
-            
-            # 闭合雷达图
             values += values[:1]
-            angles = np.linspace(0, 2 * np.pi, len(categories), endpoint=False).tolist()
-            angles += angles[:1]
-            
-            # 创建图形
-            fig, ax = plt.subplots(figsize=(8, 8), subplot_kw=dict(projection='polar'))
-            
+
             # 绘制雷达图
-            ax.plot(angles, values, 'o-', linewidth=2, color='#667eea', label='当前表现')
-            ax.fill(angles, values, alpha=0.25, color='#667eea')
+            ax.plot(_RADAR_ANGLES, values, 'o-', linewidth=2, color='#667eea', label='当前表现')
+            ax.fill(_RADAR_ANGLES, values, alpha=0.25, color='#667eea')
             
             # 绘制参考线（优秀水平）
-            excellent_values = [90] * len(categories) + [90]
-            ax.plot(angles, excellent_values, '--', linewidth=1, color='#28a745', alpha=0.7, label='优秀水平')
+            ax.plot(_RADAR_ANGLES, _EXCELLENT_VALUES, '--', linewidth=1, color='#28a745', alpha=0.7, label='优秀水平')
             
             # 设置标签
-            ax.set_xticks(angles[:-1])
-            ax.set_xticklabels(categories, fontsize=12)
+            ax.set_xticks(_RADAR_ANGLES[:-1])
+            ax.set_xticklabels(_RADAR_CATEGORIES, fontsize=12)
             
             # 设置径向轴
             ax.set_ylim(0, 100)
@@ -223,16 +381,17 @@ class TrainingStats:
             ax.legend(loc='upper right', bbox_to_anchor=(1.1, 1.0)) # 修改了 bbox_to_anchor 的 x 值从 1.3 到 1.1
             
             # 添加标题
-            plt.title(f'{EXERCISE_NAMES.get(self.exercise_type, "运动")}动作质量分析', 
-                     fontsize=16, fontweight='bold', pad=20)
-            
-            # 保存为base64字符串
+            ax.set_title(f'{self.exercise_name}动作质量分析',
+                         fontsize=16, fontweight='bold', pad=20)
+
+            # 保存为base64字符串（画布复用，不 close）。内嵌 600px 图
+            # dpi=100 视觉无差；不用 bbox_inches='tight' 免去为测量边界
+            # 的额外渲染一遍；低压缩级别换更快的 PNG 编码
             buffer = BytesIO()
-            plt.savefig(buffer, format='png', dpi=150, bbox_inches='tight')
-            buffer.seek(0)
-            image_base64 = base64.b64encode(buffer.getvalue()).decode()
-            
-            plt.close()
+            fig.savefig(buffer, format='png', dpi=100,
+                        pil_kwargs={'optimize': False, 'compress_level': 1})
+            image_base64 = base64.b64encode(buffer.getbuffer()).decode()
+
             return image_base64
             
         except Exception as e:
@@ -241,13 +400,15 @@ class TrainingStats:
 
     def _generate_ai_suggestions(self, summary_data):
         """使用大模型生成个性化训练建议"""
-        if not DASHSCOPE_AVAILABLE:
-            return self._get_default_suggestions(summary_data)
-        
         api_key = os.environ.get("DASHSCOPE_API_KEY")
         if not api_key:
             return self._get_default_suggestions(summary_data)
-        
+
+        dashscope_api = _ensure_dashscope()
+        if dashscope_api is None:
+            return self._get_default_suggestions(summary_data)
+        Generation, Role = dashscope_api
+
         try:
             exercise_name = summary_data["exercise_name"]
             error_list = list(self.error_summary.keys())
@@ -292,21 +453,17 @@ class TrainingStats:
                 
                 # 尝试解析JSON格式的回复
                 try:
-                    import json
-                    # 提取JSON部分
-                    if '```json' in ai_response:
-                        json_start = ai_response.find('```json') + 7
-                        json_end = ai_response.find('```', json_start)
-                        json_content = ai_response[json_start:json_end].strip()
-                    elif '{' in ai_response and '}' in ai_response:
-                        json_start = ai_response.find('{')
-                        json_end = ai_response.rfind('}') + 1
-                        json_content = ai_response[json_start:json_end]
+                    # 优先匹配 ```json 围栏；否则从第一个 '{' 起用
+                    # raw_decode 单遍解析，替代多次 find/rfind 全文扫描
+                    m = _JSON_FENCE_RE.search(ai_response)
+                    if m:
+                        suggestions = json.loads(m.group(1))
                     else:
-                        # 如果没有JSON格式，使用默认建议
-                        return self._get_default_suggestions(summary_data)
-                    
-                    suggestions = json.loads(json_content)
+                        json_start = ai_response.find('{')
+                        if json_start == -1:
+                            # 如果没有JSON格式，使用默认建议
+                            return self._get_default_suggestions(summary_data)
+                        suggestions, _ = json.JSONDecoder().raw_decode(ai_response, json_start)
                     return suggestions
                 except (json.JSONDecodeError, KeyError) as e:
                     print(f"解析AI回复失败: {e}")
@@ -333,35 +490,32 @@ class TrainingStats:
             }
             
             current_section = None
+            error_analysis_parts = []
             for line in lines:
                 line = line.strip()
                 if not line:
                     continue
-                    
-                if '错误分析' in line or 'error_analysis' in line.lower():
-                    current_section = 'error_analysis'
-                elif '初学者' in line or 'beginner' in line.lower():
-                    current_section = 'beginner_suggestions'
-                elif '进阶' in line or 'advanced' in line.lower():
-                    current_section = 'advanced_suggestions'
-                elif '要点' in line or 'form_tips' in line.lower():
-                    current_section = 'form_tips'
-                elif line.startswith(('-', '•', '1.', '2.', '3.', '4.')):
+
+                m = _SECTION_KEYWORD_RE.search(line)
+                if m:
+                    current_section = _SECTION_BY_KEYWORD[m.group(0).lower()]
+                elif _BULLET_RE.match(line):
                     if current_section and current_section != 'error_analysis':
                         clean_line = line.lstrip('-•1234567890. ')
                         if clean_line:
                             suggestions[current_section].append(clean_line)
-                elif current_section == 'error_analysis' and not line.startswith(('初学者', '进阶', '要点')):
-                    suggestions['error_analysis'] += line + ' '
-            
-            # 确保每个列表至少有一些内容
-            if not suggestions['beginner_suggestions']:
-                suggestions['beginner_suggestions'] = self._get_default_suggestions(summary_data)['beginner_suggestions']
-            if not suggestions['advanced_suggestions']:
-                suggestions['advanced_suggestions'] = self._get_default_suggestions(summary_data)['advanced_suggestions']
-            if not suggestions['form_tips']:
-                suggestions['form_tips'] = self._get_default_suggestions(summary_data)['form_tips']
-                
+                elif current_section == 'error_analysis':
+                    error_analysis_parts.append(line)
+            suggestions['error_analysis'] = ' '.join(error_analysis_parts)
+
+            # 确保每个列表至少有一些内容（默认建议只取一次）
+            defaults = None
+            for section in ('beginner_suggestions', 'advanced_suggestions', 'form_tips'):
+                if not suggestions[section]:
+                    if defaults is None:
+                        defaults = self._get_default_suggestions(summary_data)
+                    suggestions[section] = defaults[section]
+
             return suggestions
         except Exception as e:
             print(f"解析文本建议失败: {e}")
@@ -369,61 +523,16 @@ class TrainingStats:
 
     def _get_default_suggestions(self, summary_data):
         """获取默认的训练建议（当AI不可用时）"""
-        exercise_type = summary_data["exercise_type"]
-        overall_score = summary_data["overall_score"]
         error_list = list(self.error_summary.keys())
-        
-        # 生成错误分析
+
+        # 生成错误分析（唯一随数据变化的字段，其余取模块常量）
         if error_list:
             error_analysis = f"检测到以下问题：{', '.join(error_list)}。这些是常见的技术错误，通过针对性练习可以改善。"
         else:
             error_analysis = "本次训练未检测到明显错误，动作标准程度良好。继续保持这种标准，并可以考虑增加训练强度。"
-        
-        suggestions = {
-            "error_analysis": error_analysis,
-            "beginner_suggestions": [],
-            "advanced_suggestions": [],
-            "form_tips": []
-        }
-        
-        if exercise_type == "squat":
-            suggestions["beginner_suggestions"] = [
-                "从浅蹲开始，逐渐增加下蹲深度",
-                "保持膝盖与脚尖方向一致，避免内扣",
-                "可以背靠墙练习，确保重心稳定",
-                "控制下蹲和起立的速度，注重动作质量"
-            ]
-            suggestions["advanced_suggestions"] = [
-                "尝试负重深蹲，增加训练强度",
-                "练习单腿深蹲，提升平衡能力",
-                "增加深蹲变式：相扑深蹲、跳跃深蹲",
-                "结合其他下肢训练动作，形成训练组合"
-            ]
-            suggestions["form_tips"] = [
-                "保持核心收紧，避免身体前倾",
-                "下蹲时重心放在脚跟，而非脚尖",
-                "呼吸要配合动作：下蹲吸气，起立呼气"
-            ]
-        elif exercise_type == "pushup":
-            suggestions["beginner_suggestions"] = [
-                "可以从膝盖俯卧撑开始练习",
-                "注意保持身体平直，避免塌腰",
-                "控制下降和上升的速度",
-                "逐渐增加训练次数和组数"
-            ]
-            suggestions["advanced_suggestions"] = [
-                "尝试钻石俯卧撑，增强三头肌力量",
-                "增加俯卧撑变式：宽距、窄距俯卧撑",
-                "可以负重训练或单手俯卧撑",
-                "结合其他上肢训练动作"
-            ]
-            suggestions["form_tips"] = [
-                "手掌位置在肩膀正下方",
-                "保持身体一条直线",
-                "手肘贴近身体，不要过度外展"
-            ]
-        # ...existing default suggestions for other exercises...
-        
+
+        suggestions = dict(_DEFAULT_SUGGESTIONS.get(self.exercise_type, _GENERIC_SUGGESTIONS))
+        suggestions["error_analysis"] = error_analysis
         return suggestions
 
     def export_report(self, filename=None, template_path="squat_analysis_report.html"):
@@ -442,29 +551,23 @@ class TrainingStats:
         full_filename = os.path.join(self.report_dir, filename)
 
         try:
-            # 生成AI建议
-            ai_suggestions = self._generate_ai_suggestions(summary_data)
-            
-            # 计算质量维度得分
-            quality_scores = self.calculate_quality_dimensions()
-            summary_data["quality_scores"] = quality_scores
-            
-            # 生成雷达图
-            radar_chart_base64 = self.generate_radar_chart(quality_scores)
-            
-            # ---- 新增：读取并编码 shendun.jpg 为 Base64 ----
-            muscle_activation_image_base64 = None
-            try:
-                shendun_jpg_path = os.path.join(os.path.dirname(__file__), "picture", "shendun.jpg")
-                if os.path.exists(shendun_jpg_path):
-                    with open(shendun_jpg_path, "rb") as image_file:
-                        muscle_activation_image_base64 = base64.b64encode(image_file.read()).decode()
-                    print(f"DEBUG: Successfully encoded {shendun_jpg_path} to Base64.")
-                else:
-                    print(f"DEBUG: Image file not found at {shendun_jpg_path}")
-            except Exception as e:
-                print(f"DEBUG: Error encoding {shendun_jpg_path}: {e}")
-            # ---- 结束新增代码 ----
+            # AI 建议 (网络 RTT，socket 等待期间释放 GIL) 和肌群图读盘
+            # 丢给线程池，与主线程的雷达图渲染 (CPU 密集的 matplotlib)
+            # 并行；报告耗时从三者之和降到三者最大值
+            shendun_jpg_path = os.path.join(os.path.dirname(__file__), "picture", "shendun.jpg")
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                ai_future = executor.submit(self._generate_ai_suggestions, summary_data)
+                img_future = executor.submit(_get_muscle_img_b64, shendun_jpg_path)
+
+                # 计算质量维度得分并渲染雷达图（matplotlib 留在主线程）
+                quality_scores = self.calculate_quality_dimensions()
+                summary_data["quality_scores"] = quality_scores
+                radar_chart_base64 = self.generate_radar_chart(quality_scores)
+
+                ai_suggestions = ai_future.result()
+                muscle_activation_image_base64 = img_future.result()
+            if muscle_activation_image_base64 is None:
+                print(f"DEBUG: Image file not available at {shendun_jpg_path}")
 
             # 尝试读取HTML模板
             template_full_path = os.path.join(os.path.dirname(__file__), template_path)
@@ -502,19 +605,21 @@ class TrainingStats:
                     f'<div class="radar-chart-container">{radar_img_tag}'
                 )
                 
-                # 替换错误诊断内容
-                error_content = self._generate_error_diagnosis_html(ai_suggestions)
-                html_content = self._replace_section_content(html_content, "关键错误诊断", error_content)
-                
-                # 替换训练建议内容
+                # 三个动态 section 通过模板标记一次 replace 填充，
+                # 不再做 find 标题 + find 容器的多遍全文扫描；
+                # 错误诊断与质量分析共用一次 error_summary 遍历
+                error_content, quality_content = self._build_diagnosis_and_quality(
+                    ai_suggestions, summary_data)
+                html_content = html_content.replace('<!--ERROR_SECTION-->', error_content)
+
                 suggestions_content = self._generate_suggestions_html(ai_suggestions)
-                html_content = self._replace_section_content(html_content, "个性化训练建议", suggestions_content)
-                
-                # 替换动作质量分析
-                quality_content = self._generate_quality_analysis_html(summary_data)
-                html_content = self._replace_section_content(html_content, "动作质量分析", quality_content)
+                html_content = html_content.replace('<!--SUGGESTIONS_SECTION-->', suggestions_content)
+
+                html_content = html_content.replace('<!--QUALITY_SECTION-->', quality_content)
                 
-                with open(full_filename, 'w', encoding='utf-8') as f:
+                # 报告含内嵌 Base64 图片，体积数百 KB~数 MB；放大写缓冲
+                # 让整份内容尽量一次 write 落盘，而非按默认 8 KiB 分片
+                with open(full_filename, 'w', encoding='utf-8', buffering=1024 * 1024) as f:
                     f.write(html_content)
                 
                 print(f"HTML报告已生成: {full_filename}")
@@ -530,137 +635,101 @@ class TrainingStats:
             return self._export_text_report(filename, fallback=True)
 
     def _replace_training_overview(self, html_content, summary_data):
-        """替换训练概况数据"""
-        training_duration = summary_data['training_duration']
-        total_count = summary_data['total_count']
-        error_count = summary_data['error_count']
+        """替换训练概况数据（正则交替单遍替换，替代四次全文 replace）"""
         accuracy = 100 - summary_data['error_rate']
-        
-        # 替换统计数据
-        html_content = html_content.replace('<div class="stat-value">15</div>', f'<div class="stat-value">{total_count}</div>')
-        html_content = html_content.replace('<div class="stat-value">5.2</div>', f'<div class="stat-value">{training_duration}</div>')
-        html_content = html_content.replace('<div class="stat-value">3</div>', f'<div class="stat-value">{error_count}</div>')
-        html_content = html_content.replace('<div class="stat-value">80%</div>', f'<div class="stat-value">{accuracy:.0f}%</div>')
-        
-        return html_content
+        mapping = {
+            '15': str(summary_data['total_count']),
+            '5.2': str(summary_data['training_duration']),
+            '3': str(summary_data['error_count']),
+            '80%': f"{accuracy:.0f}%"
+        }
+        return _STAT_VALUE_RE.sub(
+            lambda m: f'<div class="stat-value">{mapping[m.group(1)]}</div>',
+            html_content)
 
-    def _generate_error_diagnosis_html(self, ai_suggestions):
-        """生成错误诊断的HTML内容"""
-        error_analysis = ai_suggestions.get("error_analysis", "")
-        
+    def _build_diagnosis_and_quality(self, ai_suggestions, summary_data):
+        """一次遍历 error_summary，同时生成错误诊断与动作质量分析两段 HTML"""
         if not self.error_summary:
-            return '''            <div class="list-item normal-pain">✅ 本次训练未检测到明显错误，动作标准！</div>
+            diag = '''            <div class="list-item normal-pain">✅ 本次训练未检测到明显错误，动作标准！</div>
             <div class="list-item normal-pain">✅ 继续保持这种标准，可以考虑增加训练强度</div>'''
-        
-        html = f'            <div class="error-analysis-summary">{error_analysis}</div>\n'
-        
-        for error_type in self.error_summary.keys(): # 修改：只遍历错误类型，不显示次数
-            html += f'            <div class="list-item abnormal-pain">⚠️ {error_type}</div>\n' # 修改：移除 {count}
-        
-        return html
-
-    def _generate_quality_analysis_html(self, summary_data):
-        """生成动作质量分析的HTML内容"""
-        if not self.error_summary:
-            return '''            <div class="list-item normal-pain">✅ 动作标准程度：优秀</div>
+            quality = '''            <div class="list-item normal-pain">✅ 动作标准程度：优秀</div>
             <div class="list-item normal-pain">✅ 运动节奏：良好</div>
             <div class="list-item normal-pain">✅ 技术稳定性：稳定</div>'''
-        
-        html = ""
-        # 根据具体错误类型生成对应的质量分析
-        for error_type in self.error_summary.keys():
+            return diag, quality
+
+        error_analysis = ai_suggestions.get("error_analysis", "")
+        diag_parts = [f'            <div class="error-analysis-summary">{error_analysis}</div>\n']
+        quality_parts = []
+
+        for error_type in self.error_summary.keys(): # 只遍历错误类型，不显示次数
+            diag_parts.append(f'            <div class="list-item abnormal-pain">⚠️ {error_type}</div>\n')
+            # 根据具体错误类型生成对应的质量分析
             if "膝盖" in error_type:
-                html += '            <div class="list-item abnormal-pain">⚠️ 膝关节控制需要改进</div>\n'
+                quality_parts.append('            <div class="list-item abnormal-pain">⚠️ 膝关节控制需要改进</div>\n')
             elif "重心" in error_type:
-                html += '            <div class="list-item abnormal-pain">⚠️ 重心稳定性有待提升</div>\n'
+                quality_parts.append('            <div class="list-item abnormal-pain">⚠️ 重心稳定性有待提升</div>\n')
             elif "肩部" in error_type:
-                html += '            <div class="list-item abnormal-pain">⚠️ 肩部姿态需要调整</div>\n'
+                quality_parts.append('            <div class="list-item abnormal-pain">⚠️ 肩部姿态需要调整</div>\n')
             elif "躯干" in error_type:
-                html += '            <div class="list-item abnormal-pain">⚠️ 躯干稳定性需要加强</div>\n'
-        
+                quality_parts.append('            <div class="list-item abnormal-pain">⚠️ 躯干稳定性需要加强</div>\n')
+
         # 添加一些正面的质量评价
         overall_score = summary_data["overall_score"]
         if overall_score >= 85:
-            html += '            <div class="list-item normal-pain">✅ 整体动作完成度较高</div>\n'
+            quality_parts.append('            <div class="list-item normal-pain">✅ 整体动作完成度较高</div>\n')
         elif overall_score >= 70:
-            html += '            <div class="list-item">⚡ 动作基础良好，有改进空间</div>\n'
-        
-        return html
+            quality_parts.append('            <div class="list-item">⚡ 动作基础良好，有改进空间</div>\n')
+
+        return "".join(diag_parts), "".join(quality_parts)
 
     def _generate_suggestions_html(self, ai_suggestions):
         """生成训练建议的HTML内容"""
-        html = ""
-        
+        parts = []
+
         # 退阶方案（初学者建议）
         beginner_suggestions = ai_suggestions.get("beginner_suggestions", [])
-        html += '        <div class="suggestion-title">【退阶方案】</div>\n'
-        html += '        <div class="list-container">\n'
+        parts.append('        <div class="suggestion-title">【退阶方案】</div>\n')
+        parts.append('        <div class="list-container">\n')
         for suggestion in beginner_suggestions:
-            html += f'            <div class="list-item">📚 {suggestion}</div>\n'
-        html += '        </div>\n\n'
-        
+            parts.append(f'            <div class="list-item">📚 {suggestion}</div>\n')
+        parts.append('        </div>\n\n')
+
         # 进阶方案
         advanced_suggestions = ai_suggestions.get("advanced_suggestions", [])
-        html += '        <div class="suggestion-title">【进阶方案】</div>\n'
-        html += '        <div class="list-container">\n'
+        parts.append('        <div class="suggestion-title">【进阶方案】</div>\n')
+        parts.append('        <div class="list-container">\n')
         for suggestion in advanced_suggestions:
-            html += f'            <div class="list-item">🚀 {suggestion}</div>\n'
-        html += '        </div>\n\n'
-        
+            parts.append(f'            <div class="list-item">🚀 {suggestion}</div>\n')
+        parts.append('        </div>\n\n')
+
         # 关键要点提醒
         form_tips = ai_suggestions.get("form_tips", [])
         if form_tips:
-            html += '        <div class="suggestion-title">【关键要点提醒】</div>\n'
-            html += '        <div class="list-container">\n'
+            parts.append('        <div class="suggestion-title">【关键要点提醒】</div>\n')
+            parts.append('        <div class="list-container">\n')
             for tip in form_tips:
-                html += f'            <div class="list-item">💡 {tip}</div>\n'
-            html += '        </div>\n'
-        
-        return html
-
-    def _replace_section_content(self, html_content, section_title, new_content):
-        """替换HTML中指定section的内容"""
-        # 查找section标题
-        section_start = html_content.find(f'<div class="section-title">{section_title}</div>')
-        if section_start == -1:
-            return html_content
-        
-        # 查找该section的list-container
-        container_start = html_content.find('<div class="list-container">', section_start)
-        if container_start == -1:
-            return html_content
-        
-        container_end = html_content.find('</div>', container_start) + 6
-        
-        # 替换内容
-        before = html_content[:container_start]
-        after = html_content[container_end:]
-        
-        new_section = f'<div class="list-container">\n{new_content}        </div>'
-        
-        return before + new_section + after
+                parts.append(f'            <div class="list-item">💡 {tip}</div>\n')
+            parts.append('        </div>\n')
+
+        return "".join(parts)
 
     # ...existing methods...
     
     def get_summary(self):
         """获取训练摘要数据"""
-        exercise_name = EXERCISE_NAMES.get(self.exercise_type, "未知运动")
-        training_duration = (time.time() - self.start_time) / 60
-        total_error_occurrences = sum(self.error_summary.values())
-        error_rate = total_error_occurrences / self.total_count * 100 if self.total_count > 0 else 0 # 添加 else 0
+        training_duration = (time.monotonic() - self.start_time) / 60
+        error_rate = self._total_error_occurrences / self.total_count * 100 if self.total_count > 0 else 0 # 添加 else 0
 
         capped_error_rate = min(error_rate, 100.0)
-        
+
+        # 四个维度取一次，均值直接对 values 求和
+        quality = self.calculate_quality_dimensions()
+
         return {
-            "exercise_name": exercise_name,
+            "exercise_name": self.exercise_name,
             "training_duration": round(training_duration, 1),
             "total_count": self.total_count,
             "error_count": len(self.error_records),
             "error_rate": round(capped_error_rate, 1),
-            "overall_score": round((
-                self.calculate_quality_dimensions().get("standard", 0) +
-                self.calculate_quality_dimensions().get("stability", 0) +
-                self.calculate_quality_dimensions().get("depth", 0) +
-                self.calculate_quality_dimensions().get("frequency", 0)
-            ) / 4, 1)
+            "overall_score": round(sum(quality.values()) / 4, 1)
         }
\ No newline at end of file
@@ -9,8 +9,12 @@ import base64
 import hashlib
 import hmac
 import threading
+import tempfile
+from io import BytesIO
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import pygame
-from urllib.parse import urlparse, urlencode
+from urllib.parse import urlencode
 import websocket
 
 try:
@@ -21,37 +25,81 @@ except ImportError:
     IFLYTEK_API_KEY = ""
     IFLYTEK_API_SECRET = ""
 
-# 初始化pygame以便播放语音
-pygame.mixer.init()
+# mixer 延迟初始化：打开音频设备可能阻塞数百毫秒 (pipewire/
+# pulse 首次连接)，无声卡的环境干脆会失败——推迟到第一条
+# 提示音真正要播放时再做，导入本模块零开销
+_mixer_lock = threading.Lock()
+_mixer_ready = False
+
+def _ensure_mixer():
+    """首次播放前初始化 pygame.mixer。参数贴合 TTS 音源
+    (16kHz 单声道 MP3)：22050Hz 免去重采样到 44.1kHz 的开销，
+    buffer=2048 约 46ms 延迟，短提示音起播快且不会欠载爆音"""
+    global _mixer_ready
+    with _mixer_lock:
+        if not _mixer_ready:
+            pygame.mixer.init(frequency=22050, size=-16, channels=1, buffer=2048)
+            _mixer_ready = True
+
+# TTS 端点与凭证有效性均为运行期常量，提升到模块级；
+# 鉴权串中只有签名逐次变化，其余部分预格式化好
+_TTS_WSS_URL = 'wss://tts-api.xfyun.cn/v2/tts'
+_TTS_HOST = 'tts-api.xfyun.cn'
+_TTS_PATH = '/v2/tts'
+_TTS_CREDS_OK = bool(IFLYTEK_APP_ID and IFLYTEK_API_KEY and IFLYTEK_API_SECRET)
+_AUTH_ORIGIN_FMT = (f'api_key="{IFLYTEK_API_KEY}", algorithm="hmac-sha256", '
+                    'headers="host date request-line", signature="{}"')
+
+# HMAC 的密钥侧状态 (ipad/opad 两块 SHA-256 初始状态) 只依赖
+# API Secret，构造一次之后每次签名 copy() 克隆中间态即可
+_HMAC_TEMPLATE = (hmac.new(IFLYTEK_API_SECRET.encode('utf-8'), digestmod=hashlib.sha256)
+                  if IFLYTEK_API_SECRET else None)
+
+# 签名URL缓存：签名只依赖 RFC1123 日期，讯飞允许约 5 分钟的时钟
+# 偏差，同一窗口内的提示音直接复用已签好的 URL，省去每次的
+# HMAC-SHA256 与两次 Base64
+_url_cache_lock = threading.Lock()
+_cached_url = None
+_cached_url_at = 0.0
+_URL_CACHE_TTL = 240  # 秒，留出服务端 300 秒容差的余量
 
 def create_url():
     """
-    生成科大讯飞语音合成WebSocket请求URL
+    生成科大讯飞语音合成WebSocket请求URL（带签名窗口内缓存）
     """
-    if not IFLYTEK_APP_ID or not IFLYTEK_API_KEY or not IFLYTEK_API_SECRET:
+    global _cached_url, _cached_url_at
+
+    if not _TTS_CREDS_OK:
         print("警告: 未设置科大讯飞API凭证，语音功能将不可用")
         return None
-        
-    url = 'wss://tts-api.xfyun.cn/v2/tts'
-    host = urlparse(url).netloc
-    path = urlparse(url).path
-    
+
+    with _url_cache_lock:
+        if _cached_url is not None and time.monotonic() - _cached_url_at < _URL_CACHE_TTL:
+            return _cached_url
+        url = _build_signed_url()
+        _cached_url = url
+        _cached_url_at = time.monotonic()
+        return url
+
+def _build_signed_url():
+    """按当前时间重新计算鉴权签名并拼出完整 URL"""
+    host = _TTS_HOST
+    path = _TTS_PATH
+
     # 生成RFC1123格式的时间戳
     now = time.strftime('%a, %d %b %Y %H:%M:%S %Z', time.localtime())
     now = now.replace('GMT', 'GMT+0800')
     
-    # 拼接字符串
-    signature_origin = 'host: ' + host + '\n'
-    signature_origin += 'date: ' + now + '\n'
-    signature_origin += 'GET ' + path + ' HTTP/1.1'
-    
-    # 进行hmac-sha256加密
-    signature_sha = hmac.new(IFLYTEK_API_SECRET.encode('utf-8'), 
-                           signature_origin.encode('utf-8'),
-                           digestmod=hashlib.sha256).digest()
+    # 待签名串一次 f-string 拼出，单次 encode
+    signature_origin = f'host: {host}\ndate: {now}\nGET {path} HTTP/1.1'
+
+    # hmac-sha256：克隆预置密钥状态，免去每次的 ipad/opad 初始化
+    mac = _HMAC_TEMPLATE.copy()
+    mac.update(signature_origin.encode('utf-8'))
+    signature_sha = mac.digest()
     
     signature_sha_base64 = base64.b64encode(signature_sha).decode()
-    authorization_origin = f'api_key="{IFLYTEK_API_KEY}", algorithm="hmac-sha256", headers="host date request-line", signature="{signature_sha_base64}"'
+    authorization_origin = _AUTH_ORIGIN_FMT.format(signature_sha_base64)
     authorization = base64.b64encode(authorization_origin.encode('utf-8')).decode()
     
     # 将请求的鉴权参数组合为字典
@@ -61,8 +109,92 @@ def create_url():
         "host": host
     }
     # 拼接鉴权参数，生成url
-    url = url + '?' + urlencode(v)
-    return url
+    return _TTS_WSS_URL + '?' + urlencode(v)
+
+# 请求骨架中除文本外全是常量：common/business 两段共享复用，
+# 每次请求只新建最内层的 data 小字典 (线程池并发下不可原地改模板)
+_TTS_COMMON_ARGS = {"app_id": IFLYTEK_APP_ID}
+_TTS_BUSINESS_ARGS = {
+    "aue": "lame",  # 音频编码，lame表示mp3格式
+    "auf": "audio/L16;rate=16000",  # 音频采样率
+    "vcn": "aisjiuxu",  # 男声，明显区别于女声xiaoyan
+    "tte": "utf8",  # 文本编码
+    "speed": 38,  # 语速恢复正常，取值范围：[0,100]
+    "volume": 100,  # 增大音量，取值范围：[0,100]
+    "pitch": 50,  # 音调，取值范围：[0,100]
+}
+
+# 合成结果缓存：错误提示是一小组固定短语，按文本哈希缓存 MP3
+# 字节，命中时零网络开销直接播放。内存 LRU 之外落一份磁盘副本，
+# 跨进程重启依然有效；首次使用时清理 7 天前的旧文件
+_TTS_CACHE_DIR = os.path.join(tempfile.gettempdir(), "fitmirror_tts_cache")
+_MEM_CACHE_MAX = 32
+_mem_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_cache_dir_ready = False
+
+def _tts_cache_path(key):
+    return os.path.join(_TTS_CACHE_DIR, f"{key}.mp3")
+
+def _ensure_cache_dir():
+    global _cache_dir_ready
+    if _cache_dir_ready:
+        return
+    os.makedirs(_TTS_CACHE_DIR, exist_ok=True)
+    # 清理过期缓存文件
+    cutoff = time.time() - 7 * 24 * 3600
+    try:
+        for name in os.listdir(_TTS_CACHE_DIR):
+            full = os.path.join(_TTS_CACHE_DIR, name)
+            if os.path.getmtime(full) < cutoff:
+                os.remove(full)
+    except OSError:
+        pass
+    _cache_dir_ready = True
+
+def _tts_cache_get(text):
+    """按文本哈希取缓存的 MP3 字节，未命中返回 None"""
+    key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    with _cache_lock:
+        data = _mem_cache.get(key)
+        if data is not None:
+            _mem_cache.move_to_end(key)
+            return data
+    try:
+        _ensure_cache_dir()
+        with open(_tts_cache_path(key), "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    with _cache_lock:
+        _mem_cache[key] = data
+    return data
+
+def _tts_cache_put(text, data):
+    key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    with _cache_lock:
+        _mem_cache[key] = data
+        while len(_mem_cache) > _MEM_CACHE_MAX:
+            _mem_cache.popitem(last=False)
+    try:
+        _ensure_cache_dir()
+        with open(_tts_cache_path(key), "wb") as f:
+            f.write(data)
+    except OSError:
+        pass
+
+# TTS 工作线程池：固定两个线程复用，替代每条提示新建线程；
+# _pending_texts 记录排队中的文本，相同提示在播完前不重复入队
+_TTS_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="tts")
+_pending_lock = threading.Lock()
+_pending_texts = set()
+
+# 限流：正在播放期间以及距上条提示 1.5 秒内的新提示直接丢弃，
+# 姿态检测逐帧触发时不至于积压一串过期的提示音
+_speaking = threading.Event()
+_prompt_lock = threading.Lock()
+_last_prompt_ts = float("-inf")
+_MIN_PROMPT_INTERVAL = 1.5  # 秒
 
 def speak_error_async(text):
     """
@@ -70,8 +202,28 @@ def speak_error_async(text):
     Args:
         text: 要合成语音的文本内容
     """
-    # 新开线程处理语音请求，避免阻塞主线程
-    threading.Thread(target=lambda: process_tts(text), daemon=True).start()
+    global _last_prompt_ts
+    # 限流：上一条还在播、或间隔太近，提示等播出来事件早已过时
+    with _prompt_lock:
+        if _speaking.is_set() or time.monotonic() - _last_prompt_ts < _MIN_PROMPT_INTERVAL:
+            return
+        _last_prompt_ts = time.monotonic()
+
+    # 提交到固定线程池处理语音请求，避免阻塞主线程；
+    # 同一文本已在队列中时直接丢弃，防止相同提示连播多遍
+    with _pending_lock:
+        if text in _pending_texts:
+            return
+        _pending_texts.add(text)
+
+    def _run():
+        try:
+            process_tts(text)
+        finally:
+            with _pending_lock:
+                _pending_texts.discard(text)
+
+    _TTS_EXECUTOR.submit(_run)
 
 def process_tts(text):
     """
@@ -82,38 +234,27 @@ def process_tts(text):
     try:
         print(f"[语音提示]: 准备播报: {text}")
         
-        if not IFLYTEK_APP_ID or not IFLYTEK_API_KEY or not IFLYTEK_API_SECRET:
+        # 先查缓存：同一短语此前合成过则直接播放，零网络往返
+        audio_data = _tts_cache_get(text)
+        if audio_data is not None:
+            _play_audio(audio_data)
+            return
+
+        if not _TTS_CREDS_OK:
             print("[语音提示]: 未配置科大讯飞API凭证，无法播放语音")
             return
             
         url = create_url()
         if not url:
             return
-            
-        # 创建临时音频文件路径
-        temp_dir = os.path.join(os.path.expanduser("~"), "AppData", "Local", "Temp", "fitmirror_tts")
-        if not os.path.exists(temp_dir):
-            os.makedirs(temp_dir)
-        output_file = os.path.join(temp_dir, f"tts_{int(time.time())}.mp3")
-            
-        # 构建请求参数
-        common_args = {
-            "app_id": IFLYTEK_APP_ID
-        }
-        business_args = {
-            "aue": "lame",  # 音频编码，lame表示mp3格式
-            "auf": "audio/L16;rate=16000",  # 音频采样率
-            "vcn": "aisjiuxu",  # 男声，明显区别于女声xiaoyan
-            "tte": "utf8",  # 文本编码
-            "speed": 38,  # 语速恢复正常，取值范围：[0,100]
-            "volume": 100,  # 增大音量，取值范围：[0,100]
-            "pitch": 50,  # 音调，取值范围：[0,100]
-        }
+
+        # 构建请求参数：复用常量骨架，只有文本字段逐次生成
+        # (Base64 输出纯 ASCII，走 ascii 解码快径)
         data = {
-            "common": common_args,
-            "business": business_args,
+            "common": _TTS_COMMON_ARGS,
+            "business": _TTS_BUSINESS_ARGS,
             "data": {
-                "text": base64.b64encode(text.encode("utf-8")).decode("utf-8"),
+                "text": base64.b64encode(text.encode("utf-8")).decode("ascii"),
                 "status": 2  # 2表示完整的音频
             }
         }
@@ -122,15 +263,16 @@ def process_tts(text):
         ws = websocket.create_connection(url)
         ws.send(json.dumps(data))
         
-        # 接收音频数据
-        audio_data = b""
+        # 接收音频数据：分块收集、最后一次 join——bytes += 每帧都
+        # 整体重拷贝，长语音下是 O(N^2)
+        chunks = []
         while True:
             response = ws.recv()
             response = json.loads(response)
             
             # 提取音频数据
             if response["code"] == 0:
-                audio_data += base64.b64decode(response["data"]["audio"])
+                chunks.append(base64.b64decode(response["data"]["audio"]))
                 
                 # 判断是否是最后一帧
                 if response["data"]["status"] == 2:
@@ -141,27 +283,29 @@ def process_tts(text):
                 return
                 
         ws.close()
-        
-        # 保存音频文件
-        with open(output_file, "wb") as f:
-            f.write(audio_data)
-            
-        # 播放音频
-        print(f"[语音提示]: 播放语音...")
-        pygame.mixer.music.load(output_file)
-        pygame.mixer.music.play()
-        
-        # 等待播放完成
-        while pygame.mixer.music.get_busy():
-            time.sleep(0.1)
-            
-        print(f"[语音提示]: 播放完成")
-        
-        # 删除临时音频文件
-        try:
-            os.remove(output_file)
-        except:
-            pass
-            
+        audio_data = b"".join(chunks)
+
+        _tts_cache_put(text, audio_data)
+        _play_audio(audio_data)
+
     except Exception as e:
-        print(f"[语音提示]: 错误: {e}")
\ No newline at end of file
+        print(f"[语音提示]: 错误: {e}")
+
+def _play_audio(audio_data):
+    """从内存缓冲播放 MP3 并等待结束"""
+    # 直接从内存缓冲播放，不再经过临时文件的写盘/读盘/删除。
+    # Sound 对象可提前拿到音频时长：按时长一次睡到尾，替代
+    # 每 100ms 唤醒一次的 get_busy 轮询，只在尾部留极短的校准轮询
+    print(f"[语音提示]: 播放语音...")
+    _ensure_mixer()
+    sound = pygame.mixer.Sound(BytesIO(audio_data))
+    _speaking.set()
+    try:
+        channel = sound.play()
+        time.sleep(sound.get_length())
+        while channel is not None and channel.get_busy():
+            time.sleep(0.02)
+    finally:
+        _speaking.clear()
+
+    print(f"[语音提示]: 播放完成")
\ No newline at end of file